@@ -0,0 +1,86 @@
+"""
+Benchmark the read-ahead stage of create_zip_backup on a small-file tree.
+
+Builds a tree of --files files of --size bytes and archives it with read-ahead
+disabled (files opened and read one at a time) and with --workers read-ahead
+threads. The second pass simulates a high-latency filesystem (NFS) by adding
+--latency-ms before every file read, which is where overlapping reads with
+compression pays off most.
+
+Usage:
+    python benchmarks/bench_readahead.py --files 20000 --size 4096
+    python benchmarks/bench_readahead.py --files 5000 --latency-ms 5
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from autobackup import readahead
+from autobackup.backup_engine import create_zip_backup
+from autobackup.config import settings
+
+
+def build_tree(root: Path, files: int, size: int) -> None:
+    per_dir = 1000
+    for i in range(files):
+        folder = root / f"d{i // per_dir:04d}"
+        folder.mkdir(exist_ok=True)
+        # Half random, half compressible, like typical source trees.
+        payload = os.urandom(size // 2) + b"a" * (size - size // 2)
+        (folder / f"f{i:07d}.txt").write_bytes(payload)
+
+
+def time_backup(src: Path, dest: Path, workers: int) -> float:
+    settings.readahead_workers = workers
+    output = dest / f"bench_{workers}.zip"
+    t0 = time.perf_counter()
+    ok, message = create_zip_backup(str(src), str(dest), output)
+    elapsed = time.perf_counter() - t0
+    assert ok, message
+    output.unlink()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--size", type=int, default=4096)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "src"
+        dest = Path(tmp) / "dest"
+        src.mkdir()
+        dest.mkdir()
+        build_tree(src, args.files, args.size)
+
+        real_read = readahead._read_small
+
+        def slow_read(path: Path, size_hint: int) -> readahead.SourceFile:
+            time.sleep(args.latency_ms / 1000)
+            return real_read(path, size_hint)
+
+        print(f"{args.files} files of {args.size} bytes")
+        print(
+            f"{'filesystem':>22} {'inline (s)':>11} {'read-ahead (s)':>15} "
+            f"{'speedup':>8}"
+        )
+        for label, reader in (
+            ("local", real_read),
+            (f"+{args.latency_ms:g} ms per file", slow_read),
+        ):
+            readahead._read_small = reader
+            inline = time_backup(src, dest, 0)
+            ahead = time_backup(src, dest, args.workers)
+            print(f"{label:>22} {inline:>11.2f} {ahead:>15.2f} {inline / ahead:>7.1f}x")
+        readahead._read_small = real_read
+
+
+if __name__ == "__main__":
+    main()
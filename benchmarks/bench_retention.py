@@ -0,0 +1,136 @@
+"""
+Benchmark retention cost as the backup_runs history grows.
+
+Fills backup_runs with up to --rows runs spread over --jobs other jobs
+(mostly successes, some errors) and times the steady-state retention pass
+of one job: record a new successful run, then plan and delete the run that
+just fell out of the retention window (as one batch of the background
+sweeper does). With the (job_id, status, start_time) index the time per pass
+should stay flat as the table grows.
+
+Usage:
+    python benchmarks/bench_retention.py --url sqlite:///bench.db --rows 1000000
+    python benchmarks/bench_retention.py --url postgresql+psycopg2://...
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.orm import sessionmaker
+
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import Base
+from autobackup.models import BackupJob, BackupRun
+from autobackup.retention import delete_runs, plan_expired_runs, plan_stale_runs
+
+BATCH = 20_000
+
+
+def fill(session, jobs: int, start_row: int, end_row: int, base: datetime) -> None:
+    """Insert history for jobs 2..jobs+1 (job 1 is the one being measured)."""
+    rows = []
+    for i in range(start_row, end_row):
+        status = "error" if random.random() < 0.05 else "success"
+        rows.append(
+            {
+                "job_id": (i % jobs) + 2,
+                "status": status,
+                "start_time": base + timedelta(minutes=i),
+                "end_time": base + timedelta(minutes=i, seconds=30),
+                "message": "benchmark run",
+                "output_file": f"/nonexistent/job_{(i % jobs) + 2}_{i}.zip",
+            }
+        )
+        if len(rows) >= BATCH:
+            session.execute(insert(BackupRun), rows)
+            rows = []
+    if rows:
+        session.execute(insert(BackupRun), rows)
+    session.commit()
+
+
+def time_retention(session, job_id: int, repeat: int) -> float:
+    """Best time of one "new run + retention" pass; each pass deletes one run."""
+    best = float("inf")
+    for _ in range(repeat):
+        session.execute(
+            insert(BackupRun),
+            [{"job_id": job_id, "status": "success", "start_time": db_now()}],
+        )
+        session.commit()
+
+        t0 = time.perf_counter()
+        planned = plan_expired_runs(session, [job_id])
+        planned += plan_stale_runs(session, [job_id])
+        paths = delete_runs(session, [row.id for row in planned])
+        session.commit()
+        best = min(best, time.perf_counter() - t0)
+        assert len(paths) <= 1
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="sqlite:///bench_retention.db")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--keep", type=int, default=20)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    settings.max_backups_per_job = args.keep
+
+    engine = create_engine(args.url, future=True)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, future=True)
+
+    base = datetime(2000, 1, 1)
+    with Session() as session:
+        session.execute(
+            insert(BackupJob),
+            [
+                {
+                    "name": f"job {i}",
+                    "source_path": "/src",
+                    "destination_path": "/dst",
+                }
+                for i in range(1, args.jobs + 2)
+            ],
+        )
+        # Job 1 starts with exactly --keep successful runs.
+        session.execute(
+            insert(BackupRun),
+            [
+                {
+                    "job_id": 1,
+                    "status": "success",
+                    "start_time": db_now() - timedelta(hours=args.keep - i),
+                    "output_file": f"/nonexistent/job_1_{i}.zip",
+                }
+                for i in range(args.keep)
+            ],
+        )
+        session.commit()
+
+        print(f"{'history rows':>14} {'job 1 rows':>10} {'retention (ms)':>15}")
+        done = 0
+        for step in range(1, args.steps + 1):
+            target = args.rows * step // args.steps
+            fill(session, args.jobs, done, target, base)
+            done = target
+
+            job_rows = session.scalar(
+                select(func.count()).where(BackupRun.job_id == 1)
+            )
+            ms = time_retention(session, 1, args.repeat) * 1000
+            print(f"{done:>14} {job_rows:>10} {ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import re
+import threading
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from autobackup.baselines import JobBaseline, load_baselines
+from autobackup.clock import as_aware
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob, BackupRun
+from autobackup.progress import format_progress
+from autobackup.recycle import recycled_percent
+from autobackup.run_queue import PRIORITIES, QueueFull, RunQueue
+
+logger = logging.getLogger(__name__)
+
+# Largest request body read, in bytes.
+MAX_BODY_BYTES = 64 * 1024
+
+CONTENT_LENGTH = re.compile(r"^[0-9]+$")
+JOB_RUNS_PATH = re.compile(r"^/jobs/(\d+)/runs$")
+RUN_PATH = re.compile(r"^/runs/(\d+)$")
+RUN_CANCEL_PATH = re.compile(r"^/runs/(\d+)/cancel$")
+
+
+class ApiError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _time(value: Optional[datetime]) -> Optional[str]:
+    """A stored timestamp in ISO 8601, with its UTC offset."""
+    return as_aware(value).isoformat() if value is not None else None
+
+
+def _job_json(job: Any) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "name": job.name,
+        "source_type": job.source_type or "path",
+        "source_path": job.source_path,
+        "destination_path": job.destination_path,
+        "schedule_type": job.schedule_type,
+        "interval_minutes": job.interval_minutes,
+        "active": job.active,
+    }
+
+
+def _run_json(run: BackupRun, queue: RunQueue) -> Dict[str, Any]:
+    return {
+        "id": run.id,
+        "job_id": run.job_id,
+        "status": run.status,
+        "queue_position": queue.position(run.id) if run.status == "queued" else None,
+        "start_time": _time(run.start_time),
+        "end_time": _time(run.end_time),
+        "message": run.message,
+        "output_file": run.output_file,
+        "size_bytes": run.size_bytes,
+        "recycled_percent": recycled_percent(
+            run.recycled_bytes, run.progress_bytes_total
+        ),
+        "perf_regression": run.perf_regression,
+        "progress": {
+            "current_file": run.progress_current_file,
+            "files_done": run.progress_files_done,
+            "files_total": run.progress_files_total,
+            "bytes_done": run.progress_bytes_done,
+            "bytes_total": run.progress_bytes_total,
+            "updated_at": _time(run.progress_updated_at),
+            "summary": format_progress(
+                run.progress_files_done,
+                run.progress_files_total,
+                run.progress_bytes_done,
+                run.progress_bytes_total,
+            ),
+        },
+    }
+
+
+def _job_labels(baseline: JobBaseline) -> str:
+    name = (
+        baseline.job_name.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+    return f'{{job_id="{baseline.job_id}",job="{name}"}}'
+
+
+# Per-job gauges of /metrics: (metric, help, JobBaseline attribute).
+BASELINE_METRICS = (
+    (
+        "autobackup_job_duration_p50_seconds",
+        "Median duration of the recent successful runs of a job.",
+        "duration_p50",
+    ),
+    (
+        "autobackup_job_duration_p95_seconds",
+        "95th percentile duration of the recent successful runs of a job.",
+        "duration_p95",
+    ),
+    (
+        "autobackup_job_throughput_p50_bytes_per_second",
+        "Median source throughput of the recent successful runs of a job.",
+        "throughput_p50",
+    ),
+    (
+        "autobackup_job_archive_p50_bytes",
+        "Median archive size of the recent successful runs of a job.",
+        "bytes_p50",
+    ),
+    (
+        "autobackup_job_baseline_runs",
+        "Successful runs in the performance baseline of a job.",
+        "sample_count",
+    ),
+    (
+        "autobackup_job_regressions_total",
+        "Runs of a job flagged as duration regressions against its baseline.",
+        "regression_count",
+    ),
+)
+
+
+def _metrics(db: Session, queue: RunQueue) -> str:
+    """Job baselines and run queue in the Prometheus text format."""
+    baselines = load_baselines(db)
+    lines: List[str] = []
+    for metric, help_text, attr in BASELINE_METRICS:
+        kind = "counter" if metric.endswith("_total") else "gauge"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        for baseline in baselines:
+            value = getattr(baseline, attr)
+            if value is not None:
+                lines.append(f"{metric}{_job_labels(baseline)} {value!r}")
+
+    snapshot = queue.snapshot()
+    for metric, help_text, count in (
+        (
+            "autobackup_runs_running",
+            "Runs holding a slot.",
+            len(snapshot["running"]),
+        ),
+        (
+            "autobackup_runs_waiting",
+            "Runs waiting for a slot.",
+            len(snapshot["waiting"]),
+        ),
+    ):
+        lines += [
+            f"# HELP {metric} {help_text}",
+            f"# TYPE {metric} gauge",
+            f"{metric} {count}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """One request; the server holds the RunQueue and the token."""
+
+    server: "ApiServer"
+    protocol_version = "HTTP/1.1"
+    _raw_body = b""
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        logger.debug("%s %s", self.address_string(), format % args)
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._dispatch("POST")
+
+    def do_DELETE(self) -> None:  # noqa: N802
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str) -> None:
+        try:
+            # Read before anything can fail, so the next request on this
+            # kept-alive connection does not start inside this one's body.
+            self._raw_body = self._read_body()
+            self._authorize()
+            status, body = self._route(method, self.path.split("?", 1)[0].rstrip("/"))
+        except ApiError as exc:
+            status, body = exc.status, {"error": str(exc)}
+        except Exception:
+            logger.exception("API request %s %s failed", method, self.path)
+            status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "internal error"}
+        self._send(status, body)
+
+    def _authorize(self) -> None:
+        token = self.server.token
+        if not token:
+            return
+        given = self.headers.get("Authorization", "")
+        if not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "missing or wrong API token")
+
+    def _read_body(self) -> bytes:
+        """The raw request body; when it cannot be read, the connection is
+        closed after the error response instead."""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            self.close_connection = True
+            raise ApiError(
+                HTTPStatus.LENGTH_REQUIRED, "chunked request bodies are not supported"
+            )
+        header = (self.headers.get("Content-Length") or "0").strip()
+        if not CONTENT_LENGTH.match(header):
+            self.close_connection = True
+            raise ApiError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+        length = int(header)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            raise ApiError(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large"
+            )
+        return self.rfile.read(length) if length else b""
+
+    def _body(self) -> Dict[str, Any]:
+        if not self._raw_body:
+            return {}
+        try:
+            data = json.loads(self._raw_body)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "request body is not JSON") from None
+        if not isinstance(data, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "request body must be an object")
+        return data
+
+    def _send(self, status: HTTPStatus, body: Any) -> None:
+        if isinstance(body, str):
+            payload = body.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            payload = json.dumps(body).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _route(self, method: str, path: str) -> Tuple[HTTPStatus, Any]:
+        queue = self.server.queue
+        if method == "GET" and path == "/jobs":
+            return HTTPStatus.OK, self._jobs()
+        if method == "GET" and path == "/queue":
+            return HTTPStatus.OK, queue.snapshot()
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, self._metrics()
+
+        match = JOB_RUNS_PATH.match(path)
+        if match and method == "POST":
+            return self._enqueue(int(match.group(1)))
+        match = RUN_PATH.match(path)
+        if match and method == "GET":
+            return HTTPStatus.OK, self._run(int(match.group(1)))
+        if match and method == "DELETE":
+            return self._cancel(int(match.group(1)))
+        match = RUN_CANCEL_PATH.match(path)
+        if match and method == "POST":
+            return self._cancel(int(match.group(1)))
+        raise ApiError(HTTPStatus.NOT_FOUND, f"no such endpoint: {method} {path}")
+
+    def _jobs(self) -> Any:
+        db = SessionLocal()
+        try:
+            jobs = db.execute(select(BackupJob).order_by(BackupJob.id)).scalars()
+            return [_job_json(job) for job in jobs]
+        finally:
+            db.close()
+
+    def _metrics(self) -> str:
+        db = SessionLocal()
+        try:
+            return _metrics(db, self.server.queue)
+        finally:
+            db.close()
+
+    def _run(self, run_id: int) -> Any:
+        db = SessionLocal()
+        try:
+            run = db.get(BackupRun, run_id)
+            if run is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"run {run_id} not found")
+            return _run_json(run, self.server.queue)
+        finally:
+            db.close()
+
+    def _enqueue(self, job_id: int) -> Tuple[HTTPStatus, Any]:
+        priority = self._body().get("priority", "normal")
+        if priority not in PRIORITIES or priority == "scheduled":
+            raise ApiError(HTTPStatus.BAD_REQUEST, "priority must be urgent or normal")
+        try:
+            run_id = self.server.queue.submit(job_id, priority)
+        except LookupError as exc:
+            raise ApiError(HTTPStatus.NOT_FOUND, str(exc)) from None
+        except QueueFull as exc:
+            raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, str(exc)) from None
+        return HTTPStatus.ACCEPTED, {
+            "run_id": run_id,
+            "job_id": job_id,
+            "status": "queued",
+            "url": f"/runs/{run_id}",
+        }
+
+    def _cancel(self, run_id: int) -> Tuple[HTTPStatus, Any]:
+        status = self.server.queue.cancel(run_id)
+        if status is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"run {run_id} not found")
+        if status not in ("cancelled", "cancelling"):
+            raise ApiError(
+                HTTPStatus.CONFLICT,
+                f"run {run_id} is {status} and cannot be cancelled here",
+            )
+        return HTTPStatus.ACCEPTED, {"run_id": run_id, "status": status}
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Local HTTP/JSON control API of the scheduler.
+
+        GET  /jobs                 jobs
+        POST /jobs/<id>/runs       queue a run ({"priority": "urgent"|"normal"});
+                                   202 with its run id, without waiting
+        GET  /runs/<id>            status, queue position and progress
+        POST /runs/<id>/cancel     cancel a queued or running run (or DELETE)
+        GET  /queue                running and waiting runs
+        GET  /metrics              job baselines, regressions and queue
+                                   (Prometheus text format)
+
+    Served by daemon threads, one per connection.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        queue: RunQueue,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        token: Optional[str] = None,
+    ) -> None:
+        super().__init__(
+            (host or settings.api_host, settings.api_port if port is None else port),
+            _Handler,
+        )
+        self.queue = queue
+        self.token = settings.api_token if token is None else token
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self.serve_forever,
+            name="autobackup-api",
+            daemon=True,
+        )
+        self._thread.start()
+        host, port = self.server_address[:2]
+        logger.info("Control API listening on http://%s:%s", host, port)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+        self._thread = None
+
+
+def start_api(queue: RunQueue) -> Optional[ApiServer]:
+    """Start the API when API_PORT is set; None when it is off or cannot bind."""
+    if settings.api_port <= 0:
+        return None
+    try:
+        server = ApiServer(queue)
+    except OSError as exc:
+        logger.warning(
+            "Could not start the control API on %s:%s: %s",
+            settings.api_host,
+            settings.api_port,
+            exc,
+        )
+        return None
+    server.start()
+    return server
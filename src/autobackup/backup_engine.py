@@ -1,160 +1,1084 @@
 # pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+import logging
 import os
+import shutil
+import tempfile
+import threading
+import time
 import zipfile
-import pytz
-import logging
-from typing import Tuple
-from datetime import datetime
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union, cast
 
 from sqlalchemy.orm import Session
 
-from autobackup.models import BackupJob, BackupRun
+from autobackup.baselines import update_baseline
+from autobackup.checkpoint import (
+    ArchiveCheckpointer,
+    discard_checkpoint_files,
+    load_checkpoint,
+    restore_archive,
+    store_checkpoint,
+)
+from autobackup.clock import db_now
 from autobackup.config import settings
+from autobackup.delta import (
+    DELTA_COMMENT,
+    BlockHasher,
+    DeltaContext,
+    DeltaTooLarge,
+    signature_path,
+    write_delta,
+)
+from autobackup.delta import decode_extra as decode_delta_extra
+from autobackup.dump import (
+    DUMP_ENTRY_NAME,
+    DumpError,
+    DumpStream,
+    dump_command,
+    is_dump_job,
+)
+from autobackup.events import publish_change
+from autobackup.models import BackupJob, BackupRun, BackupRunDestination
+from autobackup.profiles import (
+    PerformanceProfile,
+    default_profile,
+    profile_for_job,
+    run_with_niceness,
+)
+from autobackup.progress import ProgressCallback, ProgressEvent, ProgressRecorder
+from autobackup.readahead import ReadAhead
+from autobackup.recycle import RecycleSource, raw_write_supported, recycled_percent
+from autobackup.recycle import encode_extra as encode_recycle_extra
+from autobackup.sparse import SPARSE_COMMENT, encode_extra, logical_size, sparse_extents
+from autobackup.stats import record_finished_run
+from autobackup.storage import StorageWriter, backend_for, is_remote
+from autobackup.tee import TeeWriter
+from autobackup.throttle import RateLimiter
+from autobackup.tracing import span
 
 logger = logging.getLogger(__name__)
 
+# Delta operations of a file are kept in memory up to this size, then spilled
+# to a temporary file, until the entry is written.
+DELTA_SPOOL_SIZE = 16 * 1024 * 1024
+
+CANCELLED_MESSAGE = "Cancelled"
+
+
+class RunCancelled(Exception):
+    """Raised from the progress callback of a run whose cancel event is set."""
 
-def build_backup_filename(job_id: int, destination_path: str) -> Path:
+
+def build_backup_filename(job_id: int, destination_path: str, run_id: int) -> Path:
     """
-    Build a unique backup filename based on job id and current UTC time.
+    Build a unique backup filename based on job id, current UTC time and run id.
     """
     dest_dir = Path(destination_path)
-    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-    filename = f"job_{job_id}_{timestamp}.zip"
-    return dest_dir / filename
+    return dest_dir / _backup_name(job_id, run_id)
+
+
+def _backup_name(job_id: int, run_id: int) -> str:
+    # The run id keeps runs of a job started in the same second apart.
+    timestamp = db_now().strftime("%Y%m%d_%H%M%S")
+    return f"job_{job_id}_{timestamp}_{run_id}.zip"
+
+
+def build_backup_location(job_id: int, destination: str, run_id: int) -> str:
+    """Like build_backup_filename(), for any storage backend (e.g. s3://...)."""
+    return backend_for(destination).join(destination, _backup_name(job_id, run_id))
+
+
+def _collect_files(src: Path) -> List[Tuple[Path, int]]:
+    """Walk the source once and return (path, size) for every file."""
+    files: List[Tuple[Path, int]] = []
+    for root, _, names in os.walk(src):
+        root_path = Path(root)
+        for name in names:
+            file_path = root_path / name
+            files.append((file_path, file_path.stat().st_size))
+    return files
+
+
+def _zip_info(
+    arcname: str,
+    st: os.stat_result,
+    profile: PerformanceProfile,
+) -> zipfile.ZipInfo:
+    """Same as ZipInfo.from_file(), from a stat result we already have."""
+    info = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.file_size = st.st_size
+    info.compress_type = profile.compress_type
+    # Read by ZipFile.open()/writestr() for ZipInfo arguments.
+    info._compresslevel = profile.compression_level  # type: ignore[attr-defined]
+    return info
+
+
+@dataclass
+class ArchiveStats:
+    """Counters of one archive, reported on its run."""
+
+    sparse_bytes_skipped: int = 0  # holes of sparse files, never read
+    delta_files: int = 0  # files stored as deltas against the base archive
+    delta_bytes_saved: int = 0  # their size minus the size of their deltas
+    recycled_files: int = 0  # unchanged files copied from the previous archive
+    recycled_bytes: int = 0  # their size
+
+
+def _write_large_file(
+    zf: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    fh: BinaryIO,
+    st: os.stat_result,
+    chunk_size: int,
+    account: Callable[..., None],
+    delta: Optional[DeltaContext],
+    stats: ArchiveStats,
+) -> None:
+    """Stream one file into the archive: as a delta, sparsely, or whole.
+
+    ``account`` is called with the number of source bytes read (and, with
+    ``throttle=False``, bytes that are counted without being read).
+    """
+    regions: List[Tuple[int, Optional[int]]] = [(0, None)]
+    extents = sparse_extents(fh.fileno(), st) if settings.sparse_files else None
+    if extents is not None:
+        info.extra += encode_extra(st.st_size, extents)
+        info.comment = SPARSE_COMMENT
+        regions = list(extents)
+
+    hasher: Optional[BlockHasher] = None
+    if delta is not None and extents is None and delta.wants(st.st_size):
+        hasher = BlockHasher(delta.block_size)
+        base = delta.base_signature(info.filename)
+        if base is not None:
+            with tempfile.SpooledTemporaryFile(max_size=DELTA_SPOOL_SIZE) as ops:
+                try:
+                    with span("engine.delta", file_size=st.st_size) as delta_span:
+                        literal = write_delta(
+                            fh,
+                            base,
+                            cast(BinaryIO, ops),
+                            hasher,
+                            max_literal=st.st_size * delta.max_literal_percent // 100,
+                            on_read=account,
+                            read_size=chunk_size,
+                        )
+                        delta_span.set("literal_bytes", literal)
+                except DeltaTooLarge:
+                    # Too much changed: store the file whole after all.
+                    account(-fh.tell(), throttle=False)
+                    fh.seek(0)
+                    hasher = BlockHasher(delta.block_size)
+                else:
+                    info.extra += delta.extra(st.st_size)
+                    info.comment = DELTA_COMMENT
+                    info.file_size = ops.tell()
+                    ops.seek(0)
+                    with zf.open(info, mode="w") as out:
+                        shutil.copyfileobj(ops, out, chunk_size)
+                    stats.delta_files += 1
+                    stats.delta_bytes_saved += st.st_size - info.file_size
+                    delta.add_signature(info.filename, hasher.finish())
+                    return
+
+    with zf.open(info, mode="w") as out:
+        for start, remaining in regions:
+            fh.seek(start)
+            while chunk := fh.read(
+                chunk_size if remaining is None else min(chunk_size, remaining)
+            ):
+                out.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+                account(len(chunk))
+
+    if hasher is not None and delta is not None:
+        delta.add_signature(info.filename, hasher.finish())
+    if extents is not None:
+        skipped = st.st_size - sum(length for _, length in extents)
+        stats.sparse_bytes_skipped += skipped
+        account(skipped, throttle=False)
+
+
+def _write_zip(
+    src: Path,
+    target: Union[Path, BinaryIO],
+    progress: Optional[ProgressCallback] = None,
+    profile: Optional[PerformanceProfile] = None,
+    checkpointer: Optional[ArchiveCheckpointer] = None,
+    resume: bool = False,
+    stats: Optional[ArchiveStats] = None,
+    delta: Optional[DeltaContext] = None,
+    recycle: Optional[RecycleSource] = None,
+) -> None:
+    """Write the zip archive of ``src`` to a path or a writable stream.
+
+    Files are fetched by a ReadAhead stage, so reading upcoming small files
+    overlaps with compressing the current one. Codec, level, threads, buffer
+    size and read rate come from ``profile``.
+
+    With a ``checkpointer`` (path targets only) the archive is sealed every
+    segment. With ``resume`` the existing archive at ``target`` is appended
+    to and files it already contains are skipped.
+
+    Sparse files (Linux) are read region by region, skipping their holes;
+    the hole map goes into the entry's extra field (see sparse.py). With
+    ``delta`` large files are stored as deltas against the base archive
+    where possible (see delta.py). With ``recycle`` unchanged files are
+    copied compressed from the previous archive (see recycle.py), and every
+    entry records the file it was made from.
+    """
+    profile = profile or default_profile()
+    stats = stats if stats is not None else ArchiveStats()
+    chunk_size = profile.read_buffer_kb * 1024
+    # Read-ahead only runs a bounded buffer ahead of this loop, so limiting
+    # the rate here limits the rate at which the source is read.
+    limiter = RateLimiter(profile.io_limit_mb_per_sec * 1024 * 1024)
+
+    with span("engine.walk") as walk:
+        files = _collect_files(src)
+        files_total = len(files)
+        bytes_total = sum(size for _, size in files)
+        walk.set("files", files_total)
+        walk.set("bytes", bytes_total)
+    files_done = 0
+    bytes_done = 0
+
+    def open_zip(mode: str) -> zipfile.ZipFile:
+        return zipfile.ZipFile(
+            target,
+            mode=mode,
+            compression=profile.compress_type,
+            compresslevel=profile.compression_level,
+        )
+
+    zf = open_zip("a" if resume else "w")
+    if resume:
+        # Entries of the sealed segments are kept; only the rest is archived.
+        archived = {}
+        for entry in zf.infolist():
+            delta_entry = decode_delta_extra(entry.extra)
+            if delta_entry is not None:
+                archived[entry.filename] = delta_entry[0]
+                stats.delta_files += 1
+                stats.delta_bytes_saved += delta_entry[0] - entry.file_size
+            else:
+                archived[entry.filename] = logical_size(entry)
+                stats.sparse_bytes_skipped += archived[entry.filename] - entry.file_size
+        files_done = len(archived)
+        bytes_done = sum(archived.values())
+        files = [
+            (path, size)
+            for path, size in files
+            if path.relative_to(src).as_posix() not in archived
+        ]
+
+    unchanged: List[Tuple[Path, os.stat_result, zipfile.ZipInfo]] = []
+    if recycle is not None:
+        with span("engine.recycle_match") as match:
+            files, unchanged = recycle.split(src, files)
+            if delta is not None:
+                # Large files are left to delta mode, which keeps their
+                # signatures for the next run (sparse files never get one).
+                to_delta = [
+                    item
+                    for item in unchanged
+                    if delta.wants(item[1].st_size)
+                    and item[2].comment != SPARSE_COMMENT
+                ]
+                files.extend((path, st.st_size) for path, st, _ in to_delta)
+                unchanged = [item for item in unchanged if item not in to_delta]
+            if unchanged and not raw_write_supported(zf):
+                logger.warning(
+                    "This zipfile version cannot copy compressed entries; "
+                    "%s unchanged files are compressed again",
+                    len(unchanged),
+                )
+                files.extend((path, st.st_size) for path, st, _ in unchanged)
+                unchanged = []
+            match.set("files", len(unchanged))
+
+    segment_bytes = 0
+    arcname = ""
+
+    def account(nbytes: int, throttle: bool = True) -> None:
+        """Count source bytes of the current file, at the profile's rate."""
+        nonlocal bytes_done, segment_bytes
+        if throttle:
+            limiter.wait(nbytes)
+            segment_bytes += nbytes
+        bytes_done += nbytes
+        if progress is not None:
+            progress(
+                ProgressEvent(
+                    current_file=arcname,
+                    files_done=files_done,
+                    files_total=files_total,
+                    bytes_done=bytes_done,
+                    bytes_total=bytes_total,
+                )
+            )
+
+    with span(
+        "engine.archive",
+        codec=profile.codec,
+        workers=profile.worker_threads,
+        resumed_files=files_done,
+    ):
+        try:
+            if recycle is not None:
+                for path, st, old in unchanged:
+                    arcname = str(path.relative_to(src))
+                    recycle.copy(zf, _zip_info(arcname, st, profile), old, chunk_size)
+                    stats.recycled_files += 1
+                    stats.recycled_bytes += st.st_size
+                    # Holes of recycled sparse entries.
+                    stats.sparse_bytes_skipped += st.st_size - old.file_size
+                    files_done += 1
+                    account(st.st_size, throttle=False)
+
+            readahead = ReadAhead(files, workers=profile.worker_threads)
+            for source in readahead:
+                # relative path inside zip
+                arcname = str(source.path.relative_to(src))
+                info = _zip_info(arcname, source.stat, profile)
+                if recycle is not None:
+                    info.extra = encode_recycle_extra(
+                        source.stat, profile.compression_level
+                    )
+
+                if source.data is not None:
+                    limiter.wait(len(source.data))
+                    zf.writestr(info, source.data)
+                    bytes_done += len(source.data)
+                    segment_bytes += len(source.data)
+                else:
+                    with open(source.path, "rb") as fh:
+                        _write_large_file(
+                            zf, info, fh, source.stat, chunk_size, account, delta, stats
+                        )
+
+                files_done += 1
+                if progress is not None:
+                    progress(
+                        ProgressEvent(
+                            current_file=arcname,
+                            files_done=files_done,
+                            files_total=files_total,
+                            bytes_done=bytes_done,
+                            bytes_total=bytes_total,
+                        )
+                    )
+
+                if checkpointer is not None and checkpointer.due(segment_bytes):
+                    with span("engine.checkpoint", files_done=files_done):
+                        checkpointer.seal(zf, files_done)
+                        zf = open_zip("a")
+                    segment_bytes = 0
+        finally:
+            zf.close()
+
+
+def _write_dump_zip(
+    target: Union[Path, BinaryIO],
+    dump: DumpStream,
+    progress: Optional[ProgressCallback] = None,
+    profile: Optional[PerformanceProfile] = None,
+) -> None:
+    """Write the output of a dump command as the single entry of an archive.
+
+    The output is streamed: it is read in profile-sized chunks as fast as
+    the archive is written, with no temporary file. Raises DumpError if the
+    command fails, after which the archive must be discarded.
+    """
+    profile = profile or default_profile()
+    chunk_size = profile.read_buffer_kb * 1024
+    limiter = RateLimiter(profile.io_limit_mb_per_sec * 1024 * 1024)
+
+    info = zipfile.ZipInfo(DUMP_ENTRY_NAME, time.localtime()[0:6])
+    info.external_attr = 0o600 << 16
+    info.compress_type = profile.compress_type
+    info._compresslevel = profile.compression_level  # type: ignore[attr-defined]
+
+    def report(files_done: int) -> None:
+        if progress is not None:
+            # The size of a dump is only known at its end.
+            progress(
+                ProgressEvent(
+                    current_file=DUMP_ENTRY_NAME,
+                    files_done=files_done,
+                    files_total=1,
+                    bytes_done=dump.bytes_read,
+                    bytes_total=dump.bytes_read if files_done else 0,
+                )
+            )
+
+    with span("engine.dump", command=dump.command[0]) as dump_span:
+        with zipfile.ZipFile(target, mode="w") as zf, dump:
+            # Size unknown up front: always write zip64 sizes.
+            with zf.open(info, mode="w", force_zip64=True) as out:
+                while chunk := dump.read(chunk_size):
+                    limiter.wait(len(chunk))
+                    out.write(chunk)
+                    report(0)
+        dump_span.set("bytes", dump.bytes_read)
+        dump_span.set("exit_status", dump.exit_status)
+    error = dump.error()
+    if error:
+        raise DumpError(error)
+    report(1)
+
+
+def _verify_archive(path: Path) -> Optional[str]:
+    """Re-read a finished archive; returns an error message or None."""
+    try:
+        with span("engine.verify"), zipfile.ZipFile(path) as zf:
+            bad = zf.testzip()
+    except (OSError, zipfile.BadZipFile) as exc:
+        return f"Verification failed: {exc}"
+    if bad is not None:
+        return f"Verification failed: bad CRC for {bad}"
+    return None
+
+
+def _check_source(src: Path) -> Optional[str]:
+    if not src.exists():
+        return f"Source path does not exist: {src}"
+    if not src.is_dir():
+        return f"Source path is not a directory: {src}"
+    return None
+
+
+def _discard_archive(path: Path) -> None:
+    path.unlink(missing_ok=True)
+    signature_path(path).unlink(missing_ok=True)
+    discard_checkpoint_files(path)
 
 
 def create_zip_backup(
     source_path: str,
     destination_path: str,
     output_file: Path,
+    progress: Optional[ProgressCallback] = None,
+    profile: Optional[PerformanceProfile] = None,
+    checkpointer: Optional[ArchiveCheckpointer] = None,
+    resume: bool = False,
+    stats: Optional[ArchiveStats] = None,
+    delta: Optional[DeltaContext] = None,
+    dump: Optional[DumpStream] = None,
+    recycle: Optional[RecycleSource] = None,
 ) -> Tuple[bool, str]:
     """
     Create a zip backup of source_path into output_file.
 
+    If given, ``progress`` is called with a ProgressEvent after each chunk
+    copied into the archive; it must be cheap (see ProgressRecorder).
+    ``profile`` selects codec, threads, buffers, rate limit and verification.
+    ``checkpointer`` seals the archive periodically; ``resume`` continues a
+    partial archive restored from its last checkpoint. ``delta`` stores
+    large files as deltas and is closed here. With ``dump`` the archive holds
+    the command's output instead of source_path. ``recycle`` copies the
+    entries of unchanged files from the previous archive. Counters are added
+    to ``stats``.
+
     Returns:
         (success, message)
     """
     src = Path(source_path)
     dest = output_file
 
-    if not src.exists():
-        return False, f"Source path does not exist: {src}"
-
-    if not src.is_dir():
-        return False, f"Source path is not a directory: {src}"
+    error = _check_source(src) if dump is None else None
+    if error:
+        if delta is not None:
+            delta.discard()
+        if resume:
+            _discard_archive(dest)
+        return False, error
 
     dest.parent.mkdir(parents=True, exist_ok=True)
 
     try:
-        with zipfile.ZipFile(dest, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            for root, _, files in os.walk(src):
-                root_path = Path(root)
-                for name in files:
-                    file_path = root_path / name
-                    # relative path inside zip
-                    arcname = file_path.relative_to(src)
-                    zf.write(file_path, arcname=arcname)
-
+        if dump is not None:
+            _write_dump_zip(dest, dump, progress, profile)
+        else:
+            _write_zip(
+                src,
+                dest,
+                progress,
+                profile,
+                checkpointer,
+                resume,
+                stats,
+                delta,
+                recycle,
+            )
+        if delta is not None:
+            delta.close()
+        discard_checkpoint_files(dest)
+        if profile is not None and profile.verify:
+            error = _verify_archive(dest)
+            if error:
+                _discard_archive(dest)
+                return False, error
         return True, f"Backup created: {dest}"
 
     except Exception as exc:  # noqa: BLE001
-        if dest.exists():
-            dest.unlink(missing_ok=True)
+        if delta is not None:
+            delta.close()
+        _discard_archive(dest)
         return False, f"Error while creating backup: {exc}"
 
 
-def _enforce_retention_for_job(db: Session, job_id: int) -> None:
-    """
-    Enforce retention policy for a given job:
-    keep only the N most recent successful backups and delete older ones.
-    """
-    max_runs = settings.max_backups_per_job
-    if max_runs <= 0:
-        return
+@dataclass
+class DestinationOutcome:
+    destination: str
+    output_file: str
+    success: bool
+    message: str
+    size_bytes: Optional[int] = None
 
-    runs = (
-        db.query(BackupRun)
-        .filter(BackupRun.job_id == job_id, BackupRun.status == "success")
-        .order_by(BackupRun.start_time.desc())
-        .all()
-    )
 
-    if len(runs) <= max_runs:
-        return
+def job_destinations(job: BackupJob) -> List[str]:
+    """The job's destination_path followed by its extra destinations."""
+    extra = [line.strip() for line in (job.extra_destinations or "").splitlines()]
+    return [job.destination_path, *[line for line in extra if line]]
 
-    to_delete = runs[max_runs:]
 
-    for run in to_delete:
+def create_zip_backup_multi(
+    source_path: str,
+    output_files: List[Tuple[str, str]],
+    progress: Optional[ProgressCallback] = None,
+    buffer_limit: Optional[int] = None,
+    profile: Optional[PerformanceProfile] = None,
+    stats: Optional[ArchiveStats] = None,
+    dump: Optional[DumpStream] = None,
+    recycle: Optional[RecycleSource] = None,
+) -> List[DestinationOutcome]:
+    """
+    Create one zip archive of source_path and stream it to several locations.
+
+    ``output_files`` is a list of (destination, archive location); each
+    location is written through its storage backend (local file or S3). The
+    source is read and compressed once; a TeeWriter copies the stream to every
+    location, each on its own thread, buffering up to ``buffer_limit`` bytes
+    for a slow one. A destination that fails does not stop the others. With
+    ``dump`` the archive holds the command's output instead of source_path;
+    ``recycle`` is as for create_zip_backup().
+    """
+    src = Path(source_path)
+    if buffer_limit is None:
+        buffer_limit = settings.tee_buffer_limit_mb * 1024 * 1024
+
+    error = _check_source(src) if dump is None else None
+    if error:
+        return [
+            DestinationOutcome(destination, location, False, error)
+            for destination, location in output_files
+        ]
+
+    outcomes: List[Optional[DestinationOutcome]] = []
+    writers: List[StorageWriter] = []
+    open_indexes: List[int] = []
+    for index, (destination, location) in enumerate(output_files):
         try:
-            if run.output_file:
-                path = Path(run.output_file)
-                if path.exists():
-                    path.unlink()
-                    logger.info(
-                        "Retention: deleted old backup file %s for job %s",
-                        path,
-                        job_id,
-                    )
+            writers.append(backend_for(location).open_writer(location))
+            open_indexes.append(index)
+            outcomes.append(None)
         except Exception as exc:  # noqa: BLE001
-            logger.warning(
-                "Retention: could not delete file %s for job %s: %s",
-                run.output_file,
-                job_id,
-                exc,
+            outcomes.append(
+                DestinationOutcome(
+                    destination,
+                    location,
+                    False,
+                    f"Could not open destination: {exc}",
+                )
             )
 
-        db.delete(run)
+    tee = TeeWriter(writers, buffer_limit)
+    archive_error: Optional[BaseException] = None
+    try:
+        if writers and dump is not None:
+            _write_dump_zip(cast(BinaryIO, tee), dump, progress, profile)
+        elif writers:
+            _write_zip(
+                src,
+                cast(BinaryIO, tee),
+                progress,
+                profile,
+                stats=stats,
+                recycle=recycle,
+            )
+    except Exception as exc:  # noqa: BLE001
+        archive_error = exc
+    finally:
+        tee.close()
 
-    db.commit()
-    logger.info(
-        "Retention: kept last %s backups for job %s (deleted %s old runs)",
-        max_runs,
-        job_id,
-        len(to_delete),
-    )
+    for writer, index, write_error in zip(
+        writers, open_indexes, tee.errors, strict=True
+    ):
+        destination, location = output_files[index]
+        failure = write_error or archive_error
+        size: Optional[int] = None
+        if failure is None:
+            try:
+                size = writer.close()
+            except Exception as exc:  # noqa: BLE001
+                failure = exc
+            else:
+                if profile is not None and profile.verify and not is_remote(location):
+                    error = _verify_archive(Path(location))
+                    if error:
+                        Path(location).unlink(missing_ok=True)
+                        failure = RuntimeError(error)
+        else:
+            try:
+                writer.abort()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Could not discard partial %s: %s", location, exc)
+
+        if failure is None:
+            outcomes[index] = DestinationOutcome(
+                destination,
+                location,
+                True,
+                f"Backup created: {location}",
+                size,
+            )
+        else:
+            outcomes[index] = DestinationOutcome(
+                destination,
+                location,
+                False,
+                f"Error while creating backup: {failure}",
+            )
 
+    return [outcome for outcome in outcomes if outcome is not None]
 
-def run_backup_for_job(db: Session, job: BackupJob) -> BackupRun:
+
+def run_backup_for_job(
+    db: Session,
+    job: BackupJob,
+    cancel: Optional[threading.Event] = None,
+) -> BackupRun:
     """
     Run a backup for the given job and persist a BackupRun record.
+
+    Setting ``cancel`` stops the backup at its next progress update; the run
+    then ends with status "cancelled".
     """
-    run = BackupRun(
-        job_id=job.id,
-        status="running",
-        start_time=datetime.now(),
-    )
+    run = BackupRun(job_id=job.id)
     db.add(run)
+    return _start_run(db, job, run, cancel)
+
+
+def queue_backup_run(db: Session, job: BackupJob) -> BackupRun:
+    """
+    Record a run of ``job`` waiting for a free slot (status "queued").
+
+    It is started later with start_queued_run() (see run_queue.py).
+    """
+    run = BackupRun(job_id=job.id, status="queued", start_time=db_now())
+    db.add(run)
+    db.flush()
+    publish_change(db, "run", job.id, run.id)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def start_queued_run(
+    db: Session,
+    run: BackupRun,
+    cancel: Optional[threading.Event] = None,
+) -> BackupRun:
+    """Run the backup of a run created by queue_backup_run()."""
+    return _start_run(db, run.job, run, cancel)
+
+
+def cancel_queued_run(
+    db: Session, run: BackupRun, message: str = CANCELLED_MESSAGE
+) -> None:
+    """Settle a run that never started; the caller commits."""
+    run.status = "cancelled"
+    run.end_time = db_now()
+    run.message = message[:1000]
+    publish_change(db, "run", run.job_id, run.id)
+
+
+def _start_run(
+    db: Session,
+    job: BackupJob,
+    run: BackupRun,
+    cancel: Optional[threading.Event],
+) -> BackupRun:
+    run.status = "running"
+    run.start_time = db_now()
+    # Archive names include the run id.
+    db.flush()
+    destinations = job_destinations(job)
+    if len(destinations) == 1 and not is_remote(destinations[0]):
+        # Archives written to a single local file are checkpointed, so the
+        # run can be resumed after a crash (see recovery.py).
+        run.checkpoint_file = str(
+            build_backup_filename(job.id, job.destination_path, run.id)
+        )
+    publish_change(db, "run", job.id, run.id)
     db.commit()
     db.refresh(run)
 
-    output_file_path = build_backup_filename(job.id, job.destination_path)
+    return _execute_run(db, job, run, cancel=cancel)
+
+
+def resume_backup_run(
+    db: Session,
+    run: BackupRun,
+    cancel: Optional[threading.Event] = None,
+    recorder: Optional[ProgressRecorder] = None,
+) -> BackupRun:
+    """
+    Continue a run interrupted by a crash, from its last checkpoint.
+
+    The partial archive is cut back to its last sealed segment and the files
+    not in it yet are added. Without a usable checkpoint the archive is
+    started again from scratch, still as the same run.
 
-    success, message = create_zip_backup(
-        source_path=job.source_path,
-        destination_path=job.destination_path,
-        output_file=output_file_path,
+    ``recorder`` is the run's already started ProgressRecorder, when the
+    caller keeps the run's heartbeat going while it waits (see scheduler.py).
+    """
+    if recorder is None:
+        recorder = ProgressRecorder(run.id, run.job_id)
+    # Cutting back a large archive takes a while: keep the heartbeat going.
+    recorder.start()
+    try:
+        archive = Path(run.checkpoint_file)
+        checkpoint = load_checkpoint(run)
+        resume = checkpoint is not None and restore_archive(archive, checkpoint)
+        if not resume:
+            _discard_archive(archive)
+            run.checkpoint_segment = None
+            run.checkpoint_offset = None
+            run.checkpoint_size = None
+            run.checkpoint_files_done = None
+        # Signatures written before the crash may be cut off; files of the kept
+        # segments get none and are stored whole by the next run.
+        signature_path(archive).unlink(missing_ok=True)
+        run.resume_count = (run.resume_count or 0) + 1
+        publish_change(db, "run", run.job_id, run.id)
+        db.commit()
+    except BaseException:
+        recorder.stop()
+        raise
+
+    logger.info(
+        "Resuming run %s of job %s from %s",
+        run.id,
+        run.job_id,
+        f"segment {checkpoint.segment}" if resume and checkpoint else "the start",
+    )
+    return _execute_run(
+        db, run.job, run, resume=resume, cancel=cancel, recorder=recorder
+    )
+
+
+def _delta_base(db: Session, job: BackupJob, run: BackupRun) -> Optional[BackupRun]:
+    """The run whose archive large files of ``run`` are diffed against."""
+    if run.delta_base_run_id is not None:
+        # Resumed run: kept segments may already refer to this base.
+        base = db.get(BackupRun, run.delta_base_run_id)
+    else:
+        base = (
+            db.query(BackupRun)
+            .filter(
+                BackupRun.job_id == job.id,
+                BackupRun.status == "success",
+                BackupRun.output_file.isnot(None),
+                BackupRun.id != run.id,
+            )
+            .order_by(BackupRun.start_time.desc(), BackupRun.id.desc())
+            .first()
+        )
+        if base is not None and (base.delta_depth or 0) >= settings.delta_max_chain:
+            return None
+    if base is None or base.output_file is None or is_remote(base.output_file):
+        return None
+    archive = Path(base.output_file)
+    # Restore finds the base by name next to the delta archive.
+    if archive.parent != Path(run.checkpoint_file).parent:
+        return None
+    if not archive.exists() or not signature_path(archive).exists():
+        return None
+    return base
+
+
+def _delta_context(
+    db: Session, job: BackupJob, run: BackupRun
+) -> Optional[DeltaContext]:
+    """Delta state for a single-file run, or None when delta mode is off."""
+    if settings.delta_min_file_mb <= 0:
+        return None
+    base = _delta_base(db, job, run)
+    run.delta_base_run_id = base.id if base is not None else None
+    run.delta_depth = (base.delta_depth or 0) + 1 if base is not None else 0
+    # Committed before writing, so retention keeps the base meanwhile.
+    db.commit()
+    return DeltaContext(
+        Path(run.checkpoint_file),
+        Path(base.output_file) if base is not None else None,
+        min_size=settings.delta_min_file_mb * 1024 * 1024,
+        block_size=settings.delta_block_kb * 1024,
+        max_literal_percent=settings.delta_max_literal_percent,
     )
 
-    LOCAL_TZ = pytz.timezone("Europe/Luxembourg")
-    run.end_time = datetime.now(LOCAL_TZ)
-    run.message = message
 
-    if success:
+def _recycle_source(
+    db: Session,
+    job: BackupJob,
+    run: BackupRun,
+    profile: PerformanceProfile,
+) -> Optional[RecycleSource]:
+    """Recycle state of a run in recycle mode, from the previous local archive."""
+    if not settings.recycle_unchanged:
+        return None
+    previous = (
+        db.query(BackupRun)
+        .filter(
+            BackupRun.job_id == job.id,
+            BackupRun.status == "success",
+            BackupRun.output_file.isnot(None),
+            BackupRun.id != run.id,
+        )
+        .order_by(BackupRun.start_time.desc(), BackupRun.id.desc())
+        .first()
+    )
+    candidates: List[str] = []
+    if previous is not None:
+        # Any local copy will do (jobs with several destinations).
+        candidates = [previous.output_file] + [
+            destination.output_file
+            for destination in previous.destinations
+            if destination.output_file
+            and destination.output_file != previous.output_file
+        ]
+    for candidate in candidates:
+        if is_remote(candidate) or not os.path.exists(candidate):
+            continue
+        try:
+            return RecycleSource(
+                Path(candidate),
+                profile.compress_type,
+                profile.compression_level,
+                run_id=previous.id if previous is not None else None,
+            )
+        except (OSError, zipfile.BadZipFile) as exc:
+            logger.warning("Cannot recycle entries of %s: %s", candidate, exc)
+    return RecycleSource(None, profile.compress_type, profile.compression_level)
+
+
+def _cancellable(
+    progress: ProgressCallback, cancel: threading.Event
+) -> ProgressCallback:
+    """``progress``, raising RunCancelled once ``cancel`` is set."""
+
+    def report(event: ProgressEvent) -> None:
+        if cancel.is_set():
+            raise RunCancelled(CANCELLED_MESSAGE)
+        progress(event)
+
+    return report
+
+
+def _execute_run(
+    db: Session,
+    job: BackupJob,
+    run: BackupRun,
+    resume: bool = False,
+    cancel: Optional[threading.Event] = None,
+    recorder: Optional[ProgressRecorder] = None,
+) -> BackupRun:
+    # Started first: it is also the run's heartbeat, and opening the recycle
+    # source or starting a dump may take a while.
+    if recorder is None:
+        recorder = ProgressRecorder(run.id, job.id)
+    recorder.start()
+
+    destinations = job_destinations(job)
+    # Read from the job row on every run, so profile edits apply to the next run.
+    profile = profile_for_job(job)
+    output_file: Optional[str] = None
+    size_bytes: Optional[int] = None
+    outcomes: List[DestinationOutcome] = []
+    stats = ArchiveStats()
+    dump: Optional[DumpStream] = None
+    recycle: Optional[RecycleSource] = None
+    progress = recorder if cancel is None else _cancellable(recorder, cancel)
+    try:
+        if is_dump_job(job):
+            dump = DumpStream(dump_command(job))
+        else:
+            recycle = _recycle_source(db, job, run, profile)
+        with span(
+            "engine.backup",
+            run_id=run.id,
+            destinations=len(destinations),
+            preset=job.perf_preset or "",
+        ):
+            if run.checkpoint_file:
+                output_file_path = Path(run.checkpoint_file)
+                delta: Optional[DeltaContext] = None
+                checkpointer: Optional[ArchiveCheckpointer] = None
+                # A dump cannot be resumed half way: an interrupted dump
+                # run starts over (no checkpoint is ever stored).
+                if dump is None:
+                    delta = _delta_context(db, job, run)
+                    checkpointer = ArchiveCheckpointer(
+                        output_file_path,
+                        store_checkpoint(run.id),
+                        settings.checkpoint_segment_mb * 1024 * 1024,
+                        segment=run.checkpoint_segment or 0,
+                    )
+                success, message = run_with_niceness(
+                    profile.niceness,
+                    lambda: create_zip_backup(
+                        source_path=job.source_path,
+                        destination_path=job.destination_path,
+                        output_file=output_file_path,
+                        progress=progress,
+                        profile=profile,
+                        checkpointer=checkpointer,
+                        resume=resume,
+                        stats=stats,
+                        delta=delta,
+                        dump=dump,
+                        recycle=recycle,
+                    ),
+                )
+                if success:
+                    output_file = str(output_file_path)
+                    size_bytes = output_file_path.stat().st_size
+            else:
+                output_files = [
+                    (destination, build_backup_location(job.id, destination, run.id))
+                    for destination in destinations
+                ]
+                outcomes = run_with_niceness(
+                    profile.niceness,
+                    lambda: create_zip_backup_multi(
+                        source_path=job.source_path,
+                        output_files=output_files,
+                        progress=progress,
+                        profile=profile,
+                        stats=stats,
+                        dump=dump,
+                        recycle=recycle,
+                    ),
+                )
+    finally:
+        recorder.stop()
+        if recycle is not None:
+            recycle.close()
+
+    if dump is not None:
+        run.dump_exit_status = dump.exit_status
+        run.dump_bytes = dump.bytes_read
+        logger.info(
+            "Run %s: %s exited with status %s after %s bytes",
+            run.id,
+            dump.command[0],
+            dump.exit_status,
+            dump.bytes_read,
+        )
+
+    if outcomes:
+        # The run succeeds if at least one copy was written; the first
+        # successful copy is the run's output_file.
+        succeeded = [outcome for outcome in outcomes if outcome.success]
+        success = bool(succeeded)
+        if succeeded:
+            output_file = succeeded[0].output_file
+            size_bytes = succeeded[0].size_bytes
+        message = "\n".join(
+            f"{outcome.destination}: {outcome.message}" for outcome in outcomes
+        )
+        if len(outcomes) > 1:
+            run.destinations = [
+                BackupRunDestination(
+                    position=position,
+                    destination=outcome.destination[:500],
+                    status="success" if outcome.success else "error",
+                    message=outcome.message[:1000],
+                    output_file=outcome.output_file if outcome.success else None,
+                    size_bytes=outcome.size_bytes,
+                )
+                for position, outcome in enumerate(outcomes)
+            ]
+
+    latest = recorder.latest
+    if latest is not None:
+        run.progress_files_done = latest.files_done
+        run.progress_files_total = latest.files_total
+        run.progress_bytes_done = latest.bytes_done
+        run.progress_bytes_total = latest.bytes_total
+
+    # Same clock as start_time (see clock.py).
+    run.end_time = db_now()
+    # message is VARCHAR(1000); PostgreSQL rejects longer values.
+    run.message = message[:1000]
+
+    if success and output_file is not None:
         run.status = "success"
-        run.output_file = str(output_file_path)
+        run.output_file = output_file
+        run.size_bytes = size_bytes
+        run.sparse_bytes_skipped = stats.sparse_bytes_skipped
+        run.delta_bytes_saved = stats.delta_bytes_saved
+        if recycle is not None:
+            run.recycled_bytes = stats.recycled_bytes
+            logger.info(
+                "Run %s recycled %s files from run %s: %s of %s bytes (%.0f%%)",
+                run.id,
+                stats.recycled_files,
+                recycle.run_id,
+                stats.recycled_bytes,
+                run.progress_bytes_total or 0,
+                recycled_percent(run.recycled_bytes, run.progress_bytes_total) or 0,
+            )
+        if stats.delta_files:
+            logger.info(
+                "Run %s stored %s files as deltas against run %s, saving %s bytes",
+                run.id,
+                stats.delta_files,
+                run.delta_base_run_id,
+                stats.delta_bytes_saved,
+            )
+        if stats.sparse_bytes_skipped:
+            logger.info(
+                "Run %s skipped %s bytes of holes in sparse files",
+                run.id,
+                stats.sparse_bytes_skipped,
+            )
+    elif cancel is not None and cancel.is_set():
+        run.status = "cancelled"
+        run.output_file = None
+        run.message = CANCELLED_MESSAGE
+        logger.info("Run %s of job %s was cancelled", run.id, job.id)
     else:
         run.status = "error"
         run.output_file = None
+    if not stats.delta_files:
+        # Nothing refers to the base: retention may delete it.
+        run.delta_base_run_id = None
+        run.delta_depth = 0
 
     db.add(run)
+    record_finished_run(db, run)
+    update_baseline(db, run)
+    publish_change(db, "run", job.id, run.id)
     db.commit()
     db.refresh(run)
 
-    # Só aplica retenção se o backup deu certo
-    if success:
-        _enforce_retention_for_job(db, job.id)
-
+    # Retention is applied by the scheduler's background sweeper, not here.
     return run
 
@@ -0,0 +1,180 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from autobackup.clock import db_now, seconds_between
+from autobackup.config import settings
+from autobackup.models import BackupJob, BackupJobBaseline, BackupRun
+
+logger = logging.getLogger(__name__)
+
+# One successful run: duration in seconds, throughput in source bytes per
+# second (None when the run did not count its source bytes), archive bytes.
+Sample = Tuple[float, Optional[float], int]
+
+
+@dataclass
+class JobBaseline:
+    job_id: int
+    job_name: str
+    sample_count: int
+    duration_p50: Optional[float]
+    duration_p95: Optional[float]
+    throughput_p50: Optional[float]
+    throughput_p95: Optional[float]
+    bytes_p50: Optional[int]
+    bytes_p95: Optional[int]
+    regression_count: int
+    last_regression_run_id: Optional[int]
+    last_regression_at: Optional[datetime]
+
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """The q-th percentile (0-100) of ``values``, linearly interpolated."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q / 100.0
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+
+def run_sample(run: BackupRun) -> Optional[Sample]:
+    """The baseline sample of a finished run, or None if it has no duration."""
+    duration = seconds_between(run.start_time, run.end_time)
+    if duration is None:
+        return None
+    source_bytes = run.progress_bytes_total or run.dump_bytes
+    throughput = source_bytes / duration if source_bytes and duration > 0 else None
+    return (duration, throughput, int(run.size_bytes or 0))
+
+
+def _load_samples(baseline: BackupJobBaseline) -> List[Sample]:
+    try:
+        return [tuple(sample) for sample in json.loads(baseline.samples or "[]")]
+    except ValueError:
+        logger.warning(
+            "Discarding unreadable baseline samples of job %s", baseline.job_id
+        )
+        return []
+
+
+def _recompute(baseline: BackupJobBaseline, samples: List[Sample]) -> None:
+    durations = [s[0] for s in samples]
+    throughputs = [s[1] for s in samples if s[1] is not None]
+    sizes = [float(s[2]) for s in samples]
+    bytes_p50 = percentile(sizes, 50)
+    bytes_p95 = percentile(sizes, 95)
+
+    baseline.samples = json.dumps(samples)
+    baseline.sample_count = len(samples)
+    baseline.duration_p50 = percentile(durations, 50)
+    baseline.duration_p95 = percentile(durations, 95)
+    baseline.throughput_p50 = percentile(throughputs, 50)
+    baseline.throughput_p95 = percentile(throughputs, 95)
+    baseline.bytes_p50 = None if bytes_p50 is None else int(bytes_p50)
+    baseline.bytes_p95 = None if bytes_p95 is None else int(bytes_p95)
+
+
+def _regression(baseline: BackupJobBaseline, sample: Sample) -> Optional[str]:
+    """Why ``sample`` is a regression against ``baseline``, or None."""
+    if (baseline.sample_count or 0) < settings.baseline_min_runs:
+        return None
+    p50, p95 = baseline.duration_p50, baseline.duration_p95
+    if p50 is None or p95 is None:
+        return None
+    duration, throughput, size = sample
+    if duration <= p95 * settings.regression_factor:
+        return None
+    if duration - p50 < settings.regression_min_seconds:
+        return None
+
+    reason = f"took {duration:.0f}s, p50 {p50:.0f}s / p95 {p95:.0f}s"
+    if throughput is not None and baseline.throughput_p50:
+        reason += f"; throughput {throughput / baseline.throughput_p50:.0%} of p50"
+    if baseline.bytes_p50:
+        reason += f"; archive {size / baseline.bytes_p50:.0%} of p50 size"
+    return reason
+
+
+def update_baseline(db: Session, run: BackupRun) -> Optional[str]:
+    """
+    Check a finished run against its job's baseline, then add it to it (same
+    transaction as the run).
+
+    Only successful runs count, and resumed runs are left out: their duration
+    includes the outage. A regression is recorded on the run and the baseline,
+    logged, and returned; the run still joins the window, so a lasting change
+    becomes the new normal after a while instead of being flagged forever.
+    """
+    if run.status != "success" or (run.resume_count or 0) > 0:
+        return None
+    sample = run_sample(run)
+    if sample is None:
+        return None
+
+    baseline = db.execute(
+        select(BackupJobBaseline)
+        .where(BackupJobBaseline.job_id == run.job_id)
+        .with_for_update()
+    ).scalar_one_or_none()
+    if baseline is None:
+        baseline = BackupJobBaseline(job_id=run.job_id, samples="[]", sample_count=0)
+        baseline.regression_count = 0
+        db.add(baseline)
+
+    reason = _regression(baseline, sample)
+    if reason is not None:
+        run.perf_regression = reason[:500]
+        baseline.regression_count = (baseline.regression_count or 0) + 1
+        baseline.last_regression_run_id = run.id
+        baseline.last_regression_at = run.end_time
+        logger.warning(
+            "Performance regression in run %s of job %s: %s",
+            run.id,
+            run.job_id,
+            reason,
+        )
+
+    samples = _load_samples(baseline)
+    samples.append(sample)
+    _recompute(baseline, samples[-max(1, settings.baseline_window_runs) :])
+    baseline.updated_at = db_now()
+    return reason
+
+
+def load_baselines(db: Session, job_id: Optional[int] = None) -> List[JobBaseline]:
+    """Baselines of all jobs (or one), by job id."""
+    stmt = (
+        select(BackupJobBaseline, BackupJob.name)
+        .join(BackupJob, BackupJob.id == BackupJobBaseline.job_id)
+        .order_by(BackupJobBaseline.job_id)
+    )
+    if job_id is not None:
+        stmt = stmt.where(BackupJobBaseline.job_id == job_id)
+    return [
+        JobBaseline(
+            job_id=row.job_id,
+            job_name=name,
+            sample_count=row.sample_count or 0,
+            duration_p50=row.duration_p50,
+            duration_p95=row.duration_p95,
+            throughput_p50=row.throughput_p50,
+            throughput_p95=row.throughput_p95,
+            bytes_p50=row.bytes_p50,
+            bytes_p95=row.bytes_p95,
+            regression_count=row.regression_count or 0,
+            last_regression_run_id=row.last_regression_run_id,
+            last_regression_at=row.last_regression_at,
+        )
+        for row, name in db.execute(stmt).all()
+    ]
@@ -0,0 +1,350 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import logging
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from autobackup.dump import SOURCE_TYPES
+from autobackup.events import publish_change
+from autobackup.models import BackupJob
+from autobackup.profiles import resolve_profile
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("yaml", "json", "csv")
+SCHEDULE_TYPES = ("manual", "interval", "daily", "on_change")
+
+
+def _text(value: Any) -> str:
+    return str(value).strip()
+
+
+def _integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError("expected an integer")
+    return int(value)
+
+
+def _boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off"):
+        return False
+    raise ValueError("expected true or false")
+
+
+# Job definition fields, in export order, with their parser. Empty values
+# mean NULL (the default) for all but the first three.
+JOB_FIELDS: Dict[str, Callable[[Any], Any]] = {
+    "name": _text,
+    "source_path": _text,
+    "destination_path": _text,
+    "source_type": _text,
+    "source_command": _text,
+    "schedule_type": _text,
+    "interval_minutes": _integer,
+    "active": _boolean,
+    "keep_daily": _integer,
+    "keep_weekly": _integer,
+    "keep_monthly": _integer,
+    "extra_destinations": _text,
+    "perf_preset": _text,
+    "compression_codec": _text,
+    "compression_level": _integer,
+    "worker_threads": _integer,
+    "read_buffer_kb": _integer,
+    "io_limit_mb_per_sec": float,
+    "niceness": _integer,
+    "verify_archive": _boolean,
+}
+REQUIRED_FIELDS = ("name", "source_path", "destination_path")
+
+
+class JobImportError(ValueError):
+    """The job file is invalid; nothing was written."""
+
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__(f"{len(errors)} invalid job definition(s)")
+        self.errors = errors
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+
+
+def _parse_job(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Job columns from one raw record; raises ValueError."""
+    unknown = sorted(set(raw) - set(JOB_FIELDS) - {"id"})
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+
+    job: Dict[str, Any] = {}
+    for name, parse in JOB_FIELDS.items():
+        value = raw.get(name)
+        if isinstance(value, list) and name == "extra_destinations":
+            value = "\n".join(str(item) for item in value)
+        if value is None or (isinstance(value, str) and not value.strip()):
+            job[name] = None
+            continue
+        try:
+            job[name] = parse(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: invalid value {value!r}") from None
+
+    for name in REQUIRED_FIELDS:
+        if not job[name]:
+            raise ValueError(f"{name} is required")
+    job["schedule_type"] = job["schedule_type"] or "manual"
+    job["active"] = True if job["active"] is None else job["active"]
+
+    if job["schedule_type"] not in SCHEDULE_TYPES:
+        raise ValueError(f"schedule_type must be one of {', '.join(SCHEDULE_TYPES)}")
+    interval = job["interval_minutes"]
+    if job["schedule_type"] == "interval" and interval is None:
+        raise ValueError("interval_minutes is required for interval jobs")
+    if interval is not None and interval <= 0:
+        raise ValueError("interval_minutes must be positive")
+    for name in ("keep_daily", "keep_weekly", "keep_monthly"):
+        if job[name] is not None and job[name] < 0:
+            raise ValueError(f"{name} must not be negative")
+    if job["source_type"] == "path":
+        job["source_type"] = None
+    if job["source_type"] is not None and job["source_type"] not in SOURCE_TYPES:
+        raise ValueError(f"source_type must be one of {', '.join(SOURCE_TYPES)}")
+
+    resolve_profile(
+        job["perf_preset"],
+        codec=job["compression_codec"],
+        compression_level=job["compression_level"],
+        worker_threads=job["worker_threads"],
+        read_buffer_kb=job["read_buffer_kb"],
+        io_limit_mb_per_sec=job["io_limit_mb_per_sec"],
+        niceness=job["niceness"],
+        verify=job["verify_archive"],
+    )
+    return job
+
+
+def validate_jobs(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Parse and check job records; raises JobImportError listing every error."""
+    jobs: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    seen: Dict[str, int] = {}
+    for number, raw in enumerate(records, start=1):
+        if not isinstance(raw, dict):
+            errors.append(f"job {number}: not a mapping")
+            continue
+        try:
+            job = _parse_job(raw)
+        except ValueError as exc:
+            label = raw.get("name") or f"job {number}"
+            errors.append(f"{label} (job {number}): {exc}")
+            continue
+        if job["name"] in seen:
+            errors.append(
+                f"{job['name']} (job {number}): same name as job {seen[job['name']]}"
+            )
+            continue
+        seen[job["name"]] = number
+        jobs.append(job)
+    if errors:
+        raise JobImportError(errors)
+    return jobs
+
+
+def import_jobs(
+    db: Session,
+    records: Iterable[Dict[str, Any]],
+    dry_run: bool = False,
+) -> ImportResult:
+    """
+    Create or update jobs from their definitions, matched by name.
+
+    Everything is validated first; then all rows are written with one bulk
+    INSERT and one bulk UPDATE in a single transaction, and one "jobs" change
+    is published for the whole batch (the scheduler reloads once). Fields
+    missing from a record are reset to their default on update.
+
+    Raises JobImportError when a record is invalid or a name matches several
+    existing jobs; nothing is written then.
+    """
+    jobs = validate_jobs(records)
+    result = ImportResult()
+
+    existing: Dict[str, int] = {}
+    duplicates: List[str] = []
+    for job_id, name in db.execute(select(BackupJob.id, BackupJob.name)):
+        if name in existing:
+            duplicates.append(name)
+        existing[name] = job_id
+
+    wanted = {job["name"] for job in jobs}
+    ambiguous = sorted(set(duplicates) & wanted)
+    if ambiguous:
+        raise JobImportError(
+            [f"{name}: several existing jobs have this name" for name in ambiguous]
+        )
+
+    new_rows = [job for job in jobs if job["name"] not in existing]
+    changed_rows = [
+        {"id": existing[job["name"]], **job} for job in jobs if job["name"] in existing
+    ]
+    result.created = len(new_rows)
+    result.updated = len(changed_rows)
+    if dry_run or not jobs:
+        return result
+
+    if new_rows:
+        db.execute(insert(BackupJob), new_rows)
+    if changed_rows:
+        db.execute(update(BackupJob), changed_rows)
+    publish_change(db, "jobs", 0)
+    db.commit()
+    logger.info(
+        "Imported jobs: %s created, %s updated",
+        result.created,
+        result.updated,
+    )
+    return result
+
+
+def export_jobs(db: Session) -> List[Dict[str, Any]]:
+    """All job definitions, in the format accepted by import_jobs()."""
+    columns = [getattr(BackupJob, name) for name in JOB_FIELDS]
+    rows = db.execute(select(*columns).order_by(BackupJob.id))
+    return [dict(zip(JOB_FIELDS, row, strict=True)) for row in rows]
+
+
+# ----------------------------------------------------------------------
+# File formats
+# ----------------------------------------------------------------------
+def _yaml() -> Any:
+    try:
+        import yaml  # type: ignore[import-untyped]
+    except ImportError as exc:
+        raise RuntimeError(
+            "YAML job files need PyYAML (pip install 'autobackup-manager[yaml]')"
+        ) from exc
+    return yaml
+
+
+def format_for(path: str, explicit: Optional[str] = None) -> str:
+    """File format from --format or the file extension (default: json)."""
+    if explicit:
+        return explicit
+    suffix = Path(path).suffix.lower().lstrip(".")
+    if suffix == "yml":
+        return "yaml"
+    return suffix if suffix in FORMATS else "json"
+
+
+def read_jobs(stream: TextIO, fmt: str) -> List[Dict[str, Any]]:
+    """Job records from a YAML/JSON list (or {"jobs": [...]}) or a CSV file."""
+    if fmt == "csv":
+        return list(csv.DictReader(stream))
+    if fmt == "yaml":
+        yaml = _yaml()
+        # The C loader (with libyaml) is several times faster on big files.
+        data = yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+    else:
+        data = json.load(stream)
+    if isinstance(data, dict) and "jobs" in data:
+        data = data["jobs"]
+    if not isinstance(data, list):
+        raise JobImportError(["the file must hold a list of jobs"])
+    return data
+
+
+def write_jobs(stream: TextIO, jobs: List[Dict[str, Any]], fmt: str) -> None:
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=list(JOB_FIELDS))
+        writer.writeheader()
+        for job in jobs:
+            writer.writerow({k: "" if v is None else v for k, v in job.items()})
+    elif fmt == "yaml":
+        yaml = _yaml()
+        yaml.dump(
+            jobs,
+            stream,
+            Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+            sort_keys=False,
+            allow_unicode=True,
+        )
+    else:
+        json.dump(jobs, stream, indent=2, ensure_ascii=False)
+        stream.write("\n")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Import or export AutoBackup job definitions in bulk.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="create or update jobs")
+    import_parser.add_argument("file", help="job file, or - for stdin")
+    import_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="validate and report, write nothing",
+    )
+    export_parser = commands.add_parser("export", help="write all jobs")
+    export_parser.add_argument("file", nargs="?", default="-", help="default stdout")
+    for sub in (import_parser, export_parser):
+        sub.add_argument("--format", choices=FORMATS, help="default: from extension")
+    args = parser.parse_args(argv)
+
+    from autobackup.db import SessionLocal, engine, upgrade_schema
+
+    logging.basicConfig(level=logging.INFO)
+    upgrade_schema(engine)
+    fmt = format_for(args.file, args.format)
+
+    db = SessionLocal()
+    try:
+        if args.command == "export":
+            jobs = export_jobs(db)
+            if args.file == "-":
+                write_jobs(sys.stdout, jobs, fmt)
+            else:
+                with open(args.file, "w", encoding="utf-8", newline="") as stream:
+                    write_jobs(stream, jobs, fmt)
+            logger.info("Exported %s jobs", len(jobs))
+            return 0
+
+        try:
+            if args.file == "-":
+                records = read_jobs(sys.stdin, fmt)
+            else:
+                with open(args.file, encoding="utf-8", newline="") as stream:
+                    records = read_jobs(stream, fmt)
+            result = import_jobs(db, records, args.dry_run)
+        except JobImportError as exc:
+            for error in exc.errors:
+                print(error, file=sys.stderr)
+            print(exc, file=sys.stderr)
+            return 1
+        print(
+            f"{'Would create' if args.dry_run else 'Created'} {result.created}, "
+            f"{'update' if args.dry_run else 'updated'} {result.updated} jobs"
+        )
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
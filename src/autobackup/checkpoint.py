@@ -0,0 +1,186 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+import os
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.db import SessionLocal
+from autobackup.models import BackupRun
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Checkpoint:
+    """The last sealed segment of a partially written archive.
+
+    ``offset`` is where the archived entries end (and the central directory
+    starts); ``size`` is the size of the sealed archive, directory included.
+    """
+
+    segment: int
+    offset: int
+    size: int
+    files_done: int
+
+
+def directory_copy_path(archive: Path, segment: int) -> Path:
+    """Sidecar file holding the central directory of a sealed segment."""
+    return archive.with_name(f"{archive.name}.seg{segment:05d}.dir")
+
+
+def discard_checkpoint_files(archive: Path) -> None:
+    """Remove the directory copies of an archive (finished or abandoned)."""
+    for path in archive.parent.glob(f"{archive.name}.seg*.dir"):
+        path.unlink(missing_ok=True)
+
+
+def _fsync_path(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ArchiveCheckpointer:
+    """Seals a zip archive every ``segment_bytes`` of input and records it.
+
+    Sealing closes the ZipFile, which writes the central directory: the file
+    on disk is then a complete, valid archive of everything written so far.
+    Writing continues in append mode, which overwrites that directory with
+    the next entries, so a copy of it is kept next to the archive first.
+    After a crash the archive is cut back to the end of the sealed entries
+    and the copy appended again (see restore_archive).
+
+    ``on_seal`` is called with each new Checkpoint once it is durable; it
+    must persist it (store_checkpoint).
+    """
+
+    def __init__(
+        self,
+        archive: Path,
+        on_seal: Callable[[Checkpoint], None],
+        segment_bytes: int,
+        segment: int = 0,
+    ) -> None:
+        self.archive = archive
+        self.segment_bytes = segment_bytes
+        self.segment = segment
+        self._on_seal = on_seal
+
+    def due(self, bytes_in_segment: int) -> bool:
+        return self.segment_bytes > 0 and bytes_in_segment >= self.segment_bytes
+
+    def seal(self, zf: zipfile.ZipFile, files_done: int) -> None:
+        """Close ``zf`` and make its content a durable checkpoint."""
+        offset = zf.start_dir
+        zf.close()
+        _fsync_path(self.archive)
+
+        with open(self.archive, "rb") as fh:
+            fh.seek(offset)
+            directory = fh.read()
+
+        segment = self.segment + 1
+        copy_path = directory_copy_path(self.archive, segment)
+        tmp_path = copy_path.with_name(copy_path.name + ".tmp")
+        with open(tmp_path, "wb") as fh:
+            fh.write(directory)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, copy_path)
+
+        try:
+            self._on_seal(
+                Checkpoint(segment, offset, offset + len(directory), files_done)
+            )
+        except Exception as exc:  # noqa: BLE001
+            # Not fatal: a crash now resumes from the previous checkpoint.
+            logger.warning("Could not store checkpoint of %s: %s", self.archive, exc)
+            copy_path.unlink(missing_ok=True)
+            return
+
+        # The previous copy is only dropped once the new checkpoint is stored.
+        if self.segment:
+            directory_copy_path(self.archive, self.segment).unlink(missing_ok=True)
+        self.segment = segment
+
+
+def restore_archive(archive: Path, checkpoint: Checkpoint) -> bool:
+    """
+    Bring a partial archive back to the state of ``checkpoint``.
+
+    Drops whatever was written after the last sealed segment and puts its
+    central directory back. Returns False if the archive or the directory
+    copy is missing or does not match the checkpoint.
+    """
+    copy_path = directory_copy_path(archive, checkpoint.segment)
+    try:
+        directory = copy_path.read_bytes()
+        if (
+            checkpoint.offset + len(directory) != checkpoint.size
+            or archive.stat().st_size < checkpoint.offset
+        ):
+            return False
+        with open(archive, "r+b") as fh:
+            fh.truncate(checkpoint.offset)
+            fh.seek(checkpoint.offset)
+            fh.write(directory)
+            fh.flush()
+            os.fsync(fh.fileno())
+        with zipfile.ZipFile(archive) as zf:
+            if len(zf.infolist()) != checkpoint.files_done:
+                return False
+    except (OSError, zipfile.BadZipFile) as exc:
+        logger.warning("Cannot restore checkpoint of %s: %s", archive, exc)
+        return False
+    return True
+
+
+def load_checkpoint(run: BackupRun) -> Optional[Checkpoint]:
+    if (
+        run.checkpoint_segment is None
+        or run.checkpoint_offset is None
+        or run.checkpoint_size is None
+    ):
+        return None
+    return Checkpoint(
+        segment=run.checkpoint_segment,
+        offset=run.checkpoint_offset,
+        size=run.checkpoint_size,
+        files_done=run.checkpoint_files_done or 0,
+    )
+
+
+def store_checkpoint(
+    run_id: int,
+    session_factory: sessionmaker[Session] = SessionLocal,
+) -> Callable[[Checkpoint], None]:
+    """on_seal callback that saves checkpoints on the run, in its own session."""
+
+    def on_seal(checkpoint: Checkpoint) -> None:
+        db = session_factory()
+        try:
+            db.execute(
+                update(BackupRun)
+                .where(BackupRun.id == run_id)
+                .values(
+                    checkpoint_segment=checkpoint.segment,
+                    checkpoint_offset=checkpoint.offset,
+                    checkpoint_size=checkpoint.size,
+                    checkpoint_files_done=checkpoint.files_done,
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    return on_seal
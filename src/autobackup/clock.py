@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from datetime import date, datetime, time, timezone
+from typing import Optional
+
+import pytz
+
+from autobackup.config import settings
+
+LOCAL_TZ = pytz.timezone(settings.time_zone)
+
+
+def db_now() -> datetime:
+    """
+    The current time as stored in DateTime columns: naive UTC. PostgreSQL
+    would shift an aware value to the server time zone while SQLite would drop
+    the offset, so every stored timestamp (column defaults included) is taken
+    here. UTC has no DST gaps or repeated hours, so stored values compare and
+    subtract correctly; TIME_ZONE is only used to show them (see to_local()).
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def as_aware(value: datetime) -> datetime:
+    """A stored (naive UTC) timestamp as an aware datetime."""
+    if value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def to_local(value: datetime) -> datetime:
+    """A stored timestamp in TIME_ZONE, for display."""
+    return as_aware(value).astimezone(LOCAL_TZ)
+
+
+def format_local(value: Optional[datetime], fmt: str = "%Y-%m-%d %H:%M:%S") -> str:
+    """A stored timestamp shown in TIME_ZONE, or "" when there is none."""
+    return to_local(value).strftime(fmt) if value is not None else ""
+
+
+def local_midnight(day: date) -> datetime:
+    """Start of ``day`` in TIME_ZONE, as a stored (naive UTC) timestamp."""
+    midnight = LOCAL_TZ.localize(datetime.combine(day, time.min), is_dst=False)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def seconds_between(
+    start: Optional[datetime], end: Optional[datetime]
+) -> Optional[float]:
+    """Elapsed seconds between two stored timestamps."""
+    if start is None or end is None:
+        return None
+    return max(0.0, (as_aware(end) - as_aware(start)).total_seconds())
@@ -0,0 +1,166 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import SessionLocal, upsert_insert
+from autobackup.models import JobFiring, SchedulerNode
+
+logger = logging.getLogger(__name__)
+
+# Firing claims are only needed around ownership changes; keep a week.
+FIRING_CLAIM_RETENTION = timedelta(days=7)
+_PRUNE_EVERY_HEARTBEATS = 360
+
+
+def default_node_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def _score(node_id: str, job_id: int) -> bytes:
+    # hashlib, not hash(): the result must be identical in every process.
+    return hashlib.sha1(f"{node_id}:{job_id}".encode()).digest()
+
+
+class ClusterMembership:
+    """Node registration and job partitioning for multi-node scheduling.
+
+    Every node upserts its row in scheduler_nodes on each heartbeat; nodes
+    whose heartbeat is older than ``ttl_seconds`` are considered dead. Jobs are
+    assigned to live nodes with rendezvous hashing, so when a node joins or
+    dies only the jobs it owned (or will own) move.
+
+    Ownership alone can overlap briefly while nodes notice a membership change,
+    so each scheduled firing is also claimed in job_firings; the primary key
+    on (job_id, scheduled_at) lets exactly one node run it.
+    """
+
+    def __init__(
+        self,
+        node_id: Optional[str] = None,
+        ttl_seconds: Optional[float] = None,
+        session_factory: sessionmaker[Session] = SessionLocal,
+    ) -> None:
+        self.node_id = node_id or settings.cluster_node_id or default_node_id()
+        self._ttl = timedelta(
+            seconds=ttl_seconds or settings.cluster_node_ttl_seconds,
+        )
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._live_nodes: List[str] = [self.node_id]
+        self._heartbeats = 0
+
+    @property
+    def live_nodes(self) -> List[str]:
+        with self._lock:
+            return list(self._live_nodes)
+
+    def heartbeat(self) -> bool:
+        """Renew this node's lease and refresh the live node list.
+
+        Returns True when the set of live nodes changed (jobs must be
+        re-partitioned).
+        """
+        now = db_now()
+        db = self._session_factory()
+        try:
+            table = SchedulerNode.__table__
+            stmt = upsert_insert(db)(table).values(
+                node_id=self.node_id,
+                hostname=socket.gethostname(),
+                started_at=now,
+                heartbeat_at=now,
+            )
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.node_id],
+                    set_={"heartbeat_at": now},
+                )
+            )
+
+            live = sorted(
+                db.execute(
+                    select(SchedulerNode.node_id).where(
+                        SchedulerNode.heartbeat_at >= now - self._ttl
+                    )
+                ).scalars()
+            )
+
+            self._heartbeats += 1
+            if self._heartbeats % _PRUNE_EVERY_HEARTBEATS == 1:
+                db.execute(
+                    delete(SchedulerNode).where(
+                        SchedulerNode.heartbeat_at < now - self._ttl * 10
+                    )
+                )
+                db.execute(
+                    delete(JobFiring).where(
+                        JobFiring.claimed_at < now - FIRING_CLAIM_RETENTION
+                    )
+                )
+            db.commit()
+        finally:
+            db.close()
+
+        if self.node_id not in live:
+            live = sorted([*live, self.node_id])
+
+        with self._lock:
+            changed = live != self._live_nodes
+            self._live_nodes = live
+
+        if changed:
+            logger.info("Cluster membership changed: %s", ", ".join(live))
+        return changed
+
+    def owns(self, job_id: int) -> bool:
+        """True if this node is responsible for scheduling ``job_id``."""
+        nodes = self.live_nodes
+        owner = max(nodes, key=lambda node: _score(node, job_id))
+        return owner == self.node_id
+
+    def claim_firing(self, job_id: int, scheduled_at: datetime) -> bool:
+        """Atomically claim one scheduled firing. Only one node gets True."""
+        db = self._session_factory()
+        try:
+            table = JobFiring.__table__
+            stmt = (
+                upsert_insert(db)(table)
+                .values(
+                    job_id=job_id,
+                    scheduled_at=scheduled_at,
+                    node_id=self.node_id,
+                    claimed_at=db_now(),
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[table.c.job_id, table.c.scheduled_at],
+                )
+            )
+            claimed = db.execute(stmt).rowcount == 1
+            db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def leave(self) -> None:
+        """Drop this node's lease so others take over its jobs immediately."""
+        db = self._session_factory()
+        try:
+            db.execute(
+                delete(SchedulerNode).where(SchedulerNode.node_id == self.node_id)
+            )
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,143 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.orm import Session
+
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.models import BackupRun, BackupRunDestination
+from autobackup.stats import record_compacted_runs
+from autobackup.storage import backend_for
+
+logger = logging.getLogger(__name__)
+
+
+def _delete_runs(db: Session, run_ids: List[int]) -> int:
+    """Delete one batch of runs and count them on their daily summary rows."""
+    db.execute(
+        delete(BackupRunDestination)
+        .where(BackupRunDestination.run_id.in_(run_ids))
+        .execution_options(synchronize_session=False)
+    )
+    deleted = db.execute(
+        delete(BackupRun)
+        .where(BackupRun.id.in_(run_ids))
+        .returning(BackupRun.job_id, BackupRun.start_time)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    counts = Counter((job_id, start.date()) for job_id, start in deleted if start)
+    record_compacted_runs(db, dict(counts))
+    db.commit()
+    return len(deleted)
+
+
+def compact_run_history(
+    db: Session,
+    older_than_days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> int:
+    """
+    Remove detailed runs older than the cutoff whose archives no longer exist.
+
+    Counts, bytes, durations and the last error of every run are already in
+    the per-job, per-day rows of backup_daily_stats (maintained when each run
+    finishes), so the detailed rows can go once they no longer point to an
+    archive. Work is done in batches of ``batch_size`` rows, each in its own
+    short transaction, so compaction never holds locks for long.
+
+    Returns the number of runs removed.
+    """
+    older_than_days = (
+        settings.history_compact_after_days
+        if older_than_days is None
+        else older_than_days
+    )
+    batch_size = batch_size or settings.history_compact_batch_size
+    if older_than_days <= 0:
+        return 0
+
+    cutoff = (now or db_now()) - timedelta(days=older_than_days)
+    removed = 0
+
+    # Finished runs that never produced an archive. Running and queued runs
+    # are left to recovery and retention, whatever their age: a resumed run
+    # keeps its original start_time.
+    while True:
+        run_ids = list(
+            db.execute(
+                select(BackupRun.id)
+                .where(
+                    BackupRun.start_time < cutoff,
+                    or_(
+                        BackupRun.status.in_(("error", "cancelled")),
+                        and_(
+                            BackupRun.status == "success",
+                            BackupRun.output_file.is_(None),
+                        ),
+                    ),
+                )
+                .order_by(BackupRun.id)
+                .limit(batch_size)
+            ).scalars()
+        )
+        if not run_ids:
+            break
+        removed += _delete_runs(db, run_ids)
+
+    # Successful runs none of whose copies exists any more (on disk or in the
+    # bucket). A run written to several destinations keeps its row while any
+    # copy is left, so that copy is still deleted by retention with the run.
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(BackupRun.id, BackupRun.output_file)
+            .where(
+                BackupRun.start_time < cutoff,
+                BackupRun.status == "success",
+                BackupRun.output_file.is_not(None),
+                BackupRun.id > last_id,
+            )
+            .order_by(BackupRun.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            db.rollback()
+            break
+        locations = {row.id: {row.output_file} for row in rows}
+        copies = db.execute(
+            select(BackupRunDestination.run_id, BackupRunDestination.output_file)
+            .where(
+                BackupRunDestination.run_id.in_(list(locations)),
+                BackupRunDestination.output_file.is_not(None),
+            )
+        ).all()
+        db.rollback()  # end the read transaction before touching the disk
+        for run_id, output_file in copies:
+            locations[run_id].add(output_file)
+
+        last_id = rows[-1].id
+        missing = [
+            run_id
+            for run_id, run_locations in locations.items()
+            if not any(
+                backend_for(location).exists(location) for location in run_locations
+            )
+        ]
+        if missing:
+            removed += _delete_runs(db, missing)
+
+    if removed:
+        logger.info(
+            "Compaction: removed %s detailed runs older than %s days",
+            removed,
+            older_than_days,
+        )
+    return removed
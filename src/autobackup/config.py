@@ -3,23 +3,182 @@ from dataclasses import dataclass
 
 from dotenv import load_dotenv
 
-
 load_dotenv()
 
 
 @dataclass
 class Settings:
     app_env: str = os.getenv("APP_ENV", "dev")
+
+    # "postgresql" (default) or "sqlite" for single-machine installs.
+    # DATABASE_URL, when set, takes precedence over everything below.
+    db_backend: str = os.getenv("DB_BACKEND", "postgresql").lower()
+    db_url: str = os.getenv("DATABASE_URL", "")
+    sqlite_path: str = os.getenv("SQLITE_PATH", "autobackup.db")
+    sqlite_busy_timeout_ms: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+    # SQLite has no LISTEN/NOTIFY: job changes made by other processes (e.g.
+    # the bulk import CLI) are picked up by polling a counter (0 = off). The
+    # delay doubles up to the max while nothing changes.
+    sqlite_change_poll_seconds: float = float(
+        os.getenv("SQLITE_CHANGE_POLL_SECONDS", "5")
+    )
+    sqlite_change_poll_max_seconds: float = float(
+        os.getenv("SQLITE_CHANGE_POLL_MAX_SECONDS", "60")
+    )
+    db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "0"))  # 0 = per-backend default
+
     db_host: str = os.getenv("DB_HOST", "localhost")
     db_port: int = int(os.getenv("DB_PORT", "5432"))
     db_name: str = os.getenv("DB_NAME", "autobackup_db")
     db_user: str = os.getenv("DB_USER", "autobackup")
     db_password: str = os.getenv("DB_PASSWORD", "autobackup")
     
+    # Time zone timestamps are shown in; they are stored in UTC (see clock.py).
+    time_zone: str = os.getenv("TIME_ZONE", "Europe/Luxembourg")
+
     max_backups_per_job: int = int(os.getenv("MAX_BACKUPS_PER_JOB", "20"))
+    # Failed and cancelled runs, and runs stuck in "running" or "queued", are
+    # pruned by age (0 = keep).
+    error_run_retention_days: int = int(os.getenv("ERROR_RUN_RETENTION_DAYS", "30"))
+    stale_running_hours: int = int(os.getenv("STALE_RUNNING_HOURS", "48"))
+    # Retention runs as a background sweep, not after each backup. Old archive
+    # files are unlinked by a small pool, capped at the given rate (0 = no cap).
+    retention_sweep_minutes: int = int(os.getenv("RETENTION_SWEEP_MINUTES", "15"))
+    retention_job_batch_size: int = int(os.getenv("RETENTION_JOB_BATCH_SIZE", "500"))
+    retention_delete_workers: int = int(os.getenv("RETENTION_DELETE_WORKERS", "2"))
+    retention_delete_mb_per_sec: float = float(
+        os.getenv("RETENTION_DELETE_MB_PER_SEC", "200")
+    )
+
+    # Runs older than this (0 = never) without an archive on disk are folded
+    # into the daily summary rows by a background job.
+    history_compact_after_days: int = int(
+        os.getenv("HISTORY_COMPACT_AFTER_DAYS", "90")
+    )
+    history_compact_batch_size: int = int(
+        os.getenv("HISTORY_COMPACT_BATCH_SIZE", "1000")
+    )
+    history_compact_interval_hours: int = int(
+        os.getenv("HISTORY_COMPACT_INTERVAL_HOURS", "6")
+    )
+
+    # Cluster mode: several scheduler nodes share one database and split the
+    # jobs between them. A node is dead once its heartbeat is older than the TTL.
+    cluster_mode: bool = os.getenv("CLUSTER_MODE", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    cluster_node_id: str = os.getenv("CLUSTER_NODE_ID", "")
+    cluster_heartbeat_seconds: float = float(
+        os.getenv("CLUSTER_HEARTBEAT_SECONDS", "10")
+    )
+    cluster_node_ttl_seconds: float = float(os.getenv("CLUSTER_NODE_TTL_SECONDS", "30"))
+
+    # At most MAX_CONCURRENT_RUNS backups run at once (0 = no limit); further
+    # runs wait in a queue, API runs ahead of scheduled ones (see run_queue.py).
+    # At most RUN_QUEUE_MAX_QUEUED runs requested through the API may wait.
+    max_concurrent_runs: int = int(os.getenv("MAX_CONCURRENT_RUNS", "10"))
+    run_queue_max_queued: int = int(os.getenv("RUN_QUEUE_MAX_QUEUED", "100"))
+
+    # Local HTTP/JSON control API (see api.py), off when API_PORT is 0. When
+    # API_TOKEN is set, requests must send "Authorization: Bearer <token>".
+    api_host: str = os.getenv("API_HOST", "127.0.0.1")
+    api_port: int = int(os.getenv("API_PORT", "0"))
+    api_token: str = os.getenv("API_TOKEN", "")
+
+    # Per-job performance baselines over the last BASELINE_WINDOW_RUNS
+    # successful runs (see baselines.py). Once a job has BASELINE_MIN_RUNS of
+    # them, a run is flagged as a regression when it takes more than
+    # REGRESSION_FACTOR times the p95 duration and at least
+    # REGRESSION_MIN_SECONDS more than the p50.
+    baseline_window_runs: int = int(os.getenv("BASELINE_WINDOW_RUNS", "30"))
+    baseline_min_runs: int = int(os.getenv("BASELINE_MIN_RUNS", "5"))
+    regression_factor: float = float(os.getenv("REGRESSION_FACTOR", "1.5"))
+    regression_min_seconds: float = float(os.getenv("REGRESSION_MIN_SECONDS", "30"))
+
+    # How often the progress snapshot of a running backup is stored.
+    progress_flush_seconds: float = float(os.getenv("PROGRESS_FLUSH_SECONDS", "3"))
+
+    # Archives are sealed and checkpointed every CHECKPOINT_SEGMENT_MB of
+    # source data (0 = off). Runs interrupted by a crash are resumed from their
+    # last checkpoint at startup, at most MAX_RESUME_ATTEMPTS times.
+    checkpoint_segment_mb: int = int(os.getenv("CHECKPOINT_SEGMENT_MB", "256"))
+    max_resume_attempts: int = int(os.getenv("MAX_RESUME_ATTEMPTS", "3"))
+
+    # Read-ahead: this many threads read upcoming files up to
+    # READAHEAD_SMALL_FILE_KB whole (one read() each) while earlier ones are
+    # compressed, holding at most READAHEAD_BUFFER_MB ahead. 0 workers = inline.
+    readahead_workers: int = int(os.getenv("READAHEAD_WORKERS", "8"))
+    readahead_buffer_mb: int = int(os.getenv("READAHEAD_BUFFER_MB", "64"))
+    readahead_small_file_kb: int = int(os.getenv("READAHEAD_SMALL_FILE_KB", "1024"))
+
+    # Sparse source files (VM images, database files) are read region by
+    # region with SEEK_DATA/SEEK_HOLE, skipping their holes (Linux).
+    sparse_files: bool = os.getenv("SPARSE_FILES", "true").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Jobs with source type "pg_dump" run this binary with these arguments,
+    # plus --dbname=<source path>, unless the job has its own command.
+    pg_dump_binary: str = os.getenv("PG_DUMP_BINARY", "pg_dump")
+    pg_dump_args: str = os.getenv("PG_DUMP_ARGS", "--format=custom --compress=0")
+
+    # Files of at least DELTA_MIN_FILE_MB (0 = off) are stored as rsync-style
+    # deltas against the previous archive of the job (single local destination
+    # only), in blocks of DELTA_BLOCK_KB. A file is stored whole again when
+    # more than DELTA_MAX_LITERAL_PERCENT of it changed, and every archive
+    # after DELTA_MAX_CHAIN deltas in a row is a full one.
+    delta_min_file_mb: int = int(os.getenv("DELTA_MIN_FILE_MB", "0"))
+    delta_block_kb: int = int(os.getenv("DELTA_BLOCK_KB", "64"))
+    delta_max_literal_percent: int = int(os.getenv("DELTA_MAX_LITERAL_PERCENT", "50"))
+    delta_max_chain: int = int(os.getenv("DELTA_MAX_CHAIN", "7"))
+
+    # Recycle mode: files whose size, mtime and inode are those recorded in the
+    # previous archive of the job are copied from it still compressed, without
+    # reading them; only changed files are compressed. Archives stay complete.
+    recycle_unchanged: bool = os.getenv("RECYCLE_UNCHANGED", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+    # Jobs with several destinations: how far (in MB) a slow destination may
+    # fall behind the archive stream before the backup waits for it.
+    tee_buffer_limit_mb: int = int(os.getenv("TEE_BUFFER_LIMIT_MB", "64"))
+
+    # Destinations of the form s3://bucket/prefix (S3 or S3-compatible, e.g.
+    # MinIO). Credentials come from the usual AWS_* variables. Archives are
+    # uploaded while they are written, in parts of S3_PART_SIZE_MB, with at most
+    # S3_UPLOAD_CONCURRENCY parts in memory / in flight.
+    s3_endpoint_url: str = os.getenv("S3_ENDPOINT_URL", "")
+    s3_region: str = os.getenv("S3_REGION", "")
+    s3_part_size_mb: int = int(os.getenv("S3_PART_SIZE_MB", "16"))
+    s3_upload_concurrency: int = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+    s3_part_retries: int = int(os.getenv("S3_PART_RETRIES", "3"))
+
+    # Span tracing of scheduled runs (scheduler, engine phases, retention, DB
+    # statements), appended to TRACE_FILE one trace per line; empty = off.
+    # TRACE_FORMAT is "jsonl" or "otlp" (OTLP/JSON, for an OTel collector).
+    trace_file: str = os.getenv("TRACE_FILE", "")
+    trace_sample_rate: float = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+    trace_format: str = os.getenv("TRACE_FORMAT", "jsonl")
+
+    # "on_change" jobs: wait this long after the last change before running,
+    # but never let a continuously changing source wait longer than the max.
+    on_change_settle_seconds: float = float(os.getenv("ON_CHANGE_SETTLE_SECONDS", "30"))
+    on_change_max_delay_minutes: int = int(
+        os.getenv("ON_CHANGE_MAX_DELAY_MINUTES", "60")
+    )
 
     @property
     def database_url(self) -> str:
+        if self.db_url:
+            return self.db_url
+        if self.db_backend == "sqlite":
+            return f"sqlite:///{self.sqlite_path}"
         return (
             f"postgresql+psycopg2://"
             f"{self.db_user}:{self.db_password}"
@@ -1,14 +1,83 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import logging
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateColumn
 
 from autobackup.config import settings
 
+logger = logging.getLogger(__name__)
 
-engine = create_engine(
-    settings.database_url,
-    echo=False,
-    future=True,
-)
+
+def is_sqlite_url(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _set_sqlite_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    """Per-connection SQLite setup: WAL so readers never block the writer."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode and avoids
+        # an fsync per commit.
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-20000")  # ~20 MB
+    finally:
+        cursor.close()
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """Pool settings tuned for each backend."""
+    if is_sqlite_url(url):
+        database = make_url(url).database
+        connect_args = {
+            "check_same_thread": False,
+            "timeout": settings.sqlite_busy_timeout_ms / 1000,
+        }
+        if not database or database == ":memory:":
+            # A single shared connection, otherwise every checkout would see
+            # a different empty database.
+            return {"connect_args": connect_args, "poolclass": StaticPool}
+
+        # SQLite has a single writer; a few connections are enough for the
+        # GUI plus concurrent scheduled runs, more only add lock waits.
+        return {
+            "connect_args": connect_args,
+            "pool_size": settings.db_pool_size or 5,
+            "max_overflow": 5,
+        }
+
+    return {
+        # One session per scheduled firing (APScheduler runs up to 10 at once)
+        # plus the GUI.
+        "pool_size": settings.db_pool_size or 10,
+        "max_overflow": 10,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+
+
+def create_db_engine(url: str) -> Engine:
+    """Create an Engine for a PostgreSQL or SQLite URL with backend tuning."""
+    new_engine = create_engine(
+        url,
+        echo=False,
+        future=True,
+        **_engine_options(url),
+    )
+    if is_sqlite_url(url):
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+engine = create_db_engine(settings.database_url)
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -20,6 +89,16 @@ SessionLocal = sessionmaker(
 Base = declarative_base()
 
 
+def upsert_insert(db: Session) -> Any:
+    """Return the dialect-specific insert() that supports ON CONFLICT."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Unsupported database dialect for upserts: {dialect}")
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -27,3 +106,27 @@ def get_db():
     finally:
         db.close()
 
+
+def upgrade_schema(bind: Engine) -> None:
+    """
+    Create missing tables, then add missing columns and indexes in place.
+
+    create_all() only creates whole tables, so databases created by an older
+    version would otherwise never get new columns or indexes. New columns must
+    be nullable or have a server default.
+    """
+    Base.metadata.create_all(bind=bind)
+
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+                logger.info("Added column %s.%s", table.name, column.name)
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
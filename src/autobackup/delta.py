@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import struct
+import zipfile
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+from autobackup.sparse import find_extra_field
+
+logger = logging.getLogger(__name__)
+
+# Zip extra field of a delta entry. Its data is a list of operations that
+# rebuild the file from the same entry of the base archive (in the same
+# folder): <H id> <H size> <Q file size> <I block size> <H n> <n bytes name>
+DELTA_EXTRA_ID = 0x6474
+_DELTA_HEADER = struct.Struct("<QIH")
+DELTA_COMMENT = b"autobackup delta entry: restore with python -m autobackup.restore"
+
+# Operations: copy ``count`` blocks of the base starting at ``first``, or
+# insert ``length`` literal bytes that follow.
+_OP_COPY = 1
+_OP_LITERAL = 2
+_COPY = struct.Struct("<BII")
+_LITERAL = struct.Struct("<BI")
+# Literal data is written out in pieces of at most this size.
+LITERAL_FLUSH = 1024 * 1024
+# In a changed region, the byte-by-byte search (slow, in Python) runs over the
+# first ROLLING_BLOCKS blocks, then over one block in RESCAN_BLOCKS; the others
+# are only checked where they are aligned.
+ROLLING_BLOCKS = 4
+RESCAN_BLOCKS = 16
+
+SIGNATURE_SUFFIX = ".sig"
+_SIG_HEADER = struct.Struct("<IQ")  # block size, file size
+_BLOCK_SIG = struct.Struct("<I16s")  # adler32, blake2b-128
+_ADLER_MOD = 65521
+
+
+class DeltaTooLarge(Exception):
+    """The file changed too much for a delta to be worth it."""
+
+
+def signature_path(archive: Path) -> Path:
+    """Signature cache of an archive: one member per large file."""
+    return archive.with_name(archive.name + SIGNATURE_SUFFIX)
+
+
+def _strong(block: bytes) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+@dataclass
+class Signature:
+    """Per-block checksums of one version of a file (rsync style)."""
+
+    block_size: int
+    file_size: int
+    blocks: List[Tuple[int, bytes]] = field(default_factory=list)
+
+    def to_bytes(self) -> bytes:
+        parts = [_SIG_HEADER.pack(self.block_size, self.file_size)]
+        parts.extend(_BLOCK_SIG.pack(weak, strong) for weak, strong in self.blocks)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Signature":
+        block_size, file_size = _SIG_HEADER.unpack_from(data)
+        blocks = [
+            _BLOCK_SIG.unpack_from(data, offset)
+            for offset in range(_SIG_HEADER.size, len(data), _BLOCK_SIG.size)
+        ]
+        return cls(block_size, file_size, blocks)
+
+    def weak_index(self) -> Dict[int, List[int]]:
+        """Weak checksum -> block numbers, for full-size blocks only."""
+        index: Dict[int, List[int]] = {}
+        full = self.file_size // self.block_size
+        for number, (weak, _) in enumerate(self.blocks[:full]):
+            index.setdefault(weak, []).append(number)
+        return index
+
+
+class BlockHasher:
+    """Builds the Signature of a stream fed in chunks of any size."""
+
+    def __init__(self, block_size: int) -> None:
+        self._signature = Signature(block_size, 0)
+        self._pending = bytearray()
+
+    def _add(self, block: bytes) -> None:
+        self._signature.blocks.append((zlib.adler32(block), _strong(block)))
+
+    def update(self, data: bytes) -> None:
+        size = self._signature.block_size
+        self._signature.file_size += len(data)
+        view = memoryview(data)
+        pos = 0
+        if self._pending:
+            pos = size - len(self._pending)
+            self._pending += view[:pos]
+            if len(self._pending) < size:
+                return
+            self._add(bytes(self._pending))
+            self._pending.clear()
+        while pos + size <= len(view):
+            self._add(view[pos : pos + size])
+            pos += size
+        self._pending += view[pos:]
+
+    def finish(self) -> Signature:
+        if self._pending:
+            self._add(bytes(self._pending))
+            self._pending.clear()
+        return self._signature
+
+
+def write_delta(
+    src: BinaryIO,
+    base: Signature,
+    out: BinaryIO,
+    hasher: BlockHasher,
+    max_literal: int,
+    on_read: Optional[Callable[[int], None]] = None,
+    read_size: int = 1024 * 1024,
+) -> int:
+    """
+    Write the operations that turn the base version into ``src`` to ``out``.
+
+    Blocks of the base are found anywhere in the new data with a rolling
+    weak checksum (adler32), confirmed with a strong hash. Unchanged regions
+    cost one checksum per block; changed regions are scanned byte by byte
+    over their first ROLLING_BLOCKS blocks and one in RESCAN_BLOCKS after.
+    Everything read is also fed to ``hasher`` (the new signature).
+
+    Returns the number of literal bytes. Raises DeltaTooLarge once more than
+    ``max_literal`` bytes are literal.
+    """
+    block = base.block_size
+    index = base.weak_index()
+    strong_of = base.blocks
+
+    buf = b""
+    pos = 0  # start of the window
+    lit = 0  # start of literal data not written yet
+    eof = False
+    literal_total = 0
+    copy_run: Optional[List[int]] = None  # [first block, count]
+
+    def flush_copy() -> None:
+        nonlocal copy_run
+        if copy_run is not None:
+            out.write(_COPY.pack(_OP_COPY, copy_run[0], copy_run[1]))
+            copy_run = None
+
+    def emit_literal(end: int) -> None:
+        nonlocal lit, literal_total
+        if end <= lit:
+            return
+        flush_copy()
+        out.write(_LITERAL.pack(_OP_LITERAL, end - lit))
+        out.write(buf[lit:end])
+        literal_total += end - lit
+        lit = end
+        if literal_total > max_literal:
+            raise DeltaTooLarge()
+
+    def emit_copy(number: int) -> None:
+        nonlocal copy_run
+        if copy_run is not None and copy_run[0] + copy_run[1] == number:
+            copy_run[1] += 1
+            return
+        flush_copy()
+        copy_run = [number, 1]
+
+    def fill(need: int) -> bool:
+        """Make ``need`` bytes available from ``pos``; False at end of file."""
+        nonlocal buf, pos, lit, eof
+        if len(buf) - pos >= need:
+            return True
+        parts = [buf[lit:]]
+        available = len(buf) - pos
+        pos -= lit
+        lit = 0
+        while available < need and not eof:
+            chunk = src.read(read_size)
+            if not chunk:
+                eof = True
+                break
+            hasher.update(chunk)
+            if on_read is not None:
+                on_read(len(chunk))
+            parts.append(chunk)
+            available += len(chunk)
+        buf = b"".join(parts)
+        return len(buf) - pos >= need
+
+    def find(weak: int, window: bytes) -> Optional[int]:
+        candidates = index.get(weak)
+        if not candidates:
+            return None
+        strong = _strong(window)
+        if copy_run is not None:
+            expected = copy_run[0] + copy_run[1]
+            if expected in candidates and strong_of[expected][1] == strong:
+                return expected
+        for number in candidates:
+            if strong_of[number][1] == strong:
+                return number
+        return None
+
+    misses = 0  # blocks in a row without a match
+    while fill(block):
+        if pos - lit >= LITERAL_FLUSH:
+            emit_literal(pos)
+        window = buf[pos : pos + block]
+        weak = zlib.adler32(window)
+        number = find(weak, window)
+        if number is not None:
+            emit_literal(pos)
+            emit_copy(number)
+            pos += block
+            lit = pos
+            misses = 0
+            continue
+
+        misses += 1
+        if misses > ROLLING_BLOCKS and misses % RESCAN_BLOCKS:
+            # Inside a changed region: only aligned windows are checked, at C
+            # speed. That finds blocks changed in place; shifted data is found
+            # by the next rolling pass.
+            pos += block
+            continue
+
+        # Roll the window forward one byte at a time, for at most one block.
+        a = weak & 0xFFFF
+        b = weak >> 16
+        for _ in range(block):
+            if pos + block >= len(buf) and not fill(block + 1):
+                break
+            old = buf[pos]
+            new = buf[pos + block]
+            a = (a - old + new) % _ADLER_MOD
+            b = (b - block * old + a - 1) % _ADLER_MOD
+            pos += 1
+            weak = (b << 16) | a
+            if weak in index:
+                number = find(weak, buf[pos : pos + block])
+                if number is not None:
+                    emit_literal(pos)
+                    emit_copy(number)
+                    pos += block
+                    lit = pos
+                    misses = 0
+                    break
+
+    # Whatever is left is shorter than a block (or never matched).
+    while fill(len(buf) - pos + read_size):
+        pass
+    emit_literal(len(buf))
+    flush_copy()
+    return literal_total
+
+
+def apply_delta(delta: BinaryIO, base: BinaryIO, block_size: int, out: BinaryIO) -> int:
+    """Rebuild a file from its delta operations and base version."""
+    written = 0
+    while op := delta.read(1):
+        if op[0] == _OP_COPY:
+            first, count = struct.unpack("<II", delta.read(8))
+            base.seek(first * block_size)
+            remaining = count * block_size
+            while remaining:
+                chunk = base.read(min(remaining, LITERAL_FLUSH))
+                if not chunk:
+                    raise zipfile.BadZipFile("Delta refers past the end of its base")
+                out.write(chunk)
+                remaining -= len(chunk)
+                written += len(chunk)
+        elif op[0] == _OP_LITERAL:
+            (length,) = struct.unpack("<I", delta.read(4))
+            data = delta.read(length)
+            if len(data) != length:
+                raise zipfile.BadZipFile("Truncated delta entry")
+            out.write(data)
+            written += length
+        else:
+            raise zipfile.BadZipFile(f"Unknown delta operation {op[0]}")
+    return written
+
+
+def encode_extra(file_size: int, block_size: int, base_name: str) -> bytes:
+    name = base_name.encode("utf-8")
+    payload = _DELTA_HEADER.pack(file_size, block_size, len(name)) + name
+    return struct.pack("<HH", DELTA_EXTRA_ID, len(payload)) + payload
+
+
+def decode_extra(extra: bytes) -> Optional[Tuple[int, int, str]]:
+    """(file size, block size, base archive name) of a delta entry, or None."""
+    payload = find_extra_field(extra, DELTA_EXTRA_ID)
+    if payload is None:
+        return None
+    file_size, block_size, length = _DELTA_HEADER.unpack_from(payload)
+    start = _DELTA_HEADER.size
+    return file_size, block_size, payload[start : start + length].decode("utf-8")
+
+
+class DeltaContext:
+    """Delta state of one archive being written.
+
+    Reads the signatures cached next to the base archive and writes the
+    signatures of this archive's large files next to it, so the next run can
+    delta against this one without reading old data again.
+    """
+
+    def __init__(
+        self,
+        archive: Path,
+        base_archive: Optional[Path],
+        min_size: int,
+        block_size: int,
+        max_literal_percent: int,
+    ) -> None:
+        self.archive = archive
+        self.base_archive = base_archive
+        self.min_size = min_size
+        self.block_size = block_size
+        self.max_literal_percent = max_literal_percent
+        self._writer: Optional[zipfile.ZipFile] = None
+        self._reader: Optional[zipfile.ZipFile] = None
+        if base_archive is not None:
+            try:
+                self._reader = zipfile.ZipFile(signature_path(base_archive))
+            except (OSError, zipfile.BadZipFile) as exc:
+                logger.warning("Cannot read signatures of %s: %s", base_archive, exc)
+
+    def wants(self, size: int) -> bool:
+        return size >= self.min_size
+
+    def base_signature(self, name: str) -> Optional[Signature]:
+        if self._reader is None:
+            return None
+        try:
+            signature = Signature.from_bytes(self._reader.read(name))
+        except KeyError:
+            return None
+        if signature.block_size != self.block_size:
+            return None
+        return signature
+
+    def extra(self, file_size: int) -> bytes:
+        assert self.base_archive is not None
+        return encode_extra(file_size, self.block_size, self.base_archive.name)
+
+    def add_signature(self, name: str, signature: Signature) -> None:
+        if self._writer is None:
+            self._writer = zipfile.ZipFile(signature_path(self.archive), mode="w")
+        self._writer.writestr(name, signature.to_bytes())
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        if self._reader is not None:
+            self._reader.close()
+
+    def discard(self) -> None:
+        self.close()
+        signature_path(self.archive).unlink(missing_ok=True)
@@ -0,0 +1,192 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import os
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.db import SessionLocal
+from autobackup.models import BackupRun, BackupRunDestination
+
+DESTINATION_PAGE_SIZE = 200
+ARCHIVE_SUFFIX = ".zip"
+
+
+@dataclass(frozen=True)
+class DestinationEntry:
+    """One file or folder of a destination, with the run that produced it."""
+
+    name: str
+    path: str
+    is_dir: bool
+    size: Optional[int]
+    mtime: Optional[datetime]
+    run_id: Optional[int] = None
+    job_id: Optional[int] = None
+    status: Optional[str] = None
+    source_bytes: Optional[int] = None
+
+    @property
+    def is_archive(self) -> bool:
+        return not self.is_dir and self.name.lower().endswith(ARCHIVE_SUFFIX)
+
+    @property
+    def orphan(self) -> bool:
+        """An archive that no BackupRun refers to (as output or as checkpoint)."""
+        return self.is_archive and self.run_id is None
+
+    @property
+    def compression_ratio(self) -> Optional[float]:
+        """Archive size / source bytes of the owning run."""
+        if not self.size or not self.source_bytes:
+            return None
+        return self.size / self.source_bytes
+
+
+def _runs_by_output_file(db: Session, paths: List[str]) -> Dict[str, Any]:
+    if not paths:
+        return {}
+    stmt = select(
+        BackupRun.id,
+        BackupRun.job_id,
+        BackupRun.status,
+        BackupRun.output_file,
+        BackupRun.progress_bytes_total,
+    ).where(BackupRun.output_file.in_(paths))
+    runs = {row.output_file: row for row in db.execute(stmt)}
+
+    # Copies in the extra destinations of a job.
+    missing = [path for path in paths if path not in runs]
+    if missing:
+        stmt = (
+            select(
+                BackupRun.id,
+                BackupRun.job_id,
+                BackupRunDestination.status,
+                BackupRunDestination.output_file,
+                BackupRun.progress_bytes_total,
+            )
+            .join(BackupRun, BackupRun.id == BackupRunDestination.run_id)
+            .where(BackupRunDestination.output_file.in_(missing))
+        )
+        runs.update({row.output_file: row for row in db.execute(stmt)})
+
+    # Archives still being written (or left by an interrupted run).
+    missing = [path for path in paths if path not in runs]
+    if missing:
+        stmt = select(
+            BackupRun.id,
+            BackupRun.job_id,
+            BackupRun.status,
+            BackupRun.checkpoint_file.label("output_file"),
+            BackupRun.progress_bytes_total,
+        ).where(BackupRun.checkpoint_file.in_(missing))
+        runs.update({row.output_file: row for row in db.execute(stmt)})
+    return runs
+
+
+class DestinationLister:
+    """Lists a destination folder page by page, joined with run metadata.
+
+    The folder is read with one ``os.scandir`` pass, ``page_size`` entries at
+    a time, and each page is matched to backup_runs with a single query on
+    output_file. Meant to be driven from a background thread: ``next_page``
+    does blocking I/O.
+    """
+
+    def __init__(
+        self,
+        destination: str,
+        page_size: int = DESTINATION_PAGE_SIZE,
+        session_factory: sessionmaker[Session] = SessionLocal,
+    ) -> None:
+        self.destination = destination
+        self._page_size = page_size
+        self._session_factory = session_factory
+        self._iterator: Optional[Iterator[os.DirEntry[str]]] = None
+        self._lock = threading.Lock()
+        self.done = False
+
+    def next_page(self) -> List[DestinationEntry]:
+        with self._lock:
+            if self.done:
+                return []
+            if self._iterator is None:
+                self._iterator = os.scandir(self.destination)
+
+            batch: List[os.DirEntry[str]] = []
+            for entry in self._iterator:
+                batch.append(entry)
+                if len(batch) >= self._page_size:
+                    break
+            else:
+                self.done = True
+
+            if self.done:
+                self._close_iterator()
+            return self._describe(batch)
+
+    def close(self) -> None:
+        """Stop listing. Never blocks on a page being read by another thread."""
+        self.done = True
+        if self._lock.acquire(blocking=False):
+            try:
+                self._close_iterator()
+            finally:
+                self._lock.release()
+
+    def _close_iterator(self) -> None:
+        iterator: Any = self._iterator
+        self._iterator = None
+        if iterator is not None:
+            iterator.close()
+
+    def _describe(self, batch: List[os.DirEntry[str]]) -> List[DestinationEntry]:
+        files: List[DestinationEntry] = []
+        for entry in batch:
+            try:
+                is_dir = entry.is_dir()
+                stat = entry.stat()
+            except OSError:
+                is_dir, stat = False, None
+            files.append(
+                DestinationEntry(
+                    name=entry.name,
+                    # Same normalisation as build_backup_filename().
+                    path=str(Path(entry.path)),
+                    is_dir=is_dir,
+                    size=None if stat is None or is_dir else stat.st_size,
+                    mtime=(
+                        None if stat is None else datetime.fromtimestamp(stat.st_mtime)
+                    ),
+                )
+            )
+
+        db = self._session_factory()
+        try:
+            runs = _runs_by_output_file(
+                db,
+                [entry.path for entry in files if entry.is_archive],
+            )
+        finally:
+            db.close()
+
+        result: List[DestinationEntry] = []
+        for entry in files:
+            run = runs.get(entry.path)
+            if run is not None:
+                entry = replace(
+                    entry,
+                    run_id=run.id,
+                    job_id=run.job_id,
+                    status=run.status,
+                    source_bytes=run.progress_bytes_total,
+                )
+            result.append(entry)
+        return result
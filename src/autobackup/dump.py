@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import shlex
+import subprocess
+import threading
+from typing import IO, List, Optional
+
+from autobackup.config import settings
+from autobackup.models import BackupJob
+
+logger = logging.getLogger(__name__)
+
+# BackupJob.source_type values. NULL means "path".
+SOURCE_TYPES = ("path", "pg_dump")
+# Name of the single entry holding the dump in the archive.
+DUMP_ENTRY_NAME = "database.dump"
+# Last bytes of the command's stderr kept for the run message.
+STDERR_TAIL_BYTES = 2000
+
+
+class DumpError(Exception):
+    """The dump command failed; the archive is not usable."""
+
+
+def is_dump_job(job: BackupJob) -> bool:
+    return (job.source_type or "path") == "pg_dump"
+
+
+def dump_command(job: BackupJob) -> List[str]:
+    """
+    Command whose stdout is the job's backup.
+
+    The job's source_command when set, else pg_dump of the database given by
+    source_path (a database name or a libpq connection string).
+    """
+    if job.source_command:
+        return shlex.split(job.source_command)
+    return [
+        settings.pg_dump_binary,
+        *shlex.split(settings.pg_dump_args),
+        f"--dbname={job.source_path}",
+    ]
+
+
+class DumpStream:
+    """
+    A running dump command, read like a file.
+
+    Its stdout is a pipe: when the archive writer falls behind, the pipe fills
+    up and the command blocks, so nothing is buffered on disk or in memory.
+    stderr is drained by a thread (the command would block on it too) and its
+    tail kept for error messages.
+    """
+
+    def __init__(self, command: List[str]) -> None:
+        self.command = command
+        self.bytes_read = 0
+        self.exit_status: Optional[int] = None
+        self._process: Optional[subprocess.Popen[bytes]] = None
+        self._stdout: Optional[IO[bytes]] = None
+        self._stderr_tail = b""
+        self._stderr_thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "DumpStream":
+        try:
+            self._process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except OSError as exc:
+            raise DumpError(f"Could not start {self.command[0]}: {exc}") from exc
+        self._stdout = self._process.stdout
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr,
+            name="dump-stderr",
+            daemon=True,
+        )
+        self._stderr_thread.start()
+        return self
+
+    def _drain_stderr(self) -> None:
+        assert self._process is not None and self._process.stderr is not None
+        for line in self._process.stderr:
+            self._stderr_tail = (self._stderr_tail + line)[-STDERR_TAIL_BYTES:]
+
+    def read(self, size: int) -> bytes:
+        assert self._stdout is not None
+        chunk = self._stdout.read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._process is None:
+            return
+        if exc_type is not None and self._process.poll() is None:
+            # The archive failed: stop the dump instead of draining it.
+            self._process.kill()
+        if self._stdout is not None:
+            self._stdout.close()
+        self.exit_status = self._process.wait()
+        if self._stderr_thread is not None:
+            self._stderr_thread.join()
+
+    def error(self) -> Optional[str]:
+        """Why the dump is not usable, or None if the command succeeded."""
+        if self.exit_status == 0:
+            return None
+        stderr = self._stderr_tail.decode("utf-8", "replace").strip()
+        message = f"{self.command[0]} exited with status {self.exit_status}"
+        return f"{message}: {stderr}" if stderr else message
@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, List, Optional, Set, Union
+
+from sqlalchemy import event, func
+from sqlalchemy import select as sql_select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from autobackup.config import settings
+from autobackup.models import ChangeVersion
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "autobackup_changes"
+
+# Identifies this process in NOTIFY payloads so it can skip its own echoes.
+INSTANCE_ID = uuid.uuid4().hex
+
+_PENDING_KEY = "autobackup_pending_changes"
+
+# On SQLite, changes of these kinds bump the JOBS_VERSION counter row so other
+# processes notice them (run changes are too frequent and stay in-process).
+VERSIONED_KINDS = ("job", "jobs")
+JOBS_VERSION = "jobs"
+_VERSIONS_KEY = "autobackup_bumped_versions"
+
+# Counter values bumped by this process while a poller runs, for it to skip.
+_own_versions: Set[int] = set()
+_own_versions_lock = threading.Lock()
+_polling = False
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """Something about a job changed: "job" (definition) or "run" (a run).
+
+    "jobs" (with job_id 0) means many job definitions changed at once, e.g. a
+    bulk import: consumers reload everything instead.
+    """
+
+    kind: str
+    job_id: int
+    run_id: Optional[int] = None
+
+
+Subscriber = Callable[[ChangeEvent], None]
+
+_subscribers: List[Subscriber] = []
+_subscribers_lock = threading.Lock()
+
+
+def subscribe(callback: Subscriber) -> Callable[[], None]:
+    """Register a callback for change events; returns an unsubscribe function.
+
+    Callbacks run on the thread that committed the change (or on the listener
+    thread for changes from other processes) and must not block.
+    """
+    with _subscribers_lock:
+        _subscribers.append(callback)
+
+    def unsubscribe() -> None:
+        with _subscribers_lock:
+            if callback in _subscribers:
+                _subscribers.remove(callback)
+
+    return unsubscribe
+
+
+def _deliver(change: ChangeEvent) -> None:
+    with _subscribers_lock:
+        callbacks = list(_subscribers)
+    for callback in callbacks:
+        try:
+            callback(change)
+        except Exception:
+            logger.exception("Error in change subscriber")
+
+
+def publish_change(
+    db: Session,
+    kind: str,
+    job_id: int,
+    run_id: Optional[int] = None,
+) -> None:
+    """
+    Announce a change made in the current transaction of ``db``.
+
+    Subscribers in this process are notified after the transaction commits
+    (nothing is sent on rollback). On PostgreSQL a NOTIFY is also queued in the
+    same transaction, so other processes learn about it on commit as well. On
+    SQLite job changes bump a counter that other processes poll.
+    """
+    change = ChangeEvent(kind=kind, job_id=job_id, run_id=run_id)
+    db.info.setdefault(_PENDING_KEY, []).append(change)
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        payload = json.dumps({"src": INSTANCE_ID, **asdict(change)})
+        db.execute(sql_select(func.pg_notify(CHANNEL, payload)))
+    elif dialect == "sqlite" and kind in VERSIONED_KINDS:
+        _bump_jobs_version(db)
+
+
+def _bump_jobs_version(db: Session) -> None:
+    table = ChangeVersion.__table__
+    version = db.execute(
+        sqlite.insert(table)
+        .values(name=JOBS_VERSION, version=1)
+        .on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={"version": table.c.version + 1},
+        )
+        .returning(table.c.version)
+    ).scalar_one()
+    # Recorded before the commit, so the poller never sees it as foreign.
+    with _own_versions_lock:
+        if not _polling:
+            return
+        _own_versions.add(version)
+    db.info.setdefault(_VERSIONS_KEY, []).append(version)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_after_commit(session: Session) -> None:
+    session.info.pop(_VERSIONS_KEY, None)
+    for change in session.info.pop(_PENDING_KEY, []):
+        _deliver(change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    bumped = session.info.pop(_VERSIONS_KEY, [])
+    with _own_versions_lock:
+        _own_versions.difference_update(bumped)
+
+
+class PostgresChangeListener:
+    """Receive change events from other processes with LISTEN/NOTIFY.
+
+    Uses one dedicated connection and blocks in select() on its socket, so it
+    issues no queries while nothing changes.
+    """
+
+    def __init__(self, bind: Engine) -> None:
+        self._bind = bind
+        self._connection: Any = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._connection = self._bind.raw_connection()
+        dbapi_conn = self._connection.driver_connection
+        dbapi_conn.autocommit = True
+        with dbapi_conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="autobackup-listener",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("Listening for change notifications on %s", CHANNEL)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"\0")
+        self._thread.join(timeout=5)
+        self._thread = None
+
+        for fd in (self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._wake_r = self._wake_w = None
+        self._connection.invalidate()
+        self._connection = None
+
+    def _run(self) -> None:
+        dbapi_conn = self._connection.driver_connection
+        while True:
+            ready, _, _ = select.select([dbapi_conn, self._wake_r], [], [])
+            if self._wake_r in ready:
+                return
+
+            try:
+                dbapi_conn.poll()
+            except Exception:
+                logger.exception("Change listener connection failed")
+                return
+
+            while dbapi_conn.notifies:
+                notify = dbapi_conn.notifies.pop(0)
+                try:
+                    data = json.loads(notify.payload)
+                except ValueError:
+                    continue
+                if data.pop("src", None) == INSTANCE_ID:
+                    continue
+                _deliver(ChangeEvent(**data))
+
+
+class SQLiteChangePoller:
+    """Notice job changes made by other processes on SQLite.
+
+    Reads the JOBS_VERSION counter every ``interval`` seconds. A bump made by
+    another process is delivered as one "jobs" change: the counter does not
+    tell which jobs changed, so subscribers reload everything. Run changes of
+    other processes are not seen.
+
+    While the counter does not move, the delay between reads doubles up to
+    ``max_interval``; it is back to ``interval`` after the next change, so an
+    idle process wakes up rarely and a busy one stays responsive.
+    """
+
+    def __init__(
+        self,
+        bind: Engine,
+        interval: float,
+        max_interval: Optional[float] = None,
+    ) -> None:
+        self._bind = bind
+        self._interval = interval
+        self._max_interval = max(interval, max_interval or interval)
+        self._delay = interval
+        self._seen = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        global _polling
+        if self._thread is not None:
+            return
+
+        with _own_versions_lock:
+            _polling = True
+        self._seen = self._read_version()
+        self._delay = self._interval
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="autobackup-listener",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info(
+            "Polling for job changes every %s to %ss",
+            self._interval,
+            self._max_interval,
+        )
+
+    def stop(self) -> None:
+        global _polling
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        with _own_versions_lock:
+            _polling = False
+            _own_versions.clear()
+
+    def _read_version(self) -> int:
+        with self._bind.connect() as connection:
+            version = connection.scalar(
+                sql_select(ChangeVersion.version).where(
+                    ChangeVersion.name == JOBS_VERSION
+                )
+            )
+        return version or 0
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._delay):
+            try:
+                changed = self.poll()
+            except Exception:
+                logger.exception("Could not poll for job changes")
+                continue
+            if changed:
+                self._delay = self._interval
+            else:
+                self._delay = min(self._delay * 2, self._max_interval)
+
+    def poll(self) -> bool:
+        """Deliver changes made since the last poll; False if there were none."""
+        version = self._read_version()
+        if version == self._seen:
+            return False
+
+        bumps = range(self._seen + 1, version + 1)
+        with _own_versions_lock:
+            foreign = any(bump not in _own_versions for bump in bumps)
+            _own_versions.difference_update(bumps)
+        self._seen = version
+        if foreign:
+            _deliver(ChangeEvent(kind="jobs", job_id=0))
+        return True
+
+
+ChangeListener = Union[PostgresChangeListener, SQLiteChangePoller]
+
+
+def start_change_listener(bind: Engine) -> Optional[ChangeListener]:
+    """Start a cross-process listener for the backend.
+
+    PostgreSQL delivers every change with LISTEN/NOTIFY. SQLite has no
+    notification channel: job changes are polled every
+    SQLITE_CHANGE_POLL_SECONDS (backing off to SQLITE_CHANGE_POLL_MAX_SECONDS
+    while nothing changes), and run changes are only seen by the process
+    that made them (through the in-process subscribers).
+    """
+    listener: ChangeListener
+    if bind.dialect.name == "postgresql":
+        listener = PostgresChangeListener(bind)
+    elif bind.dialect.name == "sqlite" and settings.sqlite_change_poll_seconds > 0:
+        listener = SQLiteChangePoller(
+            bind,
+            settings.sqlite_change_poll_seconds,
+            settings.sqlite_change_poll_max_seconds,
+        )
+    else:
+        return None
+
+    try:
+        listener.start()
+    except Exception as exc:  # noqa: BLE001
+        logger.warning("Could not start change listener: %s", exc)
+        return None
+    return listener
@@ -1,18 +1,100 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from typing import Optional, Any
-
 import os
-import sys
+import queue
 import subprocess
+import sys
+import threading
+import tkinter as tk
+from datetime import date
+from tkinter import filedialog, messagebox, ttk
+from typing import Any, List, Optional
 
-from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
 
-from autobackup.scheduler import BackupScheduler
-from autobackup.db import SessionLocal
+from autobackup.baselines import load_baselines
+from autobackup.clock import format_local, seconds_between
+from autobackup.db import SessionLocal, engine
+from autobackup.destinations import DestinationEntry, DestinationLister
+from autobackup.dump import SOURCE_TYPES
+from autobackup.events import publish_change, start_change_listener
+from autobackup.history import (
+    HISTORY_PAGE_SIZE,
+    HistoryFilters,
+    HistoryKey,
+    fetch_history_page,
+)
+from autobackup.job_cache import JobCache
 from autobackup.models import BackupJob, BackupRun
-from autobackup.backup_engine import run_backup_for_job
+from autobackup.profiles import CODECS, DEFAULT_PRESET, PRESETS, resolve_profile
+from autobackup.progress import format_progress
+from autobackup.recycle import recycled_percent
+from autobackup.run_queue import QueueFull
+from autobackup.scheduler import BackupScheduler
+from autobackup.stats import load_dashboard_stats
+from autobackup.storage import is_remote
+
+# How often the GUI applies pending change notifications (no DB access).
+CHANGE_CHECK_MS = 250
+
+
+def _parse_day(text: str) -> Optional[date]:
+    """Parse an optional YYYY-MM-DD filter field (raises ValueError)."""
+    text = text.strip()
+    return date.fromisoformat(text) if text else None
+
+
+def _format_size(size: Optional[int]) -> str:
+    """Human readable byte count, e.g. "12.3 MB"."""
+    if size is None:
+        return ""
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def _format_duration(seconds: Optional[float]) -> str:
+    """Short duration, e.g. "42s", "3m 05s" or "2h 10m"."""
+    if seconds is None:
+        return ""
+    total = int(round(seconds))
+    if total < 60:
+        return f"{total}s"
+    if total < 3600:
+        return f"{total // 60}m {total % 60:02d}s"
+    return f"{total // 3600}h {total % 3600 // 60:02d}m"
+
+
+def _job_values(row: Any) -> tuple:
+    """Treeview values for a row from load_job_rows()."""
+    if row.last_status == "running":
+        progress = format_progress(
+            row.progress_files_done,
+            row.progress_files_total,
+            row.progress_bytes_done,
+            row.progress_bytes_total,
+        )
+        last_run = f"running {progress}".strip()
+    elif row.last_status:
+        started = (
+            format_local(row.last_start_time, "%Y-%m-%d %H:%M")
+        )
+        last_run = f"{row.last_status} {started}".strip()
+    else:
+        last_run = ""
+
+    return (
+        row.id,
+        row.name,
+        row.source_path,
+        row.destination_path,
+        row.schedule_type,
+        row.interval_minutes or "",
+        "Yes" if bool(row.active) else "No",
+        last_run,
+    )
 
 
 class AutoBackupApp(tk.Tk):
@@ -24,7 +106,20 @@ class AutoBackupApp(tk.Tk):
         self.title("AutoBackup Manager")
         self.geometry("900x520")
 
+        # Job rows are cached and updated from change notifications, so the
+        # tree only touches the rows that changed.
+        self.job_cache = JobCache()
+        self.change_listener = start_change_listener(engine)
+
         self.build_layout()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(CHANGE_CHECK_MS, self.apply_job_changes)
+
+    def on_close(self) -> None:
+        self.job_cache.close()
+        if self.change_listener is not None:
+            self.change_listener.stop()
+        self.destroy()
 
     # ------------------------------------------------------------
     # Layout
@@ -63,11 +158,15 @@ class AutoBackupApp(tk.Tk):
             side="left",
             padx=5,
         )
-        ttk.Button(btn_frame, text="Dashboard", command=self.open_dashboard_window).pack(
+        ttk.Button(
+            btn_frame, text="Dashboard", command=self.open_dashboard_window
+        ).pack(
             side="left",
             padx=5,
         )
-        ttk.Button(btn_frame, text="Open Folder", command=self.open_destination_folder).pack(
+        ttk.Button(
+            btn_frame, text="Open Folder", command=self.open_destination_folder
+        ).pack(
             side="left",
             padx=5,
         )
@@ -95,6 +194,7 @@ class AutoBackupApp(tk.Tk):
             "schedule",
             "interval",
             "active",
+            "last_run",
         )
 
         self.job_tree = ttk.Treeview(
@@ -112,6 +212,7 @@ class AutoBackupApp(tk.Tk):
             "schedule": "Schedule",
             "interval": "Interval (min)",
             "active": "Active",
+            "last_run": "Last run",
         }
 
         for col, text in headings.items():
@@ -124,6 +225,7 @@ class AutoBackupApp(tk.Tk):
         self.job_tree.column("schedule", width=80, anchor="center")
         self.job_tree.column("interval", width=90, anchor="center")
         self.job_tree.column("active", width=60, anchor="center")
+        self.job_tree.column("last_run", width=160, anchor="center")
 
         self.job_tree.pack(fill="both", expand=True, side="left")
 
@@ -156,52 +258,105 @@ class AutoBackupApp(tk.Tk):
     # Load Jobs
     # ------------------------------------------------------------
     def load_jobs(self) -> None:
+        """Rebuild the whole job tree (initial load and the Refresh button)."""
         for item in self.job_tree.get_children():
             self.job_tree.delete(item)
 
-        db = SessionLocal()
-        try:
-            jobs = db.query(BackupJob).order_by(BackupJob.id).all()
-            for job in jobs:
-                active_label = "Yes" if bool(job.active) else "No"
+        for row in self.job_cache.reload_all():
+            self.job_tree.insert("", "end", iid=str(row.id), values=_job_values(row))
 
-                self.job_tree.insert(
-                    "",
-                    "end",
-                    values=(
-                        job.id,
-                        job.name,
-                        job.source_path,
-                        job.destination_path,
-                        job.schedule_type,
-                        job.interval_minutes or "",
-                        active_label,
-                    ),
-                )
+    def apply_job_changes(self) -> None:
+        """Update only the tree rows of jobs that changed since the last check.
+
+        Change events arrive on other threads; they only mark jobs as dirty in
+        the cache, and this Tk timer applies them on the GUI thread. No query
+        is made unless something changed.
+        """
+        try:
+            if self.job_cache.needs_reload_all():
+                self.load_jobs()
+            elif self.job_cache.has_changes():
+                updated, removed = self.job_cache.refresh_dirty()
+                for job_id in removed:
+                    if self.job_tree.exists(str(job_id)):
+                        self.job_tree.delete(str(job_id))
+                for row in updated:
+                    iid = str(row.id)
+                    if self.job_tree.exists(iid):
+                        self.job_tree.item(iid, values=_job_values(row))
+                    else:
+                        index = sum(
+                            1
+                            for other in self.job_tree.get_children()
+                            if int(other) < row.id
+                        )
+                        self.job_tree.insert(
+                            "",
+                            index,
+                            iid=iid,
+                            values=_job_values(row),
+                        )
         finally:
-            db.close()
+            self.after(CHANGE_CHECK_MS, self.apply_job_changes)
 
     # ------------------------------------------------------------
     # History Window
     # ------------------------------------------------------------
     def open_history_window(self) -> None:
-        """Open a window showing the history of backup runs."""
+        """Open a window showing the history of backup runs.
+
+        Rows are loaded page by page with keyset pagination as the user
+        scrolls, and only a bounded window of rows is kept in the Treeview.
+        """
         db = SessionLocal()
         try:
-            runs = (
-                db.query(BackupRun)
-                .order_by(BackupRun.start_time.desc())
-                .limit(200)
-                .all()
-            )
+            jobs = db.query(BackupJob.id, BackupJob.name).order_by(BackupJob.id).all()
         finally:
             db.close()
 
         window = tk.Toplevel(self)
         window.title("Backup history")
-        window.geometry("900x400")
+        window.geometry("900x450")
         window.grab_set()
 
+        # Filters
+        filter_frame = ttk.Frame(window)
+        filter_frame.pack(fill="x", padx=10, pady=(10, 0))
+
+        any_label = "All"
+        job_labels = {f"{job_id} - {name}": job_id for job_id, name in jobs}
+        job_var = tk.StringVar(value=any_label)
+        status_var = tk.StringVar(value=any_label)
+        from_var = tk.StringVar()
+        to_var = tk.StringVar()
+
+        ttk.Label(filter_frame, text="Job:").pack(side="left")
+        ttk.Combobox(
+            filter_frame,
+            textvariable=job_var,
+            values=[any_label, *job_labels],
+            state="readonly",
+            width=20,
+        ).pack(side="left", padx=(5, 10))
+        ttk.Label(filter_frame, text="Status:").pack(side="left")
+        ttk.Combobox(
+            filter_frame,
+            textvariable=status_var,
+            values=[any_label, "success", "error", "running", "queued", "cancelled"],
+            state="readonly",
+            width=10,
+        ).pack(side="left", padx=(5, 10))
+        ttk.Label(filter_frame, text="From (YYYY-MM-DD):").pack(side="left")
+        ttk.Entry(filter_frame, textvariable=from_var, width=12).pack(
+            side="left",
+            padx=(5, 10),
+        )
+        ttk.Label(filter_frame, text="To:").pack(side="left")
+        ttk.Entry(filter_frame, textvariable=to_var, width=12).pack(
+            side="left",
+            padx=(5, 10),
+        )
+
         frame = ttk.Frame(window)
         frame.pack(fill="both", expand=True, padx=10, pady=10)
 
@@ -211,6 +366,7 @@ class AutoBackupApp(tk.Tk):
             "status",
             "start_time",
             "end_time",
+            "progress",
             "message",
         )
 
@@ -223,8 +379,8 @@ class AutoBackupApp(tk.Tk):
         tree.heading("id", text="Run ID")
         tree.heading("job_id", text="Job ID")
         tree.heading("status", text="Status")
-        tree.heading("start_time", text="Start time")
         tree.heading("end_time", text="End time")
+        tree.heading("progress", text="Progress")
         tree.heading("message", text="Message (preview)")
 
         tree.column("id", width=60, anchor="center")
@@ -232,27 +388,159 @@ class AutoBackupApp(tk.Tk):
         tree.column("status", width=80, anchor="center")
         tree.column("start_time", width=160, anchor="center")
         tree.column("end_time", width=160, anchor="center")
-        tree.column("message", width=320, anchor="w")
+        tree.column("progress", width=130, anchor="center")
+        tree.column("message", width=260, anchor="w")
 
         vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
         vsb.pack(side="right", fill="y")
-        tree.configure(yscrollcommand=vsb.set)
         tree.pack(side="left", fill="both", expand=True)
 
-        for run in runs:
-            msg_preview = (run.message or "")[:80]
+        # Keyset pagination state. Only up to max_rows rows live in the tree;
+        # rows scrolled far out of view are dropped and re-fetched on demand.
+        max_rows = HISTORY_PAGE_SIZE * 5
+        keys: dict[str, HistoryKey] = {}
+        state: dict[str, Any] = {
+            "filters": HistoryFilters(),
+            "newest_first": True,
+            "at_start": True,
+            "at_end": False,
+            "loading": False,
+        }
+
+        def fetch(after: Optional[HistoryKey], backwards: bool) -> list[Any]:
+            db = SessionLocal()
+            try:
+                return fetch_history_page(
+                    db,
+                    state["filters"],
+                    after=after,
+                    newest_first=state["newest_first"],
+                    backwards=backwards,
+                )
+            finally:
+                db.close()
+
+        def insert_row(row: Any, index: Any) -> None:
+            iid = str(row.id)
             tree.insert(
                 "",
-                "end",
+                index,
+                iid=iid,
                 values=(
-                    run.id,
-                    run.job_id,
-                    run.status or "",
-                    str(run.start_time) if run.start_time else "",
-                    str(run.end_time) if run.end_time else "",
-                    msg_preview,
+                    row.id,
+                    row.job_id,
+                    row.status or "",
+                    format_local(row.start_time),
+                    format_local(row.end_time),
+                    format_progress(
+                        row.progress_files_done,
+                        row.progress_files_total,
+                        row.progress_bytes_done,
+                        row.progress_bytes_total,
+                    ),
+                    row.message_preview or "",
                 ),
             )
+            keys[iid] = (row.start_time, row.id)
+
+        def drop_rows(iids: Any) -> None:
+            if iids:
+                tree.delete(*iids)
+                for iid in iids:
+                    keys.pop(iid, None)
+
+        def load_next() -> None:
+            if state["loading"] or state["at_end"]:
+                return
+            state["loading"] = True
+            try:
+                children = tree.get_children()
+                after = keys[children[-1]] if children else None
+                rows = fetch(after, backwards=False)
+                state["at_end"] = len(rows) < HISTORY_PAGE_SIZE
+                for row in rows:
+                    insert_row(row, "end")
+
+                children = tree.get_children()
+                if len(children) > max_rows:
+                    drop_rows(children[: len(children) - max_rows])
+                    state["at_start"] = False
+            finally:
+                state["loading"] = False
+
+        def load_previous() -> None:
+            if state["loading"] or state["at_start"]:
+                return
+            state["loading"] = True
+            try:
+                children = tree.get_children()
+                if not children:
+                    return
+                anchor = children[0]
+                rows = fetch(keys[anchor], backwards=True)
+                state["at_start"] = len(rows) < HISTORY_PAGE_SIZE
+                for row in reversed(rows):
+                    insert_row(row, 0)
+
+                children = tree.get_children()
+                if len(children) > max_rows:
+                    drop_rows(children[max_rows:])
+                    state["at_end"] = False
+                tree.see(anchor)
+            finally:
+                state["loading"] = False
+
+        def on_yscroll(first: str, last: str) -> None:
+            vsb.set(first, last)
+            if state["loading"]:
+                return
+            if float(last) >= 0.95 and not state["at_end"]:
+                window.after_idle(load_next)
+            elif float(first) <= 0.05 and not state["at_start"]:
+                window.after_idle(load_previous)
+
+        tree.configure(yscrollcommand=on_yscroll)
+
+        def reload_history() -> None:
+            drop_rows(tree.get_children())
+            state["at_start"] = True
+            state["at_end"] = False
+            arrow = "▼" if state["newest_first"] else "▲"
+            tree.heading("start_time", text=f"Start time {arrow}")
+            load_next()
+
+        def apply_filters() -> None:
+            try:
+                start_day = _parse_day(from_var.get())
+                end_day = _parse_day(to_var.get())
+            except ValueError:
+                messagebox.showerror(
+                    "Invalid date",
+                    "Dates must use the YYYY-MM-DD format.",
+                    parent=window,
+                )
+                return
+
+            status = status_var.get()
+            state["filters"] = HistoryFilters(
+                job_id=job_labels.get(job_var.get()),
+                status=None if status == any_label else status,
+                start_day=start_day,
+                end_day=end_day,
+            )
+            reload_history()
+
+        def toggle_sort() -> None:
+            state["newest_first"] = not state["newest_first"]
+            reload_history()
+
+        tree.heading("start_time", command=toggle_sort)
+        ttk.Button(filter_frame, text="Apply", command=apply_filters).pack(
+            side="left",
+            padx=5,
+        )
+
+        reload_history()
 
         # Buttons at the bottom
         button_frame = ttk.Frame(window)
@@ -308,6 +596,7 @@ class AutoBackupApp(tk.Tk):
                 return
 
             job = db.query(BackupJob).filter_by(id=run.job_id).first()
+            copies = list(run.destinations)
         finally:
             db.close()
 
@@ -329,15 +618,50 @@ class AutoBackupApp(tk.Tk):
         add_row("Job ID", str(run.job_id))
         add_row("Job name", job.name if job else "<unknown>")
         add_row("Status", run.status or "")
+        add_row("Start time", format_local(run.start_time))
+        add_row("End time", format_local(run.end_time))
+        duration = seconds_between(run.start_time, run.end_time)
+        add_row("Duration", _format_duration(duration))
+        if run.perf_regression:
+            add_row("Regression", run.perf_regression)
+        add_row("Output file", run.output_file or "")
+        for copy in copies:
+            add_row(
+                f"Destination {copy.position + 1}",
+                f"{copy.status}: {copy.output_file or copy.destination}",
+            )
         add_row(
-            "Start time",
-            str(run.start_time) if run.start_time is not None else "",
-        )
-        add_row(
-            "End time",
-            str(run.end_time) if run.end_time is not None else "",
+            "Progress",
+            format_progress(
+                run.progress_files_done,
+                run.progress_files_total,
+                run.progress_bytes_done,
+                run.progress_bytes_total,
+            ),
         )
-        add_row("Output file", run.output_file or "")
+        if run.status == "running" and run.progress_current_file:
+            add_row("Current file", run.progress_current_file)
+        if run.sparse_bytes_skipped:
+            add_row("Sparse holes", f"{_format_size(run.sparse_bytes_skipped)} skipped")
+        if run.dump_exit_status is not None:
+            add_row(
+                "Dump",
+                f"exit status {run.dump_exit_status}, "
+                f"{_format_size(run.dump_bytes or 0)}",
+            )
+        percent = recycled_percent(run.recycled_bytes, run.progress_bytes_total)
+        if percent is not None:
+            add_row(
+                "Recycled",
+                f"{percent:.0f}% of source bytes "
+                f"({_format_size(run.recycled_bytes or 0)}) not compressed again",
+            )
+        if run.delta_base_run_id:
+            add_row(
+                "Delta",
+                f"against run {run.delta_base_run_id}, "
+                f"{_format_size(run.delta_bytes_saved or 0)} not stored",
+            )
 
         # Message / log area
         msg_label = ttk.Label(window, text="Message / log:")
@@ -369,146 +693,220 @@ class AutoBackupApp(tk.Tk):
     def open_dashboard_window(self) -> None:
         db = SessionLocal()
         try:
-            runs = db.query(BackupRun).all()
+            has_stats = load_dashboard_stats(db).total_runs > 0
+            jobs = db.query(BackupJob.id, BackupJob.name).order_by(BackupJob.id).all()
         finally:
             db.close()
 
-        if not runs:
+        if not has_stats:
             messagebox.showinfo(
                 "Dashboard",
                 "No backup runs available to build the dashboard yet.",
             )
             return
 
-        # Collect statistics
-        total_runs = len(runs)
-        success_count = 0
-        failure_count = 0
-        date_counts: dict[str, int] = {}
-        total_duration_secs = 0.0
-        duration_count = 0
+        window = tk.Toplevel(self)
+        window.title("Backup Dashboard")
+        window.geometry("900x720")
+        window.grab_set()
 
-        for run in runs:
-            run_any: Any = run
+        # Filters
+        filter_frame = ttk.Frame(window)
+        filter_frame.pack(fill="x", padx=10, pady=(10, 0))
 
-            status_val = str(getattr(run_any, "status", "") or "")
-            if status_val == "success":
-                success_count += 1
-            else:
-                failure_count += 1
+        from_var = tk.StringVar()
+        to_var = tk.StringVar()
+        all_jobs_label = "All jobs"
+        job_labels = {f"{job_id} - {name}": job_id for job_id, name in jobs}
+        job_var = tk.StringVar(value=all_jobs_label)
 
-            start_val = getattr(run_any, "start_time", None)
-            end_val = getattr(run_any, "end_time", None)
+        ttk.Label(filter_frame, text="From (YYYY-MM-DD):").pack(side="left")
+        ttk.Entry(filter_frame, textvariable=from_var, width=12).pack(
+            side="left",
+            padx=(5, 10),
+        )
+        ttk.Label(filter_frame, text="To:").pack(side="left")
+        ttk.Entry(filter_frame, textvariable=to_var, width=12).pack(
+            side="left",
+            padx=(5, 10),
+        )
+        ttk.Label(filter_frame, text="Job:").pack(side="left")
+        ttk.Combobox(
+            filter_frame,
+            textvariable=job_var,
+            values=[all_jobs_label, *job_labels],
+            state="readonly",
+            width=25,
+        ).pack(side="left", padx=5)
 
-            if start_val is not None:
-                date_key = str(start_val.date())
-            elif end_val is not None:
-                date_key = str(end_val.date())
-            else:
-                date_key = None
+        # Top KPIs
+        kpi_frame = ttk.Frame(window)
+        kpi_frame.pack(fill="x", padx=10, pady=10)
 
-            if date_key is not None:
-                date_counts[date_key] = date_counts.get(date_key, 0) + 1
+        kpi_var = tk.StringVar()
+        ttk.Label(kpi_frame, textvariable=kpi_var).pack(side="left", padx=10)
 
-            if start_val is not None and end_val is not None:
-                delta = end_val - start_val
-                total_duration_secs += delta.total_seconds()
-                duration_count += 1
+        # Matplotlib figure with two charts
+        fig = Figure(figsize=(8, 4), dpi=100)
+        canvas = FigureCanvasTkAgg(fig, master=window)
+        canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
 
-        avg_duration = (
-            total_duration_secs / duration_count if duration_count > 0 else 0.0
+        # Per-job performance baselines (last runs, not the date range)
+        ttk.Label(window, text="Performance baselines (recent successful runs):").pack(
+            anchor="w",
+            padx=10,
         )
+        baseline_columns = (
+            "job",
+            "runs",
+            "p50",
+            "p95",
+            "throughput",
+            "size",
+            "regressions",
+            "last",
+        )
+        baseline_tree = ttk.Treeview(
+            window,
+            columns=baseline_columns,
+            show="headings",
+            height=6,
+        )
+        for column, heading, width in (
+            ("job", "Job", 200),
+            ("runs", "Runs", 50),
+            ("p50", "p50 duration", 90),
+            ("p95", "p95 duration", 90),
+            ("throughput", "p50 throughput", 110),
+            ("size", "p50 size", 90),
+            ("regressions", "Regressions", 80),
+            ("last", "Last flagged run", 150),
+        ):
+            baseline_tree.heading(column, text=heading)
+            baseline_tree.column(column, width=width, anchor="w")
+        baseline_tree.tag_configure("regression", foreground="red")
+        baseline_tree.pack(fill="x", padx=10, pady=(0, 10))
+
+        def refresh() -> None:
+            try:
+                start_day = _parse_day(from_var.get())
+                end_day = _parse_day(to_var.get())
+            except ValueError:
+                messagebox.showerror(
+                    "Invalid date",
+                    "Dates must use the YYYY-MM-DD format.",
+                    parent=window,
+                )
+                return
 
-        dates = sorted(date_counts.keys())
-        counts = [date_counts[d] for d in dates]
+            db = SessionLocal()
+            try:
+                stats = load_dashboard_stats(
+                    db,
+                    start_day=start_day,
+                    end_day=end_day,
+                    job_id=job_labels.get(job_var.get()),
+                )
+                baselines = load_baselines(db, job_id=job_labels.get(job_var.get()))
+            finally:
+                db.close()
 
-        window = tk.Toplevel(self)
-        window.title("Backup Dashboard")
-        window.geometry("900x520")
-        window.grab_set()
+            baseline_tree.delete(*baseline_tree.get_children())
+            for baseline in baselines:
+                last = ""
+                if baseline.last_regression_run_id is not None:
+                    last = f"#{baseline.last_regression_run_id}"
+                    if baseline.last_regression_at is not None:
+                        last += " " + format_local(
+                            baseline.last_regression_at, "%Y-%m-%d %H:%M"
+                        )
+                throughput = ""
+                if baseline.throughput_p50 is not None:
+                    throughput = f"{_format_size(int(baseline.throughput_p50))}/s"
+                baseline_tree.insert(
+                    "",
+                    "end",
+                    values=(
+                        f"{baseline.job_id} - {baseline.job_name}",
+                        baseline.sample_count,
+                        _format_duration(baseline.duration_p50),
+                        _format_duration(baseline.duration_p95),
+                        throughput,
+                        _format_size(baseline.bytes_p50),
+                        baseline.regression_count,
+                        last,
+                    ),
+                    tags=("regression",) if baseline.regression_count else (),
+                )
 
-        # Top KPIs
-        kpi_frame = ttk.Frame(window)
-        kpi_frame.pack(fill="x", padx=10, pady=10)
+            kpi_var.set(
+                f"Total runs: {stats.total_runs}      "
+                f"Success: {stats.success_count}      "
+                f"Failure: {stats.failure_count}      "
+                f"Avg duration: {stats.avg_duration_seconds:.1f}s"
+            )
 
-        ttk.Label(kpi_frame, text=f"Total runs: {total_runs}").pack(side="left", padx=10)
-        ttk.Label(kpi_frame, text=f"Success: {success_count}").pack(side="left", padx=10)
-        ttk.Label(kpi_frame, text=f"Failure: {failure_count}").pack(side="left", padx=10)
-        ttk.Label(kpi_frame, text=f"Avg duration: {avg_duration:.1f}s").pack(side="left", padx=10)
-
-        # If we have no dated info, show a simple message
-        if not dates:
-            ttk.Label(
-                window,
-                text="No dated backup runs to display charts yet.",
-            ).pack(padx=10, pady=10)
-            return
+            fig.clear()
+            if not stats.per_day:
+                fig.text(
+                    0.5,
+                    0.5,
+                    "No backup runs in the selected range.",
+                    ha="center",
+                    va="center",
+                    fontsize=12,
+                )
+                canvas.draw()
+                return
 
-        # Matplotlib figure with two charts
-        fig = Figure(figsize=(8, 4), dpi=100)
-        ax1 = fig.add_subplot(1, 2, 1)
-        ax2 = fig.add_subplot(1, 2, 2)
-
-        # Bar chart: backups per day
-        ax1.bar(dates, counts)
-        ax1.set_title("Backups per day")
-        ax1.set_xlabel("Date")
-        ax1.set_ylabel("Number of backups")
-        ax1.tick_params(axis="x", rotation=45)
-
-        # Pie chart: success vs failure
-        if success_count + failure_count > 0:
+            ax1 = fig.add_subplot(1, 2, 1)
+            ax2 = fig.add_subplot(1, 2, 2)
+
+            # Bar chart: backups per day
+            dates = [str(day) for day, _ in stats.per_day]
+            counts = [count for _, count in stats.per_day]
+            ax1.bar(dates, counts)
+            ax1.set_title("Backups per day")
+            ax1.set_xlabel("Date")
+            ax1.set_ylabel("Number of backups")
+            ax1.tick_params(axis="x", rotation=45)
+
+            # Pie chart: success vs failure
             ax2.pie(
-                [success_count, failure_count],
+                [stats.success_count, stats.failure_count],
                 labels=["Success", "Failure"],
                 autopct="%d",
             )
             ax2.set_title("Backup status")
-        else:
-            ax2.text(
-                0.5,
-                0.5,
-                "No runs",
-                ha="center",
-                va="center",
-                fontsize=12,
-            )
 
-        canvas = FigureCanvasTkAgg(fig, master=window)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
+            fig.tight_layout()
+            canvas.draw()
+
+        ttk.Button(filter_frame, text="Apply", command=refresh).pack(
+            side="left",
+            padx=5,
+        )
+        refresh()
 
     # ------------------------------------------------------------
     # Run Job
     # ------------------------------------------------------------
     def run_selected_job(self) -> None:
+        """Queue an urgent run of the selected job.
+
+        The run goes through the scheduler's run queue like API runs, so the
+        window stays responsive; the job row shows its progress and outcome.
+        """
         job_id = self.get_selected_job_id()
         if job_id is None:
             return
 
-        db = SessionLocal()
         try:
-            job = db.query(BackupJob).filter_by(id=job_id).first()
-            if not job:
-                messagebox.showerror("Error", "Selected job no longer exists.")
-                return
-
-            run = run_backup_for_job(db, job)
-            status = str(getattr(run, "status", ""))
-            message = str(getattr(run, "message", "")) if getattr(run, "message", None) else ""
-
-            if status == "success":
-                messagebox.showinfo(
-                    "Success",
-                    f"Backup created:\n{getattr(run, 'output_file', '')}",
-                )
-            else:
-                messagebox.showerror(
-                    "Backup failed",
-                    message or "Backup failed with unknown error.",
-                )
-        finally:
-            db.close()
+            self.scheduler.runs.submit(job_id, "urgent")
+        except LookupError:
+            messagebox.showerror("Error", "Selected job no longer exists.")
+        except QueueFull as exc:
+            messagebox.showerror("Run queue full", f"Could not queue the backup: {exc}")
 
     # ------------------------------------------------------------
     # Open destination Folder
@@ -538,6 +936,13 @@ class AutoBackupApp(tk.Tk):
             )
             return
 
+        if is_remote(destination):
+            messagebox.showinfo(
+                "Remote destination",
+                f"Backups of this job are stored in object storage:\n{destination}",
+            )
+            return
+
         if not os.path.isdir(destination):
             messagebox.showerror(
                 "Folder not found",
@@ -548,39 +953,151 @@ class AutoBackupApp(tk.Tk):
         self._show_destination_viewer(destination)
 
     def _show_destination_viewer(self, destination: str) -> None:
-        """Show a simple folder viewer window for the given destination path."""
+        """Show the archives of a destination with the runs that made them.
+
+        The folder is scanned page by page on a background thread (see
+        DestinationLister); the Tk timer only inserts finished pages, so slow
+        or huge destinations never block the GUI.
+        """
         window = tk.Toplevel(self)
-        window.title(f"Destination folder")
-        window.geometry("600x400")
+        window.title("Destination folder")
+        window.geometry("900x450")
         window.grab_set()
 
         # Path label
         path_label = ttk.Label(window, text=destination)
         path_label.pack(fill="x", padx=10, pady=(10, 5))
 
-        # List of files / folders
         list_frame = ttk.Frame(window)
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
-        listbox = tk.Listbox(list_frame)
-        listbox.pack(side="left", fill="both", expand=True)
+        columns = ("name", "size", "modified", "ratio", "run", "job", "note")
+        tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        tree.heading("name", text="Name")
+        tree.heading("size", text="Size")
+        tree.heading("modified", text="Modified")
+        tree.heading("ratio", text="Ratio")
+        tree.heading("run", text="Run ID")
+        tree.heading("job", text="Job ID")
+        tree.heading("note", text="Note")
+
+        tree.column("name", width=260, anchor="w")
+        tree.column("size", width=90, anchor="e")
+        tree.column("modified", width=150, anchor="center")
+        tree.column("ratio", width=60, anchor="center")
+        tree.column("run", width=70, anchor="center")
+        tree.column("job", width=60, anchor="center")
+        tree.column("note", width=120, anchor="w")
+        tree.tag_configure("orphan", foreground="#b00020")
+
+        vsb = ttk.Scrollbar(list_frame, orient="vertical", command=tree.yview)
+        vsb.pack(side="right", fill="y")
+        tree.pack(side="left", fill="both", expand=True)
 
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=listbox.yview)
-        scrollbar.pack(side="right", fill="y")
-        listbox.configure(yscrollcommand=scrollbar.set)
+        status_var = tk.StringVar(value="Loading...")
+        ttk.Label(window, textvariable=status_var, anchor="w").pack(
+            fill="x",
+            padx=10,
+        )
 
-        try:
-            entries = sorted(os.listdir(destination))
-        except Exception as exc:  # noqa: BLE001
-            messagebox.showerror("Error", f"Could not list folder contents:\n{exc}")
-            window.destroy()
-            return
+        lister = DestinationLister(destination)
+        pages: "queue.Queue[Any]" = queue.Queue()
+        state: dict[str, Any] = {
+            "loading": False,
+            "rows": 0,
+            "orphans": 0,
+            "poll": None,
+        }
+
+        def schedule_poll() -> None:
+            if window.winfo_exists():
+                state["poll"] = window.after(50, poll_page)
+
+        def fetch_page() -> None:
+            try:
+                pages.put(lister.next_page())
+            except Exception as exc:  # noqa: BLE001
+                pages.put(exc)
+
+        def request_page() -> None:
+            if state["loading"] or lister.done:
+                return
+            state["loading"] = True
+            threading.Thread(
+                target=fetch_page,
+                name="autobackup-destination",
+                daemon=True,
+            ).start()
+            schedule_poll()
+
+        def insert_entry(entry: DestinationEntry) -> None:
+            if entry.is_dir:
+                note = "folder"
+            elif entry.orphan:
+                note = "orphan (no run)"
+            else:
+                note = entry.status or ""
+            ratio = entry.compression_ratio
+            tree.insert(
+                "",
+                "end",
+                values=(
+                    entry.name,
+                    _format_size(entry.size),
+                    entry.mtime.strftime("%Y-%m-%d %H:%M:%S") if entry.mtime else "",
+                    f"{ratio:.0%}" if ratio is not None else "",
+                    entry.run_id or "",
+                    entry.job_id or "",
+                    note,
+                ),
+                tags=("orphan",) if entry.orphan else (),
+            )
+
+        def poll_page() -> None:
+            if not window.winfo_exists():
+                lister.close()
+                return
+            try:
+                page = pages.get_nowait()
+            except queue.Empty:
+                schedule_poll()
+                return
+
+            state["loading"] = False
+            if isinstance(page, Exception):
+                lister.close()
+                status_var.set(f"Could not list folder contents: {page}")
+                return
+
+            for entry in page:
+                insert_entry(entry)
+            state["rows"] += len(page)
+            state["orphans"] += sum(1 for entry in page if entry.orphan)
 
-        if not entries:
-            listbox.insert("end", "<empty folder>")
-        else:
-            for name in entries:
-                listbox.insert("end", name)
+            more = "" if lister.done else " (scroll for more)"
+            status_var.set(
+                f"{state['rows']} entries, {state['orphans']} orphaned archives{more}"
+            )
+            if lister.done and state["rows"] == 0:
+                status_var.set("<empty folder>")
+
+        def on_yscroll(first: str, last: str) -> None:
+            vsb.set(first, last)
+            if float(last) >= 0.95:
+                window.after_idle(request_page)
+
+        def on_destroy(_event: Any) -> None:
+            lister.close()
+            if state["poll"] is not None:
+                try:
+                    window.after_cancel(state["poll"])
+                except tk.TclError:
+                    pass
+                state["poll"] = None
+
+        tree.configure(yscrollcommand=on_yscroll)
+        window.bind("<Destroy>", on_destroy, add="+")
+        request_page()
 
         # Buttons at the bottom
         btn_frame = ttk.Frame(window)
@@ -621,7 +1138,8 @@ class AutoBackupApp(tk.Tk):
         except Exception as exc:  # noqa: BLE001
             messagebox.showinfo(
                 "Destination folder",
-                f"Could not open system file manager.\n\nPath:\n{destination}\n\nError:\n{exc}",
+                "Could not open system file manager.\n\n"
+                f"Path:\n{destination}\n\nError:\n{exc}",
             )
 
     # ------------------------------------------------------------
@@ -652,7 +1170,7 @@ class AutoBackupApp(tk.Tk):
 
         window = tk.Toplevel(self)
         window.title("Edit Job" if is_edit else "Add Job")
-        window.geometry("500x330")
+        window.geometry("560x680")
         window.grab_set()
 
         # Variables
@@ -668,6 +1186,14 @@ class AutoBackupApp(tk.Tk):
             else "",
         )
         active_var = tk.BooleanVar(value=bool(job.active) if is_edit else True)
+        keep_vars = [
+            tk.StringVar(
+                value=str(getattr(job, column))
+                if is_edit and getattr(job, column) is not None
+                else "",
+            )
+            for column in ("keep_daily", "keep_weekly", "keep_monthly")
+        ]
 
         # Form
         form = ttk.Frame(window)
@@ -693,7 +1219,7 @@ class AutoBackupApp(tk.Tk):
         schedule_box = ttk.Combobox(
             form,
             textvariable=schedule_var,
-            values=["manual", "interval", "daily"],
+            values=["manual", "interval", "daily", "on_change"],
             state="readonly",
             width=15,
         )
@@ -710,7 +1236,8 @@ class AutoBackupApp(tk.Tk):
 
         def update_interval_state(*args: Any) -> None:
             schedule = schedule_var.get()
-            if schedule == "interval":
+            # For on_change jobs the interval is the minimum time between runs.
+            if schedule in ("interval", "on_change"):
                 interval_entry.configure(state="normal")
             else:
                 interval_entry.configure(state="disabled")
@@ -725,6 +1252,144 @@ class AutoBackupApp(tk.Tk):
             pady=5,
         )
 
+        # Empty = count-based retention (MAX_BACKUPS_PER_JOB newest backups).
+        ttk.Label(form, text="Keep daily/weekly/monthly:").grid(
+            row=6,
+            column=0,
+            sticky="w",
+        )
+        keep_frame = ttk.Frame(form)
+        keep_frame.grid(row=6, column=1, sticky="w", pady=5)
+        for var in keep_vars:
+            ttk.Entry(keep_frame, textvariable=var, width=5).pack(
+                side="left",
+                padx=(0, 5),
+            )
+
+        # The archive is written to these too, one path per line.
+        ttk.Label(form, text="Extra destinations:").grid(
+            row=7,
+            column=0,
+            sticky="nw",
+        )
+        extra_text = tk.Text(form, width=35, height=3)
+        extra_text.grid(row=7, column=1, sticky="we", pady=5)
+        if is_edit and job.extra_destinations:
+            extra_text.insert("1.0", str(job.extra_destinations))
+
+        # Performance profile: a preset plus optional overrides, applied from
+        # the next run on.
+        perf_frame = ttk.LabelFrame(form, text="Performance (empty = preset value)")
+        perf_frame.grid(row=8, column=0, columnspan=3, sticky="we", pady=5)
+
+        preset_var = tk.StringVar(
+            value=str(job.perf_preset)
+            if is_edit and job.perf_preset
+            else DEFAULT_PRESET,
+        )
+        codec_var = tk.StringVar(
+            value=str(job.compression_codec)
+            if is_edit and job.compression_codec
+            else "",
+        )
+        verify_labels = {None: "preset", True: "on", False: "off"}
+        verify_var = tk.StringVar(
+            value=verify_labels[job.verify_archive] if is_edit else "preset",
+        )
+
+        for column, (label_text, var, values) in enumerate(
+            (
+                ("Preset:", preset_var, list(PRESETS)),
+                ("Codec:", codec_var, ["", *CODECS]),
+                ("Verify:", verify_var, list(verify_labels.values())),
+            )
+        ):
+            ttk.Label(perf_frame, text=label_text).grid(
+                row=0,
+                column=column * 2,
+                sticky="w",
+                padx=(5, 2),
+            )
+            ttk.Combobox(
+                perf_frame,
+                textvariable=var,
+                values=values,
+                state="readonly",
+                width=9,
+            ).grid(row=0, column=column * 2 + 1, sticky="w", pady=3)
+
+        number_fields = [
+            ("compression_level", "Level:", int),
+            ("worker_threads", "Threads:", int),
+            ("read_buffer_kb", "Buffer KB:", int),
+            ("io_limit_mb_per_sec", "I/O MB/s:", float),
+            ("niceness", "Nice:", int),
+        ]
+        number_vars = {}
+        for index, (field, label_text, _) in enumerate(number_fields):
+            value = getattr(job, field) if is_edit else None
+            var = tk.StringVar(value="" if value is None else str(value))
+            number_vars[field] = var
+            row, column = 1 + index // 3, (index % 3) * 2
+            ttk.Label(perf_frame, text=label_text).grid(
+                row=row,
+                column=column,
+                sticky="w",
+                padx=(5, 2),
+            )
+            ttk.Entry(perf_frame, textvariable=var, width=8).grid(
+                row=row,
+                column=column + 1,
+                sticky="w",
+                pady=3,
+            )
+
+        # Source type: a folder, or a database dumped by pg_dump (source path
+        # = database name or connection string) or by a custom command.
+        source_frame = ttk.LabelFrame(form, text="Source")
+        source_frame.grid(row=9, column=0, columnspan=3, sticky="we", pady=5)
+        source_type_var = tk.StringVar(
+            value=str(job.source_type) if is_edit and job.source_type else "path",
+        )
+        source_command_var = tk.StringVar(
+            value=str(job.source_command) if is_edit and job.source_command else "",
+        )
+        ttk.Label(source_frame, text="Type:").grid(
+            row=0,
+            column=0,
+            sticky="w",
+            padx=(5, 2),
+        )
+        ttk.Combobox(
+            source_frame,
+            textvariable=source_type_var,
+            values=list(SOURCE_TYPES),
+            state="readonly",
+            width=9,
+        ).grid(row=0, column=1, sticky="w", pady=3)
+        ttk.Label(source_frame, text="Dump command (empty = pg_dump):").grid(
+            row=1,
+            column=0,
+            columnspan=2,
+            sticky="w",
+            padx=(5, 2),
+        )
+        source_command_entry = ttk.Entry(
+            source_frame,
+            textvariable=source_command_var,
+            width=35,
+        )
+        source_command_entry.grid(row=1, column=2, sticky="we", pady=3)
+
+        def update_source_state(*args: Any) -> None:
+            if source_type_var.get() == "pg_dump":
+                source_command_entry.configure(state="normal")
+            else:
+                source_command_entry.configure(state="disabled")
+
+        source_type_var.trace_add("write", update_source_state)
+        update_source_state()
+
         # Save logic
         def save_job() -> None:
             name = name_var.get().strip()
@@ -741,13 +1406,14 @@ class AutoBackupApp(tk.Tk):
                 )
                 return
 
-            if schedule == "interval":
-                if not interval_text:
-                    messagebox.showwarning(
-                        "Missing interval",
-                        "Interval minutes are required for interval schedule.",
-                    )
-                    return
+            if schedule == "interval" and not interval_text:
+                messagebox.showwarning(
+                    "Missing interval",
+                    "Interval minutes are required for interval schedule.",
+                )
+                return
+
+            if schedule in ("interval", "on_change") and interval_text:
                 try:
                     interval_value = int(interval_text)
                     if interval_value <= 0:
@@ -759,6 +1425,65 @@ class AutoBackupApp(tk.Tk):
                     )
                     return
 
+            keep_values: List[Optional[int]] = []
+            for var in keep_vars:
+                keep_text = var.get().strip()
+                if not keep_text:
+                    keep_values.append(None)
+                    continue
+                try:
+                    keep_value = int(keep_text)
+                    if keep_value < 0:
+                        raise ValueError
+                except ValueError:
+                    messagebox.showerror(
+                        "Invalid retention",
+                        "Keep daily/weekly/monthly must be empty or "
+                        "non-negative integers.",
+                    )
+                    return
+                keep_values.append(keep_value)
+            keep_daily, keep_weekly, keep_monthly = keep_values
+
+            extra_lines = [
+                line.strip() for line in extra_text.get("1.0", "end").splitlines()
+            ]
+            extra_destinations = "\n".join(line for line in extra_lines if line) or None
+
+            profile_values: dict[str, Any] = {}
+            for field, label_text, parse in number_fields:
+                text = number_vars[field].get().strip()
+                try:
+                    profile_values[field] = parse(text) if text else None
+                except ValueError:
+                    messagebox.showerror(
+                        "Invalid profile",
+                        f"{label_text.rstrip(':')} must be empty or a number.",
+                    )
+                    return
+            profile_values["codec"] = codec_var.get() or None
+            profile_values["verify"] = {"on": True, "off": False}.get(verify_var.get())
+            try:
+                resolve_profile(preset_var.get(), **profile_values)
+            except ValueError as exc:
+                messagebox.showerror("Invalid profile", str(exc))
+                return
+            source_type = source_type_var.get()
+            source_columns = {
+                "source_type": None if source_type == "path" else source_type,
+                "source_command": (
+                    source_command_var.get().strip() or None
+                    if source_type == "pg_dump"
+                    else None
+                ),
+            }
+            profile_columns = {
+                "perf_preset": preset_var.get(),
+                "compression_codec": profile_values.pop("codec"),
+                "verify_archive": profile_values.pop("verify"),
+                **profile_values,
+            }
+
             db = SessionLocal()
             try:
                 if is_edit and job is not None:
@@ -775,6 +1500,12 @@ class AutoBackupApp(tk.Tk):
                         int(interval_value) if interval_value is not None else None
                     )
                     job_db_any.active = bool(active_var.get())
+                    job_db_any.keep_daily = keep_daily
+                    job_db_any.keep_weekly = keep_weekly
+                    job_db_any.keep_monthly = keep_monthly
+                    job_db_any.extra_destinations = extra_destinations
+                    for column, value in {**source_columns, **profile_columns}.items():
+                        setattr(job_db_any, column, value)
                 else:
                     job_db_any = BackupJob(
                         name=name,
@@ -783,12 +1514,19 @@ class AutoBackupApp(tk.Tk):
                         schedule_type=schedule,
                         interval_minutes=interval_value,
                         active=active_var.get(),
+                        keep_daily=keep_daily,
+                        keep_weekly=keep_weekly,
+                        keep_monthly=keep_monthly,
+                        extra_destinations=extra_destinations,
+                        **source_columns,
+                        **profile_columns,
                     )
                     db.add(job_db_any)
 
+                db.flush()
+                publish_change(db, "job", job_db_any.id)
                 db.commit()
                 self.scheduler.reload()
-                self.load_jobs()
                 messagebox.showinfo("Success", "Job saved successfully.")
                 window.destroy()
             finally:
@@ -823,10 +1561,10 @@ class AutoBackupApp(tk.Tk):
                 return
 
             db.delete(job)
+            publish_change(db, "job", job_id)
             db.commit()
 
             self.scheduler.reload()
-            self.load_jobs()
             messagebox.showinfo("Deleted", "Job removed successfully.")
         finally:
             db.close()
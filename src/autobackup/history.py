@@ -0,0 +1,88 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+
+from autobackup.clock import local_midnight
+from autobackup.models import BackupRun
+
+HISTORY_PAGE_SIZE = 200
+MESSAGE_PREVIEW_CHARS = 80
+
+# Keyset position of a row in the history: (start_time, id).
+HistoryKey = Tuple[datetime, int]
+
+
+@dataclass(frozen=True)
+class HistoryFilters:
+    job_id: Optional[int] = None
+    status: Optional[str] = None
+    start_day: Optional[date] = None
+    end_day: Optional[date] = None
+
+
+def fetch_history_page(
+    db: Session,
+    filters: HistoryFilters,
+    after: Optional[HistoryKey] = None,
+    newest_first: bool = True,
+    backwards: bool = False,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> List[Any]:
+    """
+    Return one page of run rows in display order, using keyset pagination.
+
+    Rows come strictly after ``after`` in display order (or strictly before it
+    when ``backwards`` is set), so the cost of a page does not depend on how
+    deep into the history it is. Only the columns shown in the history window
+    are selected, with the message cut to a short preview.
+
+    Each row has: id, job_id, status, start_time, end_time, the progress_*
+    snapshot counters and message_preview.
+    """
+    key = tuple_(BackupRun.start_time, BackupRun.id)
+    descending = newest_first != backwards
+
+    stmt = select(
+        BackupRun.id,
+        BackupRun.job_id,
+        BackupRun.status,
+        BackupRun.start_time,
+        BackupRun.end_time,
+        BackupRun.progress_files_done,
+        BackupRun.progress_files_total,
+        BackupRun.progress_bytes_done,
+        BackupRun.progress_bytes_total,
+        func.substr(BackupRun.message, 1, MESSAGE_PREVIEW_CHARS).label(
+            "message_preview"
+        ),
+    ).where(BackupRun.start_time.is_not(None))
+
+    if filters.job_id is not None:
+        stmt = stmt.where(BackupRun.job_id == filters.job_id)
+    if filters.status:
+        stmt = stmt.where(BackupRun.status == filters.status)
+    if filters.start_day is not None:
+        stmt = stmt.where(BackupRun.start_time >= local_midnight(filters.start_day))
+    if filters.end_day is not None:
+        end = local_midnight(filters.end_day + timedelta(days=1))
+        stmt = stmt.where(BackupRun.start_time < end)
+
+    if after is not None:
+        bound = tuple_(*after)
+        stmt = stmt.where(key < bound if descending else key > bound)
+
+    if descending:
+        stmt = stmt.order_by(BackupRun.start_time.desc(), BackupRun.id.desc())
+    else:
+        stmt = stmt.order_by(BackupRun.start_time.asc(), BackupRun.id.asc())
+
+    rows = list(db.execute(stmt.limit(limit)).all())
+    if backwards:
+        rows.reverse()
+    return rows
@@ -0,0 +1,123 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.db import SessionLocal
+from autobackup.events import ChangeEvent, subscribe
+from autobackup.models import BackupJob, BackupRun
+
+
+def load_job_rows(db: Session, job_ids: Optional[Iterable[int]] = None) -> List[Any]:
+    """
+    Jobs with their latest run, in one query.
+
+    The latest run is found per job with a correlated subquery on the
+    (job_id, start_time) index, so the cost does not depend on the history.
+    """
+    latest_run_id = (
+        select(BackupRun.id)
+        .where(BackupRun.job_id == BackupJob.id)
+        .order_by(BackupRun.start_time.desc(), BackupRun.id.desc())
+        .limit(1)
+        .correlate(BackupJob)
+        .scalar_subquery()
+    )
+
+    stmt = (
+        select(
+            BackupJob.id,
+            BackupJob.name,
+            BackupJob.source_path,
+            BackupJob.destination_path,
+            BackupJob.schedule_type,
+            BackupJob.interval_minutes,
+            BackupJob.active,
+            BackupRun.status.label("last_status"),
+            BackupRun.start_time.label("last_start_time"),
+            BackupRun.progress_files_done,
+            BackupRun.progress_files_total,
+            BackupRun.progress_bytes_done,
+            BackupRun.progress_bytes_total,
+        )
+        .outerjoin(BackupRun, BackupRun.id == latest_run_id)
+        .order_by(BackupJob.id)
+    )
+    if job_ids is not None:
+        stmt = stmt.where(BackupJob.id.in_(list(job_ids)))
+
+    return list(db.execute(stmt).all())
+
+
+class JobCache:
+    """In-process cache of job rows and their last run, fed by change events.
+
+    Change notifications only mark jobs as dirty; ``refresh_dirty()`` then
+    reloads just those jobs. Nothing is queried while nothing changes.
+    """
+
+    def __init__(self, session_factory: sessionmaker[Session] = SessionLocal) -> None:
+        self._session_factory = session_factory
+        self._rows: Dict[int, Any] = {}
+        self._dirty: Set[int] = set()
+        self._stale = False
+        self._lock = threading.Lock()
+        self._unsubscribe = subscribe(self._on_change)
+
+    def close(self) -> None:
+        self._unsubscribe()
+
+    def _on_change(self, change: ChangeEvent) -> None:
+        with self._lock:
+            if change.kind == "jobs":
+                self._stale = True
+            else:
+                self._dirty.add(change.job_id)
+
+    def has_changes(self) -> bool:
+        with self._lock:
+            return bool(self._dirty)
+
+    def needs_reload_all(self) -> bool:
+        """Whether many jobs changed at once (reload_all() is then cheaper)."""
+        with self._lock:
+            return self._stale
+
+    def rows(self) -> List[Any]:
+        return [self._rows[job_id] for job_id in sorted(self._rows)]
+
+    def reload_all(self) -> List[Any]:
+        with self._lock:
+            self._dirty.clear()
+            self._stale = False
+        db = self._session_factory()
+        try:
+            self._rows = {row.id: row for row in load_job_rows(db)}
+        finally:
+            db.close()
+        return self.rows()
+
+    def refresh_dirty(self) -> Tuple[List[Any], List[int]]:
+        """Reload changed jobs. Returns (updated rows, ids of removed jobs)."""
+        with self._lock:
+            job_ids = set(self._dirty)
+            self._dirty.clear()
+        if not job_ids:
+            return [], []
+
+        db = self._session_factory()
+        try:
+            updated = load_job_rows(db, job_ids)
+        finally:
+            db.close()
+
+        for row in updated:
+            self._rows[row.id] = row
+        removed = sorted(job_ids - {row.id for row in updated})
+        for job_id in removed:
+            self._rows.pop(job_id, None)
+        return updated, removed
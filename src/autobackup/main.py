@@ -4,9 +4,12 @@ import logging
 import traceback
 from pathlib import Path
 
-from autobackup.db import Base, engine
-from autobackup.scheduler import BackupScheduler
+from autobackup.api import start_api
+from autobackup.db import SessionLocal, engine, upgrade_schema
 from autobackup.gui import run_app
+from autobackup.scheduler import BackupScheduler
+from autobackup.stats import ensure_daily_stats
+from autobackup.tracing import configure_tracing
 
 
 def configure_logging() -> None:
@@ -43,14 +46,22 @@ def main() -> None:
     """Application entry point: init DB, start scheduler, launch GUI."""
     configure_logging()
 
-    logging.info("Creating database tables if not exist...")
-    Base.metadata.create_all(bind=engine)
+    logging.info("Creating or upgrading database tables...")
+    upgrade_schema(engine)
+    configure_tracing()
+
+    db = SessionLocal()
+    try:
+        ensure_daily_stats(db)
+    finally:
+        db.close()
 
     scheduler = BackupScheduler()
 
     logging.info("Starting BackupScheduler...")
     scheduler.start()
     logging.info("BackupScheduler started (non-blocking).")
+    api = start_api(scheduler.runs)
 
     try:
         logging.info("Starting AutoBackup GUI...")
@@ -61,6 +72,8 @@ def main() -> None:
         print("\nERROR while running GUI:", exc)
         traceback.print_exc()
     finally:
+        if api is not None:
+            api.stop()
         logging.info("Shutting down scheduler...")
         try:
             scheduler.stop()
@@ -1,16 +1,21 @@
 # pyright: reportAttributeAccessIssue=false, reportGeneralTypeIssues=false
-from datetime import datetime
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     String,
+    Text,
 )
 from sqlalchemy.orm import relationship
 
+from autobackup.clock import db_now
 from autobackup.db import Base
 
 
@@ -21,32 +26,228 @@ class BackupJob(Base):
     name = Column(String(200), nullable=False)
     source_path = Column(String(500), nullable=False)
     destination_path = Column(String(500), nullable=False)
+    # "path" (NULL) archives the folder source_path. "pg_dump" archives the
+    # output of pg_dump for the database source_path, or of source_command
+    # when set, streamed without a temporary file (see dump.py).
+    source_type = Column(String(20), nullable=True)
+    source_command = Column(Text, nullable=True)
 
     schedule_type = Column(String(50), nullable=False, default="manual")
     interval_minutes = Column(Integer, nullable=True)
     active = Column(Boolean, nullable=False, default=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Grandfather-father-son retention: keep the newest backup of each of the
+    # last N days / weeks / months. All NULL = keep MAX_BACKUPS_PER_JOB newest.
+    keep_daily = Column(Integer, nullable=True)
+    keep_weekly = Column(Integer, nullable=True)
+    keep_monthly = Column(Integer, nullable=True)
+
+    # Further destinations written from the same archive stream, one per line.
+    extra_destinations = Column(Text, nullable=True)
+
+    # Performance profile: a preset ("fast", "balanced", "smallest"; NULL =
+    # balanced) and optional per-field overrides (NULL = preset value).
+    perf_preset = Column(String(20), nullable=True)
+    compression_codec = Column(String(20), nullable=True)
+    compression_level = Column(Integer, nullable=True)
+    worker_threads = Column(Integer, nullable=True)
+    read_buffer_kb = Column(Integer, nullable=True)
+    io_limit_mb_per_sec = Column(Float, nullable=True)
+    niceness = Column(Integer, nullable=True)
+    verify_archive = Column(Boolean, nullable=True)
+
+    created_at = Column(DateTime, default=db_now)
 
     runs = relationship(
         "BackupRun",
         back_populates="job",
         cascade="all, delete-orphan",
     )
+    daily_stats = relationship(
+        "BackupDailyStat",
+        cascade="all, delete-orphan",
+    )
+    baseline = relationship(
+        "BackupJobBaseline",
+        cascade="all, delete-orphan",
+        uselist=False,
+    )
 
 
 class BackupRun(Base):
     __tablename__ = "backup_runs"
+    __table_args__ = (
+        # Serves retention and "latest runs of a job" queries.
+        Index("ix_backup_runs_job_status_start", "job_id", "status", "start_time"),
+        # Latest run of a job (job list, change cache).
+        Index("ix_backup_runs_job_start", "job_id", "start_time"),
+        # Keyset pagination of the history window.
+        Index("ix_backup_runs_start_id", "start_time", "id"),
+        # Archive file -> run lookups (destination browser).
+        Index("ix_backup_runs_output_file", "output_file"),
+        # Delta bases a job's runs refer to (retention keeps them).
+        Index("ix_backup_runs_job_delta_base", "job_id", "delta_base_run_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     job_id = Column(Integer, ForeignKey("backup_jobs.id"), nullable=False)
 
-    start_time = Column(DateTime, default=datetime.utcnow)
+    start_time = Column(DateTime, default=db_now)
     end_time = Column(DateTime, nullable=True)
 
     status = Column(String(50), nullable=False, default="pending")
     message = Column(String(1000), nullable=True)
     output_file = Column(String(500), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    # Bytes of holes in sparse source files that were not read or stored.
+    sparse_bytes_skipped = Column(BigInteger, nullable=True)
+    # Delta mode: the run whose archive large files were diffed against (kept
+    # by retention while referenced), the length of the chain of deltas up to
+    # this run and the bytes not stored thanks to it (see delta.py).
+    delta_base_run_id = Column(Integer, nullable=True)
+    delta_depth = Column(Integer, nullable=True)
+    delta_bytes_saved = Column(BigInteger, nullable=True)
+    # Recycle mode: source bytes whose compressed entries were copied from
+    # the previous archive instead of being compressed again (see recycle.py).
+    recycled_bytes = Column(BigInteger, nullable=True)
+    # Why the run was flagged as a performance regression against the job's
+    # baseline, or None (see baselines.py).
+    perf_regression = Column(String(500), nullable=True)
+    # Dump sources: exit status of the dump command and bytes it produced.
+    dump_exit_status = Column(Integer, nullable=True)
+    dump_bytes = Column(BigInteger, nullable=True)
+
+    # Progress snapshot of a running backup, written every few seconds.
+    progress_current_file = Column(String(500), nullable=True)
+    progress_files_done = Column(Integer, nullable=True)
+    progress_files_total = Column(Integer, nullable=True)
+    progress_bytes_done = Column(BigInteger, nullable=True)
+    progress_bytes_total = Column(BigInteger, nullable=True)
+    progress_updated_at = Column(DateTime, nullable=True)
+
+    # Crash recovery: the archive being written and its last sealed segment,
+    # so an interrupted run can be resumed (see checkpoint.py).
+    checkpoint_file = Column(String(500), nullable=True)
+    checkpoint_segment = Column(Integer, nullable=True)
+    checkpoint_offset = Column(BigInteger, nullable=True)
+    checkpoint_size = Column(BigInteger, nullable=True)
+    checkpoint_files_done = Column(Integer, nullable=True)
+    resume_count = Column(Integer, nullable=True)
 
     job = relationship("BackupJob", back_populates="runs")
+    destinations = relationship(
+        "BackupRunDestination",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="BackupRunDestination.position",
+    )
+
+
+class BackupRunDestination(Base):
+    """Outcome of one destination of a run of a job with several destinations."""
+
+    __tablename__ = "backup_run_destinations"
+
+    run_id = Column(
+        Integer,
+        ForeignKey("backup_runs.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    position = Column(Integer, primary_key=True)
+
+    destination = Column(String(500), nullable=False)
+    status = Column(String(50), nullable=False)
+    message = Column(String(1000), nullable=True)
+    output_file = Column(String(500), nullable=True, index=True)
+    size_bytes = Column(BigInteger, nullable=True)
+
+
+class BackupDailyStat(Base):
+    """Per-job, per-day run counters, updated when each run finishes.
+
+    The dashboard reads this rollup instead of scanning backup_runs, so its
+    cost does not depend on the size of the run history. Counters are kept
+    when old runs are pruned by retention, and the row is the summary that
+    remains once history compaction has removed the detailed runs.
+    """
+
+    __tablename__ = "backup_daily_stats"
+    __table_args__ = (Index("ix_backup_daily_stats_day", "day"),)
+
+    job_id = Column(Integer, ForeignKey("backup_jobs.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+
+    total_runs = Column(Integer, nullable=False, default=0)
+    success_count = Column(Integer, nullable=False, default=0)
+    failure_count = Column(Integer, nullable=False, default=0)
+    total_duration_seconds = Column(Float, nullable=False, default=0.0)
+    duration_count = Column(Integer, nullable=False, default=0)
+    total_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    last_error = Column(String(1000), nullable=True)
+    last_error_at = Column(DateTime, nullable=True)
+
+    # Detailed runs of this day removed by history compaction.
+    compacted_runs = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class BackupJobBaseline(Base):
+    """Rolling performance baseline of a job, updated when each run succeeds.
+
+    ``samples`` holds the last BASELINE_WINDOW_RUNS successful runs as a JSON
+    list of [duration s, throughput B/s, archive bytes]; the percentiles are
+    recomputed from it, so the dashboard and the metrics read one row per job.
+    """
+
+    __tablename__ = "backup_job_baselines"
+
+    job_id = Column(Integer, ForeignKey("backup_jobs.id"), primary_key=True)
+    samples = Column(Text, nullable=False, default="[]")
+    sample_count = Column(Integer, nullable=False, default=0)
+
+    duration_p50 = Column(Float, nullable=True)
+    duration_p95 = Column(Float, nullable=True)
+    throughput_p50 = Column(Float, nullable=True)
+    throughput_p95 = Column(Float, nullable=True)
+    bytes_p50 = Column(BigInteger, nullable=True)
+    bytes_p95 = Column(BigInteger, nullable=True)
+
+    regression_count = Column(Integer, nullable=False, default=0)
+    last_regression_run_id = Column(Integer, nullable=True)
+    last_regression_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+
+class ChangeVersion(Base):
+    """Counter bumped by every change of job definitions on SQLite.
+
+    SQLite has no notification channel; other processes poll it instead (see
+    events.SQLiteChangePoller).
+    """
+
+    __tablename__ = "change_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SchedulerNode(Base):
+    """A scheduler node in cluster mode; its row is a lease renewed by heartbeats."""
+
+    __tablename__ = "scheduler_nodes"
+
+    node_id = Column(String(100), primary_key=True)
+    hostname = Column(String(255), nullable=True)
+    started_at = Column(DateTime, default=db_now)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)
+
+
+class JobFiring(Base):
+    """Claim of one scheduled firing of a job; the primary key makes it unique."""
+
+    __tablename__ = "job_firings"
 
+    job_id = Column(Integer, primary_key=True)
+    scheduled_at = Column(DateTime, primary_key=True)
+    node_id = Column(String(100), nullable=False)
+    claimed_at = Column(DateTime, default=db_now, index=True)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import threading
+import zipfile
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from autobackup.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CODECS: Dict[str, int] = {
+    "deflate": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+    "store": zipfile.ZIP_STORED,
+}
+
+# Valid compression levels per codec (None = the codec takes no level).
+LEVEL_RANGES: Dict[str, Optional[range]] = {
+    "deflate": range(0, 10),
+    "bzip2": range(1, 10),
+    "lzma": None,
+    "store": None,
+}
+
+DEFAULT_PRESET = "balanced"
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """How a job's backups trade speed, size and system load."""
+
+    codec: str = "deflate"
+    compression_level: Optional[int] = None  # None = codec default
+    worker_threads: int = 8  # read-ahead threads; 0 = read inline
+    read_buffer_kb: int = 1024  # chunk size for streaming large files
+    io_limit_mb_per_sec: float = 0  # source read rate cap; 0 = unlimited
+    niceness: int = 0  # CPU niceness of the run (Linux/Unix)
+    verify: bool = False  # re-read the archive and check CRCs afterwards
+
+    @property
+    def compress_type(self) -> int:
+        return CODECS[self.codec]
+
+
+PRESETS: Dict[str, PerformanceProfile] = {
+    "fast": PerformanceProfile(
+        codec="deflate",
+        compression_level=1,
+        worker_threads=16,
+        read_buffer_kb=4096,
+    ),
+    "balanced": PerformanceProfile(),
+    "smallest": PerformanceProfile(
+        codec="lzma",
+        worker_threads=4,
+        niceness=10,
+        verify=True,
+    ),
+}
+
+
+def default_profile() -> PerformanceProfile:
+    """The "balanced" preset, with read-ahead threads from the environment."""
+    return replace(PRESETS[DEFAULT_PRESET], worker_threads=settings.readahead_workers)
+
+
+def check_profile(profile: PerformanceProfile) -> None:
+    """Raise ValueError if the profile's values are out of range."""
+    if profile.codec not in CODECS:
+        raise ValueError(f"Unknown codec {profile.codec!r}")
+    levels = LEVEL_RANGES[profile.codec]
+    if profile.compression_level is not None and (
+        levels is None or profile.compression_level not in levels
+    ):
+        if levels is None:
+            raise ValueError(f"Codec {profile.codec} has no compression level")
+        raise ValueError(
+            f"Compression level for {profile.codec} must be "
+            f"{levels.start}-{levels.stop - 1}"
+        )
+    if not 0 <= profile.worker_threads <= 64:
+        raise ValueError("Worker threads must be 0-64")
+    if not 4 <= profile.read_buffer_kb <= 65536:
+        raise ValueError("Read buffer must be 4-65536 KB")
+    if profile.io_limit_mb_per_sec < 0:
+        raise ValueError("I/O limit must not be negative")
+    if not 0 <= profile.niceness <= 19:
+        raise ValueError("Niceness must be 0-19")
+
+
+def _preset_profile(preset: Optional[str]) -> PerformanceProfile:
+    preset = preset or DEFAULT_PRESET
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown performance preset {preset!r}")
+    return default_profile() if preset == DEFAULT_PRESET else PRESETS[preset]
+
+
+def resolve_profile(
+    preset: Optional[str],
+    codec: Optional[str] = None,
+    compression_level: Optional[int] = None,
+    worker_threads: Optional[int] = None,
+    read_buffer_kb: Optional[int] = None,
+    io_limit_mb_per_sec: Optional[float] = None,
+    niceness: Optional[int] = None,
+    verify: Optional[bool] = None,
+) -> PerformanceProfile:
+    """A preset with overrides applied (None = preset value).
+
+    Raises ValueError for an unknown preset or out-of-range values.
+    """
+    base = _preset_profile(preset)
+    overrides: Dict[str, Any] = {
+        name: value
+        for name, value in (
+            ("compression_level", compression_level),
+            ("worker_threads", worker_threads),
+            ("read_buffer_kb", read_buffer_kb),
+            ("io_limit_mb_per_sec", io_limit_mb_per_sec),
+            ("niceness", niceness),
+            ("verify", verify),
+        )
+        if value is not None
+    }
+    if codec:
+        overrides["codec"] = codec
+        # The preset's level belongs to the preset's codec.
+        if compression_level is None and codec != base.codec:
+            overrides["compression_level"] = None
+
+    profile = replace(base, **overrides)
+    check_profile(profile)
+    return profile
+
+
+def profile_for_job(job: Any) -> PerformanceProfile:
+    """
+    The effective profile of a job: its preset, with the job's own overrides.
+
+    Read from the job row at the start of every run, so edits apply to the
+    next run without a restart. Jobs without a preset use "balanced", whose
+    read-ahead settings come from the environment.
+    """
+    try:
+        return resolve_profile(
+            job.perf_preset,
+            codec=job.compression_codec,
+            compression_level=job.compression_level,
+            worker_threads=job.worker_threads,
+            read_buffer_kb=job.read_buffer_kb,
+            io_limit_mb_per_sec=job.io_limit_mb_per_sec,
+            niceness=job.niceness,
+            verify=job.verify_archive,
+        )
+    except ValueError as exc:
+        logger.warning(
+            "Job %s has an invalid profile (%s); using defaults", job.id, exc
+        )
+        return default_profile()
+
+
+def run_with_niceness(niceness: int, func: Callable[[], T]) -> T:
+    """
+    Run ``func`` on a fresh thread whose CPU niceness is raised by ``niceness``.
+
+    On Linux niceness is per thread and inherited by threads it starts (the
+    read-ahead pool), and an unprivileged process cannot lower it again, so
+    the work runs on a throw-away thread instead of a pooled scheduler thread.
+    """
+    if niceness <= 0 or not hasattr(os, "setpriority"):
+        return func()
+
+    result: Dict[str, Any] = {}
+    # Carry context variables (the current trace span) over to the new thread.
+    context = contextvars.copy_context()
+
+    def target() -> None:
+        try:
+            tid = threading.get_native_id()
+            current = os.getpriority(os.PRIO_PROCESS, tid)
+            os.setpriority(os.PRIO_PROCESS, tid, min(19, current + niceness))
+        except OSError as exc:
+            logger.warning("Could not lower backup priority: %s", exc)
+        try:
+            result["value"] = context.run(func)
+        except BaseException as exc:  # noqa: BLE001
+            result["error"] = exc
+
+    thread = threading.Thread(target=target, name="autobackup-niced-run")
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
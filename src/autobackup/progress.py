@@ -0,0 +1,147 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.events import publish_change
+from autobackup.models import BackupRun
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Progress of a running backup, emitted by the engine."""
+
+    current_file: str
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+def format_progress(
+    files_done: Optional[int],
+    files_total: Optional[int],
+    bytes_done: Optional[int],
+    bytes_total: Optional[int],
+) -> str:
+    """Short human readable progress, e.g. "42% (1200/3000 files)"."""
+    if files_total is None:
+        return ""
+    percent = 100.0 * (bytes_done or 0) / bytes_total if bytes_total else 0.0
+    return f"{percent:.0f}% ({files_done or 0}/{files_total} files)"
+
+
+class ProgressRecorder:
+    """Write-behind persistence of progress snapshots for one run.
+
+    The engine may call the recorder as often as it likes: each call only
+    replaces the latest event in memory. A background thread writes the latest
+    snapshot to backup_runs at most once every ``interval`` seconds, so the
+    number of database writes is bounded regardless of how many files the
+    backup has.
+
+    progress_updated_at is written on every interval, even when no new event
+    came in (collecting the files, verifying the archive, a dump that has not
+    produced data yet): it is the run's heartbeat, and recovery takes over
+    running runs whose heartbeat stopped (see recovery.py).
+    """
+
+    def __init__(
+        self,
+        run_id: int,
+        job_id: int,
+        interval: Optional[float] = None,
+        session_factory: sessionmaker[Session] = SessionLocal,
+    ) -> None:
+        self._run_id = run_id
+        self._job_id = job_id
+        self._interval = max(
+            0.5,
+            settings.progress_flush_seconds if interval is None else interval,
+        )
+        self._session_factory = session_factory
+
+        self._lock = threading.Lock()
+        self._latest: Optional[ProgressEvent] = None
+        self._dirty = False
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __call__(self, event: ProgressEvent) -> None:
+        with self._lock:
+            self._latest = event
+            self._dirty = True
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"autobackup-progress-{self._run_id}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop flushing. The final state is written by the caller with the run."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def latest(self) -> Optional[ProgressEvent]:
+        with self._lock:
+            return self._latest
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self._interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            event = self._latest
+            dirty = self._dirty
+            self._dirty = False
+
+        values = {"progress_updated_at": db_now()}
+        if event is not None and dirty:
+            values.update(
+                progress_current_file=event.current_file[-500:],
+                progress_files_done=event.files_done,
+                progress_files_total=event.files_total,
+                progress_bytes_done=event.bytes_done,
+                progress_bytes_total=event.bytes_total,
+            )
+
+        db = self._session_factory()
+        try:
+            db.execute(
+                update(BackupRun)
+                .where(BackupRun.id == self._run_id, BackupRun.status == "running")
+                .values(**values)
+            )
+            if len(values) > 1:
+                # A heartbeat alone changes nothing the views show.
+                publish_change(db, "run", self._job_id, self._run_id)
+            db.commit()
+        except Exception as exc:  # noqa: BLE001
+            db.rollback()
+            logger.warning("Could not store progress of run %s: %s", self._run_id, exc)
+        finally:
+            db.close()
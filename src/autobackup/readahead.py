@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from autobackup.config import settings
+
+# Upper bound on queued read tasks per worker.
+_MAX_PENDING_PER_WORKER = 16
+# Small files are read in runs of up to this many files / bytes per task.
+_BATCH_FILES = 64
+_BATCH_BYTES = 1024 * 1024
+
+
+@dataclass
+class SourceFile:
+    """A file of the source tree, ready to be added to the archive.
+
+    ``data`` holds the whole content of small files (read ahead); it is None
+    for large files, which the archiver streams itself from ``path``.
+    """
+
+    path: Path
+    stat: os.stat_result
+    data: Optional[bytes]
+
+
+def _read_small(path: Path, size_hint: int) -> SourceFile:
+    """open + fstat + one read() for the whole file (plus more if it grew)."""
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        st = os.fstat(fd)
+        want = max(st.st_size, size_hint) + 1
+        data = os.read(fd, want)
+        if len(data) == want:
+            # Grew since the walk; read the rest.
+            parts = [data]
+            while chunk := os.read(fd, 1024 * 1024):
+                parts.append(chunk)
+            data = b"".join(parts)
+        return SourceFile(path, st, data)
+    finally:
+        os.close(fd)
+
+
+def _read_batch(batch: List[Tuple[Path, int]]) -> List[SourceFile]:
+    return [_read_small(path, size) for path, size in batch]
+
+
+class ReadAhead:
+    """Reads upcoming source files on a thread pool, in walk order.
+
+    Files up to ``small_file_size`` bytes are read whole by ``workers``
+    threads while the archiver compresses earlier ones, so open/read latency
+    (NFS, slow disks) overlaps with compression and writing. At most
+    ``buffer_bytes`` of file content is held ahead of the archiver. Larger
+    files are yielded without data and streamed by the caller.
+
+    With ``workers`` <= 0 files are read inline, one at a time.
+    """
+
+    def __init__(
+        self,
+        files: List[Tuple[Path, int]],
+        workers: Optional[int] = None,
+        buffer_bytes: Optional[int] = None,
+        small_file_size: Optional[int] = None,
+    ) -> None:
+        self._files = files
+        self._workers = settings.readahead_workers if workers is None else workers
+        self._buffer_bytes = (
+            settings.readahead_buffer_mb * 1024 * 1024
+            if buffer_bytes is None
+            else buffer_bytes
+        )
+        self._small = (
+            settings.readahead_small_file_kb * 1024
+            if small_file_size is None
+            else small_file_size
+        )
+
+    def _large(self, path: Path) -> SourceFile:
+        return SourceFile(path, os.stat(path), None)
+
+    def __iter__(self) -> Iterator[SourceFile]:
+        if self._workers <= 0:
+            for path, size in self._files:
+                if size <= self._small:
+                    yield _read_small(path, size)
+                else:
+                    yield self._large(path)
+            return
+
+        # Each task reads a run of consecutive small files, which keeps the
+        # per-task overhead negligible when reads are fast (page cache).
+        pending: Deque[
+            Tuple[List[Tuple[Path, int]], Optional[Future[List[SourceFile]]]]
+        ]
+        pending = deque()
+        max_pending = self._workers * _MAX_PENDING_PER_WORKER
+        buffered = 0
+        next_index = 0
+        total = len(self._files)
+
+        with ThreadPoolExecutor(
+            max_workers=self._workers,
+            thread_name_prefix="autobackup-readahead",
+        ) as pool:
+            try:
+                while next_index < total or pending:
+                    while (
+                        next_index < total
+                        and len(pending) < max_pending
+                        and (buffered < self._buffer_bytes or not pending)
+                    ):
+                        path, size = self._files[next_index]
+                        if size > self._small:
+                            pending.append(([(path, size)], None))
+                            next_index += 1
+                            continue
+
+                        batch: List[Tuple[Path, int]] = []
+                        batch_bytes = 0
+                        while (
+                            next_index < total
+                            and len(batch) < _BATCH_FILES
+                            and batch_bytes < _BATCH_BYTES
+                        ):
+                            path, size = self._files[next_index]
+                            if size > self._small:
+                                break
+                            batch.append((path, size))
+                            batch_bytes += size
+                            next_index += 1
+
+                        pending.append((batch, pool.submit(_read_batch, batch)))
+                        buffered += batch_bytes
+
+                    batch, future = pending.popleft()
+                    if future is None:
+                        yield self._large(batch[0][0])
+                        continue
+                    buffered -= sum(size for _, size in batch)
+                    yield from future.result()
+            finally:
+                for _, future in pending:
+                    if future is not None:
+                        future.cancel()
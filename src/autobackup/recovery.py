@@ -0,0 +1,156 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from sqlalchemy import ColumnElement, func, select, update
+from sqlalchemy.orm import Session
+
+from autobackup.backup_engine import cancel_queued_run
+from autobackup.checkpoint import discard_checkpoint_files
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.events import publish_change
+from autobackup.models import BackupJob, BackupRun
+from autobackup.stats import record_finished_run
+
+logger = logging.getLogger(__name__)
+
+INTERRUPTED_MESSAGE = "Interrupted: the backup process stopped during the run"
+ABANDONED_MESSAGE = "Not started: the backup process stopped while the run was queued"
+
+
+def _last_seen() -> ColumnElement[datetime]:
+    return func.coalesce(BackupRun.progress_updated_at, BackupRun.start_time)
+
+
+def find_interrupted_runs(
+    db: Session,
+    last_seen_before: datetime,
+    job_filter: Optional[Callable[[int], bool]] = None,
+) -> List[BackupRun]:
+    """Runs still "running" whose last heartbeat is older than the cutoff.
+
+    The heartbeat is progress_updated_at, written by the run's ProgressRecorder
+    on every flush interval; runs that never wrote one count from start_time.
+    """
+    runs = list(
+        db.execute(
+            select(BackupRun)
+            .where(BackupRun.status == "running", _last_seen() < last_seen_before)
+            .order_by(BackupRun.id)
+        ).scalars()
+    )
+    if job_filter is not None:
+        runs = [run for run in runs if job_filter(run.job_id)]
+    return runs
+
+
+def _take_over(db: Session, run: BackupRun, last_seen_before: datetime) -> bool:
+    """
+    Claim an interrupted run by renewing its heartbeat.
+
+    False if the run has sent a heartbeat since it was read, or if another
+    process (a second recovery pass, another node) claimed it first: the
+    conditional UPDATE matches the row at most once.
+    """
+    result = db.execute(
+        update(BackupRun)
+        .where(
+            BackupRun.id == run.id,
+            BackupRun.status == "running",
+            _last_seen() < last_seen_before,
+        )
+        .values(progress_updated_at=db_now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _resumable(db: Session, run: BackupRun) -> Optional[str]:
+    """None if the run can be resumed, else the reason why not."""
+    if not run.checkpoint_file:
+        return "the archive is not checkpointed"
+    attempts = run.resume_count or 0
+    if attempts >= settings.max_resume_attempts:
+        return (
+            f"resume attempts exhausted "
+            f"({attempts} of {settings.max_resume_attempts})"
+        )
+    job = db.get(BackupJob, run.job_id)
+    if job is None or not job.active:
+        return "the job is no longer active"
+    return None
+
+
+def _fail_run(db: Session, run: BackupRun, reason: str) -> None:
+    if run.checkpoint_file:
+        archive = Path(run.checkpoint_file)
+        archive.unlink(missing_ok=True)
+        discard_checkpoint_files(archive)
+
+    run.status = "error"
+    run.end_time = db_now()
+    run.output_file = None
+    run.message = f"{INTERRUPTED_MESSAGE}; {reason}"[:1000]
+    record_finished_run(db, run)
+    publish_change(db, "run", run.job_id, run.id)
+
+
+def reconcile_interrupted_runs(
+    db: Session,
+    last_seen_before: datetime,
+    job_filter: Optional[Callable[[int], bool]] = None,
+) -> List[int]:
+    """
+    Settle runs left "running" by a process that stopped mid-backup.
+
+    Runs that can continue (checkpointed archive, active job, resume attempts
+    left) are left "running" and their ids returned, for the caller to pass
+    to resume_backup_run. The others are marked as failed and their partial
+    archive is deleted.
+    """
+    to_resume: List[int] = []
+    for run in find_interrupted_runs(db, last_seen_before, job_filter):
+        if not _take_over(db, run, last_seen_before):
+            continue
+        reason = _resumable(db, run)
+        if reason is None:
+            to_resume.append(run.id)
+            continue
+        _fail_run(db, run, f"not resumed: {reason}")
+        logger.warning(
+            "Run %s of job %s was interrupted (%s)", run.id, run.job_id, reason
+        )
+    db.commit()
+
+    if to_resume:
+        logger.info("Interrupted runs to resume: %s", to_resume)
+    return to_resume
+
+
+def cancel_abandoned_queued_runs(db: Session, queued_before: datetime) -> int:
+    """
+    Settle runs still "queued" by a process that stopped before starting them.
+
+    Only called without a cluster: a queued run of another node may wait for a
+    long time. There, abandoned queued runs are pruned by retention like runs
+    stuck in "running".
+    """
+    runs = list(
+        db.execute(
+            select(BackupRun).where(
+                BackupRun.status == "queued",
+                BackupRun.start_time < queued_before,
+            )
+        ).scalars()
+    )
+    for run in runs:
+        cancel_queued_run(db, run, ABANDONED_MESSAGE)
+    db.commit()
+    if runs:
+        logger.warning("Cancelled %s runs queued before the restart", len(runs))
+    return len(runs)
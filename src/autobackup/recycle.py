@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from autobackup.delta import DELTA_EXTRA_ID
+from autobackup.sparse import find_extra_field
+
+logger = logging.getLogger(__name__)
+
+# Zip extra field recording the source file an entry was made from, and how:
+#   <H id> <H size> <Q file size> <q mtime ns> <Q inode> <b compression level>
+# (level -1 = codec default). The next archive of the job copies the entry as
+# is when the file still has the same size, mtime and inode.
+RECYCLE_EXTRA_ID = 0x7263
+_PAYLOAD = struct.Struct("<QqQb")
+_LOCAL_HEADER = struct.Struct("<4s22xHH")
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+_ZIP64_EXTRA_ID = 0x0001
+# Data descriptor after the data: not written for copied entries, whose
+# sizes are known up front.
+_FLAG_DATA_DESCRIPTOR = 0x08
+
+RecycleKey = Tuple[int, int, int, int]
+# A file to archive whose previous entry can be copied: path, stat, old entry.
+UnchangedFile = Tuple[Path, os.stat_result, zipfile.ZipInfo]
+
+# Private ZipFile members write_raw_entry() relies on (CPython 3.8 to 3.13).
+_RAW_WRITE_MEMBERS = ("_lock", "_seekable", "_writecheck", "_didModify", "start_dir")
+
+
+def _key(st: os.stat_result, level: Optional[int]) -> RecycleKey:
+    return (st.st_size, st.st_mtime_ns, st.st_ino, -1 if level is None else level)
+
+
+def encode_extra(st: os.stat_result, level: Optional[int]) -> bytes:
+    return struct.pack("<HH", RECYCLE_EXTRA_ID, _PAYLOAD.size) + _PAYLOAD.pack(
+        *_key(st, level)
+    )
+
+
+def decode_extra(extra: bytes) -> Optional[RecycleKey]:
+    """(size, mtime ns, inode, level) from a zip extra field, or None."""
+    payload = find_extra_field(extra, RECYCLE_EXTRA_ID)
+    if payload is None or len(payload) < _PAYLOAD.size:
+        return None
+    return _PAYLOAD.unpack_from(payload)
+
+
+def recycled_percent(recycled: Optional[int], total: Optional[int]) -> Optional[float]:
+    """Share of a run's source bytes copied from the previous archive."""
+    if recycled is None or not total:
+        return None
+    return 100.0 * recycled / total
+
+
+def _strip_extra_field(extra: bytes, field_id: int) -> bytes:
+    parts: List[bytes] = []
+    pos = 0
+    while pos + 4 <= len(extra):
+        current, size = struct.unpack_from("<HH", extra, pos)
+        if current != field_id:
+            parts.append(extra[pos : pos + 4 + size])
+        pos += 4 + size
+    return b"".join(parts)
+
+
+def raw_write_supported(zf: zipfile.ZipFile) -> bool:
+    """Whether write_raw_entry() can add entries to ``zf``.
+
+    False if a zipfile version no longer has the private members it uses; the
+    engine then compresses unchanged files again instead of copying them.
+    """
+    return all(hasattr(zf, name) for name in _RAW_WRITE_MEMBERS)
+
+
+def write_raw_entry(
+    zf: zipfile.ZipFile,
+    info: zipfile.ZipInfo,
+    data: BinaryIO,
+    chunk_size: int,
+) -> None:
+    """
+    Add an entry whose compressed bytes are read from ``data``.
+
+    ``info`` must carry the compression type, CRC and both sizes of those
+    bytes. zipfile has no public API for this; the steps mirror its own
+    writestr() for an entry written in one go. Check raw_write_supported()
+    first.
+    """
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    with zf._lock:  # type: ignore[attr-defined]
+        if zf._seekable:  # type: ignore[attr-defined]
+            zf.fp.seek(zf.start_dir)  # type: ignore[union-attr]
+        info.header_offset = zf.fp.tell()  # type: ignore[union-attr]
+        zf._writecheck(info)  # type: ignore[attr-defined]
+        zf._didModify = True  # type: ignore[attr-defined]
+        zf.fp.write(info.FileHeader(zip64))  # type: ignore[union-attr]
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = data.read(min(chunk_size, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"{info.filename}: compressed data truncated")
+            zf.fp.write(chunk)  # type: ignore[union-attr]
+            remaining -= len(chunk)
+        zf.filelist.append(info)
+        zf.NameToInfo[info.filename] = info
+        zf.start_dir = zf.fp.tell()  # type: ignore[union-attr]
+
+
+class RecycleSource:
+    """
+    The previous archive of a job, as a source of ready compressed entries.
+
+    Without an archive nothing is recycled, but the archive being written
+    still records the keys the next run matches against.
+
+    Entries are recycled when they were made with the same codec and level
+    from a file that still has the same size, mtime and inode; their
+    compressed bytes and CRC are copied without decompressing them. Delta
+    entries are not (they need their base archive).
+    """
+
+    def __init__(
+        self,
+        archive: Optional[Path],
+        compress_type: int,
+        compression_level: Optional[int],
+        run_id: Optional[int] = None,
+    ) -> None:
+        self.archive = archive
+        self.run_id = run_id
+        self._level = -1 if compression_level is None else compression_level
+        self._entries: Dict[str, Tuple[RecycleKey, zipfile.ZipInfo]] = {}
+        self._fh: Optional[BinaryIO] = None
+        if archive is None:
+            # First archive in recycle mode: nothing to copy, keys are written.
+            return
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                key = decode_extra(info.extra)
+                if (
+                    key is None
+                    or info.compress_type != compress_type
+                    or key[3] != self._level
+                    or find_extra_field(info.extra, DELTA_EXTRA_ID) is not None
+                    or info.flag_bits & 0x01  # encrypted
+                ):
+                    continue
+                self._entries[info.filename] = (key, info)
+        # Kept open: the archive stays readable if retention deletes it meanwhile.
+        self._fh = open(archive, "rb")
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+
+    def split(
+        self,
+        src: Path,
+        files: List[Tuple[Path, int]],
+    ) -> Tuple[List[Tuple[Path, int]], List[UnchangedFile]]:
+        """Files to archive as usual, and unchanged files with their old entry."""
+        rest: List[Tuple[Path, int]] = []
+        unchanged: List[UnchangedFile] = []
+        for path, size in files:
+            found = self._entries.get(path.relative_to(src).as_posix())
+            if found is not None and found[0][0] == size:
+                try:
+                    st = path.stat()
+                except OSError:
+                    st = None
+                if st is not None and _key(st, found[0][3]) == found[0]:
+                    unchanged.append((path, st, found[1]))
+                    continue
+            rest.append((path, size))
+        return rest, unchanged
+
+    def copy(
+        self,
+        zf: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        old: zipfile.ZipInfo,
+        chunk_size: int,
+    ) -> None:
+        """Write entry ``info`` with the compressed data of ``old``."""
+        assert self._fh is not None
+        self._fh.seek(old.header_offset)
+        signature, name_length, extra_length = _LOCAL_HEADER.unpack(
+            self._fh.read(_LOCAL_HEADER.size)
+        )
+        if signature != _LOCAL_SIGNATURE:
+            raise zipfile.BadZipFile(
+                f"{old.filename}: bad local header in {self.archive}"
+            )
+        self._fh.seek(name_length + extra_length, os.SEEK_CUR)
+
+        info.compress_type = old.compress_type
+        info.flag_bits = old.flag_bits & ~_FLAG_DATA_DESCRIPTOR
+        info.CRC = old.CRC
+        info.compress_size = old.compress_size
+        info.file_size = old.file_size
+        # Hole map of sparse entries and the recycle key; zip64 sizes are
+        # added again by zipfile when needed.
+        info.extra = _strip_extra_field(old.extra, _ZIP64_EXTRA_ID)
+        info.comment = old.comment
+        write_raw_entry(zf, info, self._fh, chunk_size)
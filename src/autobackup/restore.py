@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO
+
+from autobackup.delta import apply_delta
+from autobackup.delta import decode_extra as decode_delta_extra
+from autobackup.sparse import decode_extra
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# A delta refers to its base archive, which may be a delta itself; this stops
+# a corrupt or circular chain.
+MAX_DELTA_CHAIN = 64
+
+
+@dataclass
+class RestoreResult:
+    files: int = 0
+    bytes_written: int = 0
+    sparse_files: int = 0
+    delta_files: int = 0
+
+
+def _member_path(target: Path, name: str) -> Path:
+    """Where an entry goes under ``target``; rejects paths escaping it."""
+    parts = PurePosixPath(name.replace("\\", "/")).parts
+    if not parts or PurePosixPath(name).is_absolute() or ".." in parts:
+        raise ValueError(f"Unsafe path in archive: {name!r}")
+    return target.joinpath(*parts)
+
+
+def _copy_range(src: BinaryIO, dst: BinaryIO, length: int) -> None:
+    remaining = length
+    while remaining:
+        chunk = src.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile("Sparse entry is shorter than its hole map")
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+def _write_entry(
+    zf: zipfile.ZipFile,
+    archive: Path,
+    info: zipfile.ZipInfo,
+    dst: BinaryIO,
+    depth: int = 0,
+) -> int:
+    """Write the file of one entry to ``dst``; returns the bytes written."""
+    delta = decode_delta_extra(info.extra)
+    if delta is not None:
+        if depth >= MAX_DELTA_CHAIN:
+            raise zipfile.BadZipFile(f"Delta chain of {info.filename} is too long")
+        _, block_size, base_name = delta
+        base_archive = archive.with_name(base_name)
+        # The base version is rebuilt first, into a temporary file.
+        with tempfile.TemporaryFile() as base, zipfile.ZipFile(base_archive) as base_zf:
+            _write_entry(
+                base_zf, base_archive, base_zf.getinfo(info.filename), base, depth + 1
+            )
+            with zf.open(info) as src:
+                return apply_delta(src, base, block_size, dst)
+
+    sparse = decode_extra(info.extra)
+    with zf.open(info) as src:
+        if sparse is None:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+            return info.file_size
+        size, extents = sparse
+        written = 0
+        for offset, length in extents:
+            dst.seek(offset)
+            _copy_range(src, dst, length)
+            written += length
+        dst.truncate(size)
+        return written
+
+
+def extract_backup(archive: Path, target: Path) -> RestoreResult:
+    """
+    Extract a backup archive into ``target``.
+
+    Plain entries are extracted as with any zip tool. Sparse entries are
+    written region by region at their offsets, and the file is extended to
+    its full size, so holes stay holes on the restored file. Delta entries
+    are rebuilt from the same file in their base archive, which must be in
+    the same folder (recursively, for chains of deltas).
+    """
+    result = RestoreResult()
+    target.mkdir(parents=True, exist_ok=True)
+
+    with zipfile.ZipFile(archive) as zf:
+        for info in zf.infolist():
+            path = _member_path(target, info.filename)
+            if info.is_dir():
+                path.mkdir(parents=True, exist_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(path, "wb") as dst:
+                result.bytes_written += _write_entry(zf, archive, info, dst)
+            if decode_delta_extra(info.extra) is not None:
+                result.delta_files += 1
+            elif decode_extra(info.extra) is not None:
+                result.sparse_files += 1
+
+            mode = (info.external_attr >> 16) & 0o7777
+            if mode:
+                os.chmod(path, mode)
+            result.files += 1
+
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Restore an AutoBackup archive into a folder.",
+    )
+    parser.add_argument("archive", type=Path)
+    parser.add_argument("target", type=Path)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = extract_backup(args.archive, args.target)
+    logger.info(
+        "Restored %s files (%s sparse, %s from deltas), %s bytes written",
+        result.files,
+        result.sparse_files,
+        result.delta_files,
+        result.bytes_written,
+    )
+
+
+if __name__ == "__main__":
+    main()
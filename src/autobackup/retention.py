@@ -0,0 +1,365 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, delete, func, literal, or_, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.checkpoint import directory_copy_path
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.delta import signature_path
+from autobackup.models import BackupJob, BackupRun, BackupRunDestination
+from autobackup.storage import backend_for, is_remote
+from autobackup.throttle import RateLimiter
+from autobackup.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# (job_id, output_file, size_bytes) of a deleted run whose file must go.
+DeletedFile = Tuple[int, str, Optional[int]]
+
+
+def _bucket_expressions(db: Session) -> Tuple[Any, Any, Any]:
+    """Day, ISO week and month of BackupRun.start_time for the current dialect."""
+    start = BackupRun.start_time
+    if db.get_bind().dialect.name == "sqlite":
+        day = func.date(start)
+        # Monday of the week.
+        week = func.date(start, "weekday 0", "-6 days")
+        month = func.strftime("%Y-%m", start)
+    else:
+        day = func.date_trunc("day", start)
+        week = func.date_trunc("week", start)
+        month = func.date_trunc("month", start)
+    return day, week, month
+
+
+def plan_expired_runs(db: Session, job_ids: Sequence[int]) -> List[Any]:
+    """
+    Return successful runs of ``job_ids`` that fall outside their retention.
+
+    Evaluated in one query with window functions. Jobs without a GFS policy
+    keep their ``MAX_BACKUPS_PER_JOB`` newest runs. Jobs with keep_daily,
+    keep_weekly or keep_monthly keep the newest run of each of their N most
+    recent days, M weeks and K months (grandfather-father-son), plus the newest
+    run overall. Runs that another run's deltas refer to are always kept.
+
+    Rows have: id, job_id, output_file, size_bytes.
+    """
+    if not job_ids:
+        return []
+
+    day, week, month = _bucket_expressions(db)
+    newest_first = (BackupRun.start_time.desc(), BackupRun.id.desc())
+
+    ranked = (
+        select(
+            BackupRun.id,
+            BackupRun.job_id,
+            BackupRun.output_file,
+            BackupRun.size_bytes,
+            func.row_number()
+            .over(partition_by=BackupRun.job_id, order_by=newest_first)
+            .label("rn"),
+            func.row_number()
+            .over(partition_by=(BackupRun.job_id, day), order_by=newest_first)
+            .label("day_rn"),
+            func.dense_rank()
+            .over(partition_by=BackupRun.job_id, order_by=day.desc())
+            .label("day_rank"),
+            func.row_number()
+            .over(partition_by=(BackupRun.job_id, week), order_by=newest_first)
+            .label("week_rn"),
+            func.dense_rank()
+            .over(partition_by=BackupRun.job_id, order_by=week.desc())
+            .label("week_rank"),
+            func.row_number()
+            .over(partition_by=(BackupRun.job_id, month), order_by=newest_first)
+            .label("month_rn"),
+            func.dense_rank()
+            .over(partition_by=BackupRun.job_id, order_by=month.desc())
+            .label("month_rank"),
+        )
+        .where(BackupRun.job_id.in_(job_ids), BackupRun.status == "success")
+        .subquery()
+    )
+
+    has_gfs = or_(
+        BackupJob.keep_daily.is_not(None),
+        BackupJob.keep_weekly.is_not(None),
+        BackupJob.keep_monthly.is_not(None),
+    )
+    keep_last = case(
+        (has_gfs, literal(1)),
+        else_=literal(max(settings.max_backups_per_job, 0)),
+    )
+    keep = or_(
+        and_(keep_last > 0, ranked.c.rn <= keep_last),
+        and_(
+            ranked.c.day_rn == 1,
+            ranked.c.day_rank <= func.coalesce(BackupJob.keep_daily, 0),
+        ),
+        and_(
+            ranked.c.week_rn == 1,
+            ranked.c.week_rank <= func.coalesce(BackupJob.keep_weekly, 0),
+        ),
+        and_(
+            ranked.c.month_rn == 1,
+            ranked.c.month_rank <= func.coalesce(BackupJob.keep_monthly, 0),
+        ),
+    )
+
+    # Delta archives need their base to be restored (see delta.py). A base is
+    # always an earlier run of the same job.
+    delta_bases = select(BackupRun.delta_base_run_id).where(
+        BackupRun.job_id.in_(job_ids),
+        BackupRun.delta_base_run_id.is_not(None),
+    )
+
+    stmt = (
+        select(
+            ranked.c.id,
+            ranked.c.job_id,
+            ranked.c.output_file,
+            ranked.c.size_bytes,
+        )
+        .join(BackupJob, BackupJob.id == ranked.c.job_id)
+        # MAX_BACKUPS_PER_JOB <= 0 disables count-based retention.
+        .where(or_(has_gfs, keep_last > 0), ~keep, ranked.c.id.not_in(delta_bases))
+    )
+    return list(db.execute(stmt).all())
+
+
+def plan_stale_runs(
+    db: Session,
+    job_ids: Sequence[int],
+    now: Optional[datetime] = None,
+) -> List[Any]:
+    """
+    Failed and stuck (running or queued) runs of ``job_ids`` past their max age.
+
+    A running run is stuck once its heartbeat (progress_updated_at, see
+    progress.py) is older than STALE_RUNNING_HOURS: a resumed run keeps its
+    original start_time.
+    """
+    if not job_ids:
+        return []
+
+    now = now or db_now()
+    conditions = []
+    if settings.error_run_retention_days > 0:
+        cutoff = now - timedelta(days=settings.error_run_retention_days)
+        conditions.append(
+            and_(
+                BackupRun.status.in_(("error", "cancelled")),
+                BackupRun.start_time < cutoff,
+            )
+        )
+    if settings.stale_running_hours > 0:
+        cutoff = now - timedelta(hours=settings.stale_running_hours)
+        conditions.append(
+            and_(
+                BackupRun.status.in_(("running", "queued")),
+                func.coalesce(BackupRun.progress_updated_at, BackupRun.start_time)
+                < cutoff,
+            )
+        )
+    if not conditions:
+        return []
+
+    stmt = select(
+        BackupRun.id,
+        BackupRun.job_id,
+        BackupRun.output_file,
+        BackupRun.size_bytes,
+    ).where(BackupRun.job_id.in_(job_ids), or_(*conditions))
+    return list(db.execute(stmt).all())
+
+
+def delete_runs(db: Session, run_ids: Sequence[int]) -> List[DeletedFile]:
+    """Delete runs with one DELETE ... RETURNING; returns their archive files.
+
+    Copies written to the extra destinations of a job are included, and so
+    are the partial archive and its directory copy of an unfinished run.
+    """
+    if not run_ids:
+        return []
+
+    copies = db.execute(
+        delete(BackupRunDestination)
+        .where(BackupRunDestination.run_id.in_(run_ids))
+        .returning(
+            BackupRunDestination.run_id,
+            BackupRunDestination.output_file,
+            BackupRunDestination.size_bytes,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    deleted = db.execute(
+        delete(BackupRun)
+        .where(BackupRun.id.in_(run_ids))
+        .returning(
+            BackupRun.id,
+            BackupRun.job_id,
+            BackupRun.output_file,
+            BackupRun.size_bytes,
+            BackupRun.status,
+            BackupRun.checkpoint_file,
+            BackupRun.checkpoint_segment,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    job_of_run = {row.id: row.job_id for row in deleted}
+    files: Dict[str, DeletedFile] = {}
+    for row in deleted:
+        if row.output_file:
+            files[row.output_file] = (row.job_id, row.output_file, row.size_bytes)
+        if row.status in ("running", "queued") and row.checkpoint_file:
+            partial = [row.checkpoint_file]
+            if row.checkpoint_segment:
+                archive = Path(row.checkpoint_file)
+                partial.append(
+                    str(directory_copy_path(archive, row.checkpoint_segment))
+                )
+            for path in partial:
+                files.setdefault(path, (row.job_id, path, None))
+    for run_id, path, size in copies:
+        if path and run_id in job_of_run:
+            files.setdefault(path, (job_of_run[run_id], path, size))
+    return list(files.values())
+
+
+def delete_backup_files(paths: Iterable[str], job_id: int) -> int:
+    """Delete backup archives left behind by deleted runs, through their
+    storage backend (local file or S3 object). Returns archives removed."""
+    removed = 0
+    for location in paths:
+        try:
+            if backend_for(location).delete(location):
+                removed += 1
+                if not is_remote(location):
+                    signature_path(Path(location)).unlink(missing_ok=True)
+                logger.info(
+                    "Retention: deleted old backup file %s for job %s",
+                    location,
+                    job_id,
+                )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(
+                "Retention: could not delete file %s for job %s: %s",
+                location,
+                job_id,
+                exc,
+            )
+    return removed
+
+
+@dataclass
+class SweepResult:
+    runs_deleted: int = 0
+    files_deleted: int = 0
+
+
+class RetentionSweeper:
+    """Applies retention to all jobs, off the backup's critical path.
+
+    Deletions are planned in SQL for batches of ``batch_size`` jobs at a time,
+    the runs are deleted and committed per batch, and the archive files are
+    then unlinked by a small worker pool whose throughput is capped at
+    ``bytes_per_second`` so a sweep does not starve running backups of I/O.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        bytes_per_second: Optional[float] = None,
+        batch_size: Optional[int] = None,
+        session_factory: sessionmaker[Session] = SessionLocal,
+    ) -> None:
+        self._workers = max(1, workers or settings.retention_delete_workers)
+        mb_per_second = (
+            settings.retention_delete_mb_per_sec
+            if bytes_per_second is None
+            else bytes_per_second / (1024 * 1024)
+        )
+        self._throttle = RateLimiter(mb_per_second * 1024 * 1024)
+        self._batch_size = max(1, batch_size or settings.retention_job_batch_size)
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+
+    def _unlink(self, item: DeletedFile) -> bool:
+        job_id, path, size = item
+        self._throttle.wait(size or 0)
+        return delete_backup_files([path], job_id) == 1
+
+    def sweep(
+        self,
+        job_ids: Optional[Iterable[int]] = None,
+        job_filter: Optional[Callable[[int], bool]] = None,
+    ) -> SweepResult:
+        """Run one sweep over ``job_ids`` (default: all jobs)."""
+        if not self._lock.acquire(blocking=False):
+            logger.info("Retention sweep already running; skipping")
+            return SweepResult()
+
+        try:
+            return self._sweep(job_ids, job_filter)
+        finally:
+            self._lock.release()
+
+    def _sweep(
+        self,
+        job_ids: Optional[Iterable[int]],
+        job_filter: Optional[Callable[[int], bool]],
+    ) -> SweepResult:
+        result = SweepResult()
+        db = self._session_factory()
+        try:
+            if job_ids is None:
+                all_ids = list(db.execute(select(BackupJob.id)).scalars())
+            else:
+                all_ids = list(job_ids)
+            db.rollback()
+            if job_filter is not None:
+                all_ids = [job_id for job_id in all_ids if job_filter(job_id)]
+
+            with ThreadPoolExecutor(
+                max_workers=self._workers,
+                thread_name_prefix="autobackup-retention",
+            ) as pool:
+                for start in range(0, len(all_ids), self._batch_size):
+                    batch = all_ids[start : start + self._batch_size]
+                    with span("retention.plan", jobs=len(batch)) as plan:
+                        planned = plan_expired_runs(db, batch)
+                        planned += plan_stale_runs(db, batch)
+                        plan.set("runs", len(planned))
+
+                    with span("retention.delete", runs=len(planned)):
+                        files = delete_runs(db, [row.id for row in planned])
+                        db.commit()
+                    result.runs_deleted += len(planned)
+
+                    # Files are removed after the commit: a crash in between
+                    # leaves an orphan file, never a run without its archive.
+                    with span("retention.unlink", files=len(files)):
+                        result.files_deleted += sum(pool.map(self._unlink, files))
+        finally:
+            db.close()
+
+        if result.runs_deleted:
+            logger.info(
+                "Retention: deleted %s runs and %s backup files",
+                result.runs_deleted,
+                result.files_deleted,
+            )
+        return result
@@ -0,0 +1,289 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import bisect
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from autobackup.backup_engine import (
+    cancel_queued_run,
+    queue_backup_run,
+    start_queued_run,
+)
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob, BackupRun
+from autobackup.tracing import span, start_trace
+
+logger = logging.getLogger(__name__)
+
+# Lower value first; runs of the same priority start in the order queued.
+PRIORITIES = {"urgent": 0, "normal": 1, "scheduled": 2}
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+STOPPED_MESSAGE = "Not started: the scheduler stopped while the run was queued"
+
+
+class QueueFull(Exception):
+    """Too many requested runs are waiting already."""
+
+
+@dataclass(order=True)
+class _Entry:
+    priority: int
+    seq: int
+    job_id: int = field(compare=False)
+    # Run recorded by submit(), started on a thread of the queue; None for a
+    # caller waiting in slot().
+    run_id: Optional[int] = field(default=None, compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancel: threading.Event = field(default_factory=threading.Event, compare=False)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "run_id": self.run_id,
+            "priority": PRIORITY_NAMES[self.priority],
+        }
+
+
+class RunQueue:
+    """
+    Priority queue and concurrency limit shared by all backups of a process.
+
+    Scheduled firings wait in slot() on their APScheduler thread. Runs
+    requested through the API are recorded as "queued" by submit(), which
+    returns at once, and started on a thread of their own when their turn
+    comes. Higher priority first, then first come first served; at most
+    ``limit`` runs at once (0 = no limit) and never two runs of one job.
+
+    Every run started through the queue can be cancelled with cancel().
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        max_queued: Optional[int] = None,
+        session_factory: sessionmaker[Session] = SessionLocal,
+    ) -> None:
+        self._limit = settings.max_concurrent_runs if limit is None else limit
+        self._max_queued = (
+            settings.run_queue_max_queued if max_queued is None else max_queued
+        )
+        self._session_factory = session_factory
+        self._cond = threading.Condition()
+        self._waiting: List[_Entry] = []  # sorted, next to start first
+        self._running: Dict[int, _Entry] = {}  # by job id
+        self._seq = itertools.count()
+        self._stopped = False
+
+    def start(self) -> None:
+        with self._cond:
+            self._stopped = False
+
+    def stop(self) -> None:
+        """
+        Stop starting runs. Runs already started go on; callers waiting in
+        slot() get no slot and queued runs are cancelled.
+        """
+        with self._cond:
+            self._stopped = True
+            dropped = [entry for entry in self._waiting if entry.run_id is not None]
+            self._waiting.clear()
+            self._cond.notify_all()
+
+        for entry in dropped:
+            self._cancel_in_db(entry.run_id, STOPPED_MESSAGE)
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+    def _grant(self) -> None:
+        """Hand free slots to waiting entries (called with the lock held)."""
+        for entry in list(self._waiting):
+            if self._limit > 0 and len(self._running) >= self._limit:
+                break
+            if entry.job_id in self._running:
+                continue
+            self._waiting.remove(entry)
+            self._running[entry.job_id] = entry
+            entry.granted = True
+            if entry.run_id is not None:
+                threading.Thread(
+                    target=self._execute,
+                    args=(entry,),
+                    name=f"autobackup-run-{entry.run_id}",
+                    daemon=True,
+                ).start()
+        self._cond.notify_all()
+
+    def _release(self, entry: _Entry) -> None:
+        with self._cond:
+            if self._running.get(entry.job_id) is entry:
+                del self._running[entry.job_id]
+            if not self._stopped:
+                self._grant()
+
+    @contextmanager
+    def slot(
+        self, job_id: int, priority: str = "scheduled"
+    ) -> Iterator[Optional[threading.Event]]:
+        """
+        Wait for a turn to run a backup of ``job_id`` and hold it.
+
+        Yields the run's cancel event (for run_backup_for_job), or None when
+        the queue was stopped meanwhile and the run must not start.
+        """
+        entry = _Entry(PRIORITIES[priority], next(self._seq), job_id)
+        with span("queue.wait", priority=priority):
+            with self._cond:
+                if not self._stopped:
+                    bisect.insort(self._waiting, entry)
+                    self._grant()
+                    while not entry.granted and not self._stopped:
+                        self._cond.wait()
+                    if not entry.granted:
+                        self._waiting = [e for e in self._waiting if e is not entry]
+        if not entry.granted:
+            yield None
+            return
+        try:
+            yield entry.cancel
+        finally:
+            self._release(entry)
+
+    def submit(self, job_id: int, priority: str = "normal") -> int:
+        """
+        Queue a run of ``job_id`` and return its id without waiting.
+
+        Raises LookupError for an unknown job, ValueError for an unknown
+        priority and QueueFull when the queue is full or stopped.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+        with self._cond:
+            if self._stopped:
+                raise QueueFull("the run queue is stopped")
+            queued = sum(1 for entry in self._waiting if entry.run_id is not None)
+            if self._max_queued > 0 and queued >= self._max_queued:
+                raise QueueFull(f"{queued} runs are queued already")
+
+        db = self._session_factory()
+        try:
+            job = db.get(BackupJob, job_id)
+            if job is None:
+                raise LookupError(f"Job {job_id} not found")
+            run_id = queue_backup_run(db, job).id
+        finally:
+            db.close()
+
+        entry = _Entry(PRIORITIES[priority], next(self._seq), job_id, run_id)
+        with self._cond:
+            if self._stopped:
+                stopped = True
+            else:
+                stopped = False
+                bisect.insort(self._waiting, entry)
+                self._grant()
+        if stopped:
+            self._cancel_in_db(run_id, STOPPED_MESSAGE)
+        logger.info("Queued run %s of job %s (priority %s)", run_id, job_id, priority)
+        return run_id
+
+    def _execute(self, entry: _Entry) -> None:
+        with start_trace("queue.run", job_id=entry.job_id, run_id=entry.run_id):
+            db = self._session_factory()
+            try:
+                run = db.get(BackupRun, entry.run_id)
+                if run is None or run.status != "queued":
+                    # Cancelled before its turn came.
+                    return
+                run = start_queued_run(db, run, entry.cancel)
+                logger.info(
+                    "Finished queued run %s of job %s with status=%s",
+                    run.id,
+                    run.job_id,
+                    run.status,
+                )
+            except Exception:
+                logger.exception("Error while running queued run %s", entry.run_id)
+            finally:
+                db.close()
+                self._release(entry)
+
+    # ------------------------------------------------------------------
+    # Cancellation and state
+    # ------------------------------------------------------------------
+    def cancel(self, run_id: int) -> Optional[str]:
+        """
+        Cancel a queued or running run.
+
+        Returns "cancelled" when the run had not started, "cancelling" when it
+        runs in this process (it stops at its next progress update), its
+        status when it cannot be cancelled here, or None if there is no run
+        ``run_id``.
+        """
+        with self._cond:
+            self._waiting = [e for e in self._waiting if e.run_id != run_id]
+            entry = next(
+                (e for e in self._running.values() if e.run_id == run_id),
+                None,
+            )
+        if entry is not None:
+            entry.cancel.set()
+            return "cancelling"
+
+        db = self._session_factory()
+        try:
+            run = db.get(BackupRun, run_id)
+            if run is None:
+                return None
+            if run.status == "queued":
+                cancel_queued_run(db, run)
+                db.commit()
+                logger.info("Cancelled queued run %s of job %s", run_id, run.job_id)
+                return "cancelled"
+            if run.status == "running":
+                with self._cond:
+                    entry = self._running.get(run.job_id)
+                # A slot() holder is the only run of its job started here.
+                if entry is not None and entry.run_id is None:
+                    entry.cancel.set()
+                    return "cancelling"
+            return run.status
+        finally:
+            db.close()
+
+    def _cancel_in_db(self, run_id: Optional[int], message: str) -> None:
+        db = self._session_factory()
+        try:
+            run = db.get(BackupRun, run_id)
+            if run is not None and run.status == "queued":
+                cancel_queued_run(db, run, message)
+                db.commit()
+        except Exception:
+            logger.exception("Could not cancel queued run %s", run_id)
+        finally:
+            db.close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Running and waiting entries, the next to start first."""
+        with self._cond:
+            return {
+                "limit": self._limit,
+                "running": [entry.describe() for entry in self._running.values()],
+                "waiting": [entry.describe() for entry in self._waiting],
+            }
+
+    def position(self, run_id: int) -> Optional[int]:
+        """0-based place of a queued run in the waiting line, None if not waiting."""
+        with self._cond:
+            for index, entry in enumerate(self._waiting):
+                if entry.run_id == run_id:
+                    return index
+        return None
@@ -1,32 +1,87 @@
 from __future__ import annotations
 
-from datetime import datetime, time as dt_time
-from typing import Optional
 import logging
 import threading
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
+from autobackup.backup_engine import resume_backup_run, run_backup_for_job
+from autobackup.clock import db_now
+from autobackup.cluster import ClusterMembership
+from autobackup.compaction import compact_run_history
+from autobackup.config import settings
 from autobackup.db import SessionLocal
-from autobackup.models import BackupJob
-from autobackup.backup_engine import run_backup_for_job
+from autobackup.dump import is_dump_job
+from autobackup.events import ChangeEvent, subscribe
+from autobackup.models import BackupJob, BackupRun
+from autobackup.progress import ProgressRecorder
+from autobackup.recovery import cancel_abandoned_queued_runs, reconcile_interrupted_runs
+from autobackup.retention import RetentionSweeper
+from autobackup.run_queue import RunQueue
+from autobackup.tracing import Span, span, start_trace
+from autobackup.watcher import ChangeWatcher, inotify_available
 
 logger = logging.getLogger(__name__)
 
+# What reload() compares to decide whether a job must be rescheduled:
+# (schedule type, interval minutes, watched source path, created at).
+JobSpec = Tuple[str, Optional[int], Optional[str], Optional[datetime]]
+
+# Executor of the housekeeping jobs (cluster heartbeat, history compaction...):
+# backup firings hold the default pool's threads while they wait and while
+# they run, and a late heartbeat would let the node's lease expire.
+MAINTENANCE_EXECUTOR = "maintenance"
+
+# A run is taken for interrupted once it has not stored its progress for this
+# many flush intervals (plus the node lease in cluster mode).
+RECOVERY_GRACE_FLUSHES = 3
+
 
 class BackupScheduler:
     """Background scheduler that runs backup jobs automatically.
 
     It reads active jobs from the database and schedules them according to
     their configuration (schedule_type + interval_minutes).
+
+    Jobs with schedule_type "on_change" are not put on a timer; their source
+    folder is watched with inotify and a run is queued once changes settle.
+
+    In cluster mode each node only schedules the jobs it owns (see
+    ClusterMembership), timers are aligned on the job creation time so every
+    node computes the same firing times, and each firing is claimed in the
+    database before it runs.
+
+    Every backup it starts first waits for a slot of the RunQueue ``runs``,
+    which also takes runs requested through the API (see api.py).
     """
 
-    def __init__(self) -> None:
-        self._scheduler = BackgroundScheduler()
+    def __init__(self, cluster: Optional[ClusterMembership] = None) -> None:
+        self._created_at = db_now()
+        self._scheduler = BackgroundScheduler(
+            executors={
+                "default": ThreadPoolExecutor(10),
+                MAINTENANCE_EXECUTOR: ThreadPoolExecutor(3),
+            }
+        )
         self._lock = threading.Lock()
         self._started = False
+        self._watcher: Optional[ChangeWatcher] = None
+        self._triggers: Dict[int, object] = {}
+        self._specs: Dict[int, JobSpec] = {}
+        self._resuming: Set[int] = set()
+        self._sweeper = RetentionSweeper()
+        self.runs = RunQueue()
+        self._unsubscribe: Optional[Callable[[], None]] = None
+
+        if cluster is None and settings.cluster_mode:
+            cluster = ClusterMembership()
+        self._cluster = cluster
 
     def start(self) -> None:
         """Start the underlying APScheduler instance."""
@@ -37,9 +92,30 @@ class BackupScheduler:
             # Mark as started BEFORE calling reload()
             self._started = True
 
+            self.runs.start()
             self._scheduler.start()
-            
+
+            if self._cluster is not None:
+                self._cluster.heartbeat()
+                logger.info("Cluster mode: node id %s", self._cluster.node_id)
+
+            if inotify_available():
+                self._watcher = ChangeWatcher(
+                    on_settled=self._on_source_changed,
+                    settle_seconds=settings.on_change_settle_seconds,
+                    max_delay_seconds=settings.on_change_max_delay_minutes * 60,
+                )
+                try:
+                    self._watcher.start()
+                except OSError as exc:
+                    logger.warning("Could not start change watcher: %s", exc)
+                    self._watcher = None
+
+            self._schedule_maintenance()
+
         self.reload()
+        self._unsubscribe = subscribe(self._on_jobs_changed)
+        self._recover_runs()
         logger.info("BackupScheduler started")
 
     def stop(self) -> None:
@@ -48,20 +124,41 @@ class BackupScheduler:
             if not self._started:
                 return
 
+            if self._watcher is not None:
+                self._watcher.stop()
+                self._watcher = None
+            if self._unsubscribe is not None:
+                self._unsubscribe()
+                self._unsubscribe = None
+
             self._scheduler.shutdown(wait=False)
+            self._specs.clear()
+            self._triggers.clear()
             self._started = False
+            self.runs.stop()
+
+            if self._cluster is not None:
+                try:
+                    self._cluster.leave()
+                except Exception:
+                    logger.exception("Could not leave the cluster cleanly")
+
             logger.info("BackupScheduler stopped")
 
     def reload(self) -> None:
-        """Reload jobs from the database and reschedule them."""
+        """Reload jobs from the database and reschedule the ones that changed.
+
+        Jobs whose schedule is unchanged keep their timer and their source
+        watch, with the changes it has seen but not yet fired; runs already
+        queued by the watcher are kept too.
+        """
         with self._lock:
             if not self._started:
                 # Scheduler not started yet; nothing to do.
                 logger.debug("reload() called while scheduler is not started")
                 return
 
-            self._scheduler.remove_all_jobs()
-
+            wanted: Dict[int, JobSpec] = {}
             db = SessionLocal()
             try:
                 jobs = (
@@ -71,23 +168,53 @@ class BackupScheduler:
                 )
 
                 for job in jobs:
-                    self._schedule_job(
-                        job.id,
-                        job.schedule_type,
+                    if self._cluster is not None and not self._cluster.owns(job.id):
+                        continue
+                    wanted[job.id] = (
+                        (job.schedule_type or "manual").lower(),
                         job.interval_minutes,
+                        None if is_dump_job(job) else job.source_path,
+                        job.created_at,
                     )
             finally:
                 db.close()
 
-            logger.info("BackupScheduler reloaded all jobs")
+            changed = [
+                job_id
+                for job_id, spec in self._specs.items()
+                if wanted.get(job_id) != spec
+            ]
+            for job_id in changed:
+                self._unschedule_job(job_id)
+            added = [job_id for job_id in wanted if job_id not in self._specs]
+            for job_id in added:
+                self._schedule_job(job_id, *wanted[job_id])
+                self._specs[job_id] = wanted[job_id]
+
+            logger.info(
+                "BackupScheduler reloaded jobs (%s unscheduled, %s scheduled)",
+                len(changed),
+                len(added),
+            )
+
+    def _unschedule_job(self, job_id: int) -> None:
+        """Remove the timer or source watch of a job (called with the lock held)."""
+        self._specs.pop(job_id, None)
+        self._triggers.pop(job_id, None)
+        if self._scheduler.get_job(f"job_{job_id}") is not None:
+            self._scheduler.remove_job(f"job_{job_id}")
+        if self._watcher is not None:
+            self._watcher.unwatch(job_id)
 
     def _schedule_job(
         self,
         job_id: int,
         schedule_type: str,
         interval_minutes: Optional[int],
+        source_path: Optional[str] = None,
+        created_at: Optional[datetime] = None,
     ) -> None:
-        """Create an APScheduler job for a single BackupJob."""
+        """Create an APScheduler job (or a source watch) for a single BackupJob."""
         schedule_type = (schedule_type or "manual").lower()
 
         if schedule_type == "manual":
@@ -104,15 +231,44 @@ class BackupScheduler:
                 return
 
             minutes = int(interval_minutes)
-            trigger = IntervalTrigger(minutes=minutes)
+            if self._cluster is not None:
+                # Same grid on every node, so they agree on firing times.
+                trigger = IntervalTrigger(
+                    minutes=minutes,
+                    start_date=created_at or datetime(2000, 1, 1),
+                )
+            else:
+                trigger = IntervalTrigger(minutes=minutes)
 
         elif schedule_type == "daily":
             # Simple daily job at 02:00. You can make this configurable later.
             trigger = CronTrigger(hour=2, minute=0)
+
+        elif schedule_type == "on_change":
+            if self._watcher is None:
+                logger.warning(
+                    "Job %s uses schedule_type=on_change but inotify is not "
+                    "available; skipping scheduling",
+                    job_id,
+                )
+                return
+            if not source_path:
+                logger.warning("Job %s has no source folder; skipping watch", job_id)
+                return
+
+            # interval_minutes is optional here: the minimum time between runs.
+            self._watcher.watch(
+                job_id,
+                source_path,
+                min_interval_seconds=(interval_minutes or 0) * 60,
+            )
+            logger.info("Watching source of job %s for changes", job_id)
+            return
         else:
             logger.warning("Job %s has unknown schedule_type=%s", job_id, schedule_type)
             return
 
+        self._triggers[job_id] = trigger
         self._scheduler.add_job(
             self._run_job,
             trigger=trigger,
@@ -127,30 +283,274 @@ class BackupScheduler:
             schedule_type,
         )
 
-    def _run_job(self, job_id: int) -> None:
-        """Wrapper called by APScheduler to run a backup for a given job id."""
+    def _schedule_maintenance(self) -> None:
+        """Schedule background housekeeping (once, when the scheduler starts)."""
+        # Runs that stored their progress just before a crash only look
+        # interrupted once their grace period is over.
+        self._scheduler.add_job(
+            self._recover_runs,
+            trigger=DateTrigger(
+                run_date=datetime.now() + timedelta(seconds=self._recovery_grace()),
+            ),
+            id="maintenance_recovery",
+            replace_existing=True,
+            executor=MAINTENANCE_EXECUTOR,
+        )
+
+        if self._cluster is not None:
+            self._scheduler.add_job(
+                self._cluster_heartbeat,
+                trigger=IntervalTrigger(seconds=settings.cluster_heartbeat_seconds),
+                id="maintenance_cluster_heartbeat",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                executor=MAINTENANCE_EXECUTOR,
+            )
+
+        if settings.retention_sweep_minutes > 0:
+            self._scheduler.add_job(
+                self._run_retention,
+                trigger=IntervalTrigger(minutes=settings.retention_sweep_minutes),
+                id="maintenance_retention",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                executor=MAINTENANCE_EXECUTOR,
+            )
+
+        if settings.history_compact_after_days > 0:
+            self._scheduler.add_job(
+                self._run_compaction,
+                trigger=IntervalTrigger(
+                    hours=max(1, settings.history_compact_interval_hours),
+                ),
+                id="maintenance_compaction",
+                replace_existing=True,
+                max_instances=1,
+                coalesce=True,
+                executor=MAINTENANCE_EXECUTOR,
+            )
+
+    def _on_jobs_changed(self, change: ChangeEvent) -> None:
+        """Reload after a bulk change of job definitions.
+
+        In cluster mode also after a single job was created, edited or
+        deleted: the node that made the change (which reloads itself) is
+        often not the one that owns the job.
+        """
+        if change.kind != "jobs" and not (
+            change.kind == "job" and self._cluster is not None
+        ):
+            return
+        # Subscribers must not block the committing thread.
+        threading.Thread(
+            target=self.reload,
+            name="autobackup-reload",
+            daemon=True,
+        ).start()
+
+    def _cluster_heartbeat(self) -> None:
+        """Renew this node's lease; re-partition jobs when membership changed."""
+        assert self._cluster is not None
+        try:
+            changed = self._cluster.heartbeat()
+        except Exception:
+            logger.exception("Cluster heartbeat failed")
+            return
+        if changed:
+            self.reload()
+
+    def _firing_slot(self, job_id: int) -> Optional[datetime]:
+        """Scheduled time of the firing being run now (UTC), or None if untimed.
+
+        The trigger's next fire time at or after "now minus half a period" is
+        the firing that is due, as long as it started less than half a period
+        late.
+        """
+        trigger = self._triggers.get(job_id)
+        if isinstance(trigger, IntervalTrigger):
+            period = trigger.interval
+        elif isinstance(trigger, CronTrigger):
+            period = timedelta(days=1)
+        else:
+            return None
+
+        now = datetime.now(trigger.timezone)
+        slot = trigger.get_next_fire_time(None, now - period / 2)
+        if slot is None:
+            return None
+        return slot.astimezone(timezone.utc).replace(tzinfo=None)
+
+    def _recovery_grace(self) -> float:
+        """Seconds without a progress update after which a run is interrupted."""
+        grace = RECOVERY_GRACE_FLUSHES * settings.progress_flush_seconds
+        if self._cluster is not None:
+            grace += settings.cluster_node_ttl_seconds
+        return grace
+
+    def _recover_runs(self) -> None:
+        """Settle runs interrupted by a crash and resume the resumable ones.
+
+        Called at start and once more when the grace period is over. Only runs
+        whose heartbeat has stopped are taken over: another process
+        on the same database (the GUI and the CLI, or other cluster nodes) may
+        still be running backups. In a cluster only runs of jobs this node owns
+        are considered.
+        """
+        cutoff = db_now() - timedelta(seconds=self._recovery_grace())
+        job_filter = self._cluster.owns if self._cluster is not None else None
+
         db = SessionLocal()
         try:
-            job = db.query(BackupJob).filter_by(id=job_id).first()
-            if job is None:
-                logger.warning("Job %s not found; skipping scheduled run", job_id)
+            if self._cluster is None:
+                cancel_abandoned_queued_runs(db, self._created_at)
+            run_ids = reconcile_interrupted_runs(db, cutoff, job_filter)
+        except Exception:
+            logger.exception("Error while reconciling interrupted runs")
+            return
+        finally:
+            db.close()
+
+        # Already being resumed by this process (the second recovery pass).
+        run_ids = [run_id for run_id in run_ids if run_id not in self._resuming]
+        self._resuming.update(run_ids)
+        if run_ids:
+            # Not on the APScheduler pool, whose threads are taken by scheduled
+            # firings. Resumed one after the other, in the background.
+            threading.Thread(
+                target=self._resume_runs,
+                args=(run_ids,),
+                name="autobackup-resume",
+                daemon=True,
+            ).start()
+
+    def _resume_runs(self, run_ids: List[int]) -> None:
+        for run_id in run_ids:
+            if not self._started:
                 return
+            with start_trace("scheduler.resume_run", run_id=run_id):
+                db = SessionLocal()
+                try:
+                    run = db.get(BackupRun, run_id)
+                    if run is None or run.status != "running":
+                        continue
+                    # Claimed by this process: its heartbeat goes on while the
+                    # run waits for a slot, or another process would take it.
+                    recorder = ProgressRecorder(run.id, run.job_id)
+                    recorder.start()
+                    try:
+                        # Ahead of scheduled runs: the partial archive is there.
+                        with self.runs.slot(run.job_id, "normal") as cancel:
+                            if cancel is None:
+                                return
+                            run = resume_backup_run(
+                                db, run, cancel=cancel, recorder=recorder
+                            )
+                    finally:
+                        recorder.stop()
+                    logger.info(
+                        "Resumed run %s of job %s finished with status=%s",
+                        run.id,
+                        run.job_id,
+                        run.status,
+                    )
+                except Exception:
+                    logger.exception("Error while resuming run %s", run_id)
+                finally:
+                    db.close()
 
-            logger.info(
-                "Starting scheduled backup for job %s (%s)",
-                job.id,
-                job.name,
-            )
-            run = run_backup_for_job(db, job)
-            logger.info(
-                "Finished scheduled backup for job %s with status=%s, message=%s",
-                job.id,
-                run.status,
-                run.message,
-            )
+    def _run_retention(self) -> None:
+        """Wrapper called by APScheduler to sweep expired backups of all jobs.
+
+        In cluster mode each node sweeps the jobs it owns, active or not.
+        """
+        cluster = self._cluster
+        try:
+            with start_trace("scheduler.retention"):
+                self._sweeper.sweep(job_filter=cluster.owns if cluster else None)
+        except Exception:
+            logger.exception("Error while applying retention")
+
+    def _run_compaction(self) -> None:
+        """Wrapper called by APScheduler to compact old run history."""
+        db = SessionLocal()
+        try:
+            with start_trace("scheduler.compaction"):
+                compact_run_history(db)
         except Exception:
-            logger.exception("Error while running scheduled backup for job %s", job_id)
+            logger.exception("Error while compacting run history")
         finally:
             db.close()
 
+    def _on_source_changed(self, job_id: int) -> None:
+        """Called from the watcher thread when a watched source has settled."""
+        if not self._started:
+            return
 
+        # Run on the APScheduler pool, never on the watcher thread.
+        self._scheduler.add_job(
+            self._run_job,
+            args=[job_id],
+            id=f"job_{job_id}_change",
+            replace_existing=True,
+            max_instances=1,
+        )
+        logger.info("Source of job %s changed; backup queued", job_id)
+
+    def _run_job(self, job_id: int) -> None:
+        """Wrapper called by APScheduler to run a backup for a given job id."""
+        with start_trace("scheduler.run_job", job_id=job_id) as trace:
+            if isinstance(trace, Span):
+                slot = self._firing_slot(job_id)
+                if slot is not None:
+                    late = db_now() - slot
+                    trace.set("schedule.lateness_ms", late.total_seconds() * 1000)
+            self._run_job_traced(job_id)
+
+    def _run_job_traced(self, job_id: int) -> None:
+        if self._cluster is not None:
+            if not self._cluster.owns(job_id):
+                logger.info("Job %s moved to another node; skipping", job_id)
+                return
+            slot = self._firing_slot(job_id)
+            if slot is not None and not self._cluster.claim_firing(job_id, slot):
+                logger.info(
+                    "Firing of job %s at %s already claimed by another node",
+                    job_id,
+                    slot,
+                )
+                return
+
+        # No session is held while waiting for a slot.
+        with self.runs.slot(job_id) as cancel:
+            if cancel is None:
+                logger.info("Scheduler stopped; skipping run of job %s", job_id)
+                return
+            db = SessionLocal()
+            try:
+                with span("db.checkout"):
+                    db.connection()
+                job = db.query(BackupJob).filter_by(id=job_id).first()
+                if job is None:
+                    logger.warning("Job %s not found; skipping scheduled run", job_id)
+                    return
+
+                logger.info(
+                    "Starting scheduled backup for job %s (%s)",
+                    job.id,
+                    job.name,
+                )
+                run = run_backup_for_job(db, job, cancel=cancel)
+                logger.info(
+                    "Finished scheduled backup for job %s with status=%s, message=%s",
+                    job.id,
+                    run.status,
+                    run.message,
+                )
+            except Exception:
+                logger.exception(
+                    "Error while running scheduled backup for job %s", job_id
+                )
+            finally:
+                db.close()
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import errno
+import os
+import struct
+import zipfile
+from typing import List, Optional, Tuple
+
+# (offset, length) of a region of a file that holds data.
+Extent = Tuple[int, int]
+
+# Zip extra field holding the hole map of a sparse entry. The entry's data is
+# only the data regions, back to back; the field gives the file's full size
+# and where each region goes:
+#   <H id> <H size> <Q file size> <I count> count * (<Q offset> <Q length>)
+SPARSE_EXTRA_ID = 0x7370
+_HEADER = struct.Struct("<HHQI")
+_EXTENT = struct.Struct("<QQ")
+# Keeps the extra field (plus zip64 fields) below its 64 KiB limit.
+MAX_EXTENTS = 2048
+# Entry comment, for tools that do not know the extra field.
+SPARSE_COMMENT = b"autobackup sparse entry: restore with python -m autobackup.restore"
+
+sparse_supported = hasattr(os, "SEEK_DATA") and hasattr(os, "SEEK_HOLE")
+
+
+def may_be_sparse(st: os.stat_result) -> bool:
+    """Cheap check: fewer blocks allocated than the size needs."""
+    blocks = getattr(st, "st_blocks", None)
+    return sparse_supported and blocks is not None and blocks * 512 < st.st_size
+
+
+def data_extents(fd: int, size: int) -> List[Extent]:
+    """Data regions of an open file, found with SEEK_DATA / SEEK_HOLE."""
+    extents: List[Extent] = []
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as exc:
+            if exc.errno == errno.ENXIO:  # only a hole is left
+                break
+            raise
+        if start >= size:
+            break
+        end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+        extents.append((start, end - start))
+        offset = end
+    return extents
+
+
+def _coalesce(extents: List[Extent], limit: int) -> List[Extent]:
+    """Merge extents across the smallest holes until at most ``limit`` remain."""
+    if len(extents) <= limit:
+        return extents
+    gaps = sorted(
+        range(1, len(extents)),
+        key=lambda i: extents[i][0] - sum(extents[i - 1]),
+    )
+    # Keep the largest holes; the others are stored as zeros.
+    kept = set(gaps[len(extents) - limit :])
+    merged: List[Extent] = []
+    for index, (start, length) in enumerate(extents):
+        if merged and index not in kept:
+            first, _ = merged[-1]
+            merged[-1] = (first, start + length - first)
+        else:
+            merged.append((start, length))
+    return merged
+
+
+def sparse_extents(fd: int, st: os.stat_result) -> Optional[List[Extent]]:
+    """The data extents of a file worth archiving sparsely, or None."""
+    if not may_be_sparse(st):
+        return None
+    try:
+        extents = data_extents(fd, st.st_size)
+    except OSError:
+        return None
+    extents = _coalesce(extents, MAX_EXTENTS)
+    if sum(length for _, length in extents) >= st.st_size:
+        return None
+    return extents
+
+
+def encode_extra(size: int, extents: List[Extent]) -> bytes:
+    payload_size = _HEADER.size - 4 + _EXTENT.size * len(extents)
+    parts = [_HEADER.pack(SPARSE_EXTRA_ID, payload_size, size, len(extents))]
+    parts.extend(_EXTENT.pack(start, length) for start, length in extents)
+    return b"".join(parts)
+
+
+def find_extra_field(extra: bytes, field_id: int) -> Optional[bytes]:
+    """Payload of one field of a zip extra block, or None if absent."""
+    pos = 0
+    while pos + 4 <= len(extra):
+        current, size = struct.unpack_from("<HH", extra, pos)
+        if current == field_id:
+            return extra[pos + 4 : pos + 4 + size]
+        pos += 4 + size
+    return None
+
+
+def decode_extra(extra: bytes) -> Optional[Tuple[int, List[Extent]]]:
+    """(file size, extents) from a zip extra field, or None if not sparse."""
+    payload = find_extra_field(extra, SPARSE_EXTRA_ID)
+    if payload is None:
+        return None
+    size, count = struct.unpack_from("<QI", payload)
+    start = _HEADER.size - 4
+    extents = [
+        _EXTENT.unpack_from(payload, start + i * _EXTENT.size) for i in range(count)
+    ]
+    return size, extents
+
+
+def logical_size(info: zipfile.ZipInfo) -> int:
+    """Size of the file an entry restores to (holes included)."""
+    sparse = decode_extra(info.extra)
+    return sparse[0] if sparse else info.file_size
@@ -0,0 +1,216 @@
+# pyright: reportArgumentType=false, reportAttributeAccessIssue=false
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.orm import Session
+
+from autobackup.clock import seconds_between
+from autobackup.db import upsert_insert
+from autobackup.models import BackupDailyStat, BackupRun
+
+logger = logging.getLogger(__name__)
+
+# Statuses counted in the rollup, by record_finished_run() and
+# rebuild_daily_stats() alike. Cancelled runs are neither a success nor a
+# failure and are left out.
+ROLLUP_STATUSES = ("success", "error")
+
+
+@dataclass
+class DashboardStats:
+    total_runs: int = 0
+    success_count: int = 0
+    failure_count: int = 0
+    avg_duration_seconds: float = 0.0
+    # (day, number of runs) ordered by day
+    per_day: List[Tuple[date, int]] = field(default_factory=list)
+
+
+def record_finished_run(db: Session, run: BackupRun) -> None:
+    """
+    Add a finished run to the daily rollup (same transaction as the run).
+
+    A single INSERT ... ON CONFLICT DO UPDATE, so concurrent runs of the same
+    job on the same day never lose an increment.
+    """
+    if run.start_time is None or run.status not in ROLLUP_STATUSES:
+        return
+
+    success = 1 if run.status == "success" else 0
+    duration = 0.0
+    has_duration = 0
+    if run.end_time is not None:
+        duration = seconds_between(run.start_time, run.end_time) or 0.0
+        has_duration = 1
+    size = int(run.size_bytes or 0)
+
+    values = {
+        "job_id": run.job_id,
+        "day": run.start_time.date(),
+        "total_runs": 1,
+        "success_count": success,
+        "failure_count": 1 - success,
+        "total_duration_seconds": duration,
+        "duration_count": has_duration,
+        "total_bytes": size,
+    }
+    table = BackupDailyStat.__table__
+    update = {
+        "total_runs": table.c.total_runs + 1,
+        "success_count": table.c.success_count + success,
+        "failure_count": table.c.failure_count + (1 - success),
+        "total_duration_seconds": table.c.total_duration_seconds + duration,
+        "duration_count": table.c.duration_count + has_duration,
+        "total_bytes": table.c.total_bytes + size,
+    }
+    if not success:
+        values["last_error"] = update["last_error"] = run.message
+        values["last_error_at"] = update["last_error_at"] = run.end_time
+
+    stmt = upsert_insert(db)(table).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.job_id, table.c.day],
+        set_=update,
+    )
+    db.execute(stmt)
+
+
+def record_compacted_runs(db: Session, counts: Dict[Tuple[int, date], int]) -> None:
+    """Count detailed runs removed by compaction on their (job, day) rollup row."""
+    table = BackupDailyStat.__table__
+    insert_fn = upsert_insert(db)
+    for (job_id, day), count in counts.items():
+        stmt = insert_fn(table).values(
+            job_id=job_id,
+            day=day,
+            total_runs=0,
+            success_count=0,
+            failure_count=0,
+            total_duration_seconds=0.0,
+            duration_count=0,
+            total_bytes=0,
+            compacted_runs=count,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.job_id, table.c.day],
+            set_={"compacted_runs": table.c.compacted_runs + count},
+        )
+        db.execute(stmt)
+
+
+def rebuild_daily_stats(db: Session) -> None:
+    """
+    Recompute the rollup from backup_runs with one INSERT ... SELECT.
+
+    Only needed once for databases created before the rollup existed; it
+    would drop the counters of runs that were already compacted.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        duration = (
+            func.julianday(BackupRun.end_time) - func.julianday(BackupRun.start_time)
+        ) * 86400.0
+    else:
+        duration = func.extract("epoch", BackupRun.end_time - BackupRun.start_time)
+    day = func.date(BackupRun.start_time)
+
+    finished = BackupRun.status.in_(ROLLUP_STATUSES)
+    success = case((BackupRun.status == "success", 1), else_=0)
+    has_end = case((BackupRun.end_time.is_not(None), 1), else_=0)
+
+    rollup = (
+        select(
+            BackupRun.job_id,
+            day,
+            func.count(),
+            func.sum(success),
+            func.count() - func.sum(success),
+            func.coalesce(
+                func.sum(case((BackupRun.end_time.is_not(None), duration))), 0.0
+            ),
+            func.sum(has_end),
+            func.coalesce(func.sum(BackupRun.size_bytes), 0),
+        )
+        .where(finished, BackupRun.start_time.is_not(None))
+        .group_by(BackupRun.job_id, day)
+    )
+
+    db.query(BackupDailyStat).delete(synchronize_session=False)
+    db.execute(
+        insert(BackupDailyStat).from_select(
+            [
+                "job_id",
+                "day",
+                "total_runs",
+                "success_count",
+                "failure_count",
+                "total_duration_seconds",
+                "duration_count",
+                "total_bytes",
+            ],
+            rollup,
+        )
+    )
+    db.commit()
+
+
+def ensure_daily_stats(db: Session) -> None:
+    """Backfill the rollup if it is empty but run history exists."""
+    has_stats = db.execute(select(BackupDailyStat.job_id).limit(1)).first()
+    if has_stats is not None:
+        return
+
+    has_runs = db.execute(select(BackupRun.id).limit(1)).first()
+    if has_runs is None:
+        return
+
+    logger.info("Backfilling daily backup statistics from run history...")
+    rebuild_daily_stats(db)
+
+
+def load_dashboard_stats(
+    db: Session,
+    start_day: Optional[date] = None,
+    end_day: Optional[date] = None,
+    job_id: Optional[int] = None,
+) -> DashboardStats:
+    """KPIs and the per-day series, aggregated in SQL from the daily rollup."""
+    filters = []
+    if start_day is not None:
+        filters.append(BackupDailyStat.day >= start_day)
+    if end_day is not None:
+        filters.append(BackupDailyStat.day <= end_day)
+    if job_id is not None:
+        filters.append(BackupDailyStat.job_id == job_id)
+
+    totals = db.execute(
+        select(
+            func.coalesce(func.sum(BackupDailyStat.total_runs), 0),
+            func.coalesce(func.sum(BackupDailyStat.success_count), 0),
+            func.coalesce(func.sum(BackupDailyStat.failure_count), 0),
+            func.coalesce(func.sum(BackupDailyStat.total_duration_seconds), 0.0),
+            func.coalesce(func.sum(BackupDailyStat.duration_count), 0),
+        ).where(*filters)
+    ).one()
+
+    per_day = db.execute(
+        select(BackupDailyStat.day, func.sum(BackupDailyStat.total_runs))
+        .where(*filters)
+        .group_by(BackupDailyStat.day)
+        .order_by(BackupDailyStat.day)
+    ).all()
+
+    total_runs, success_count, failure_count, total_secs, duration_count = totals
+    return DashboardStats(
+        total_runs=int(total_runs),
+        success_count=int(success_count),
+        failure_count=int(failure_count),
+        avg_duration_seconds=(
+            float(total_secs) / duration_count if duration_count else 0.0
+        ),
+        per_day=[(day, int(count)) for day, count in per_day],
+    )
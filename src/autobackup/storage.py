@@ -0,0 +1,352 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from autobackup.config import settings
+
+logger = logging.getLogger(__name__)
+
+S3_SCHEME = "s3://"
+# S3 rejects multipart parts smaller than this (except the last one).
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# S3 limits: part size and number of parts of one multipart upload.
+S3_MAX_PART_SIZE = 5 * 1024 * 1024 * 1024
+S3_MAX_PARTS = 10_000
+# The archive size is not known up front: parts double in size every this
+# many parts, so a 16 MiB part size still reaches S3's 5 TiB object limit
+# before its part limit.
+S3_PART_GROWTH_EVERY = 1000
+
+
+class StorageWriter:
+    """Write-only stream to one object of a backend.
+
+    ``close()`` commits the object and returns its size; ``abort()`` discards
+    whatever was written. Exactly one of the two must be called.
+    """
+
+    def write(self, data: bytes) -> int:
+        raise NotImplementedError
+
+    def close(self) -> int:
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        raise NotImplementedError
+
+
+class StorageBackend:
+    """Where archives are stored: a local folder or an object store bucket.
+
+    Archives are addressed by a location string: a plain path for the local
+    backend, ``s3://bucket/key`` for S3. That string is what is stored in
+    backup_runs.output_file, so retention can delete through the same backend.
+    """
+
+    def join(self, destination: str, filename: str) -> str:
+        raise NotImplementedError
+
+    def open_writer(self, location: str) -> StorageWriter:
+        raise NotImplementedError
+
+    def exists(self, location: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, location: str) -> bool:
+        """Delete an archive; returns False if it did not exist."""
+        raise NotImplementedError
+
+
+# ----------------------------------------------------------------------
+# Local filesystem
+# ----------------------------------------------------------------------
+class _LocalWriter(StorageWriter):
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._fh = open(path, "wb")
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        written = self._fh.write(data)
+        self._size += written
+        return written
+
+    def close(self) -> int:
+        self._fh.close()
+        return self._size
+
+    def abort(self) -> None:
+        self._fh.close()
+        self._path.unlink(missing_ok=True)
+
+
+class LocalBackend(StorageBackend):
+    def join(self, destination: str, filename: str) -> str:
+        return str(Path(destination) / filename)
+
+    def open_writer(self, location: str) -> StorageWriter:
+        return _LocalWriter(Path(location))
+
+    def exists(self, location: str) -> bool:
+        return Path(location).exists()
+
+    def delete(self, location: str) -> bool:
+        path = Path(location)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+
+# ----------------------------------------------------------------------
+# S3-compatible object storage
+# ----------------------------------------------------------------------
+def parse_s3_location(location: str) -> Tuple[str, str]:
+    """Split ``s3://bucket/key`` into (bucket, key)."""
+    bucket, _, key = location[len(S3_SCHEME) :].partition("/")
+    if not bucket:
+        raise ValueError(f"Invalid S3 location: {location}")
+    return bucket, key
+
+
+def _s3_client() -> Any:
+    try:
+        import boto3  # type: ignore[import-not-found]
+    except ImportError as exc:
+        raise RuntimeError(
+            "S3 destinations need boto3 (pip install 'autobackup-manager[s3]')"
+        ) from exc
+
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.s3_endpoint_url or None,
+        region_name=settings.s3_region or None,
+    )
+
+
+class _S3MultipartWriter(StorageWriter):
+    """Streams an object to S3 as a multipart upload.
+
+    Parts are uploaded by a pool of ``concurrency`` threads while the archive
+    is still being written. They are ``part_size`` bytes at first and double
+    every S3_PART_GROWTH_EVERY parts (up to S3_MAX_PART_SIZE). At most
+    ``concurrency`` parts are in flight, so memory stays below
+    (concurrency + 1) times the current part size; ``write()`` blocks until a
+    slot frees up. Each part is retried on its own. Small objects that fit in
+    one part are sent with a single PutObject.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: str,
+        key: str,
+        part_size: int,
+        concurrency: int,
+        retries: int,
+    ) -> None:
+        self._client = client
+        self._bucket = bucket
+        self._key = key
+        self._part_size = max(part_size, S3_MIN_PART_SIZE)
+        self._retries = max(0, retries)
+
+        self._buffer = bytearray()
+        self._size = 0
+        self._upload_id: Optional[str] = None
+        self._parts: List[Future[Dict[str, Any]]] = []
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, concurrency),
+            thread_name_prefix="autobackup-s3",
+        )
+
+    def _current_part_size(self) -> int:
+        doublings = len(self._parts) // S3_PART_GROWTH_EVERY
+        return min(self._part_size << doublings, S3_MAX_PART_SIZE)
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._size += len(data)
+        while len(self._buffer) >= self._current_part_size():
+            part_size = self._current_part_size()
+            part = bytes(self._buffer[:part_size])
+            del self._buffer[:part_size]
+            self._submit(part)
+        return len(data)
+
+    def _submit(self, body: bytes) -> None:
+        if self._upload_id is None:
+            response = self._client.create_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+            )
+            self._upload_id = response["UploadId"]
+
+        # Fail fast instead of queueing more parts behind a broken upload.
+        for future in self._parts:
+            if future.done() and future.exception() is not None:
+                raise future.exception()  # type: ignore[misc]
+
+        part_number = len(self._parts) + 1
+        if part_number > S3_MAX_PARTS:
+            raise RuntimeError(
+                f"s3://{self._bucket}/{self._key}: archive exceeds the "
+                f"{S3_MAX_PARTS} parts of an S3 multipart upload "
+                f"({self._size} bytes so far)"
+            )
+
+        self._slots.acquire()
+        try:
+            future = self._pool.submit(self._upload_part, part_number, body)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._parts.append(future)
+
+    def _upload_part(self, part_number: int, body: bytes) -> Dict[str, Any]:
+        for attempt in range(self._retries + 1):
+            try:
+                response = self._client.upload_part(
+                    Bucket=self._bucket,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )
+                return {"PartNumber": part_number, "ETag": response["ETag"]}
+            except Exception as exc:  # noqa: BLE001
+                if attempt >= self._retries:
+                    raise
+                delay = min(30.0, 0.5 * 2**attempt)
+                logger.warning(
+                    "S3 upload of part %s of %s failed (%s); retrying in %.1fs",
+                    part_number,
+                    self._key,
+                    exc,
+                    delay,
+                )
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def close(self) -> int:
+        try:
+            if self._upload_id is None:
+                self._client.put_object(
+                    Bucket=self._bucket,
+                    Key=self._key,
+                    Body=bytes(self._buffer),
+                )
+            else:
+                if self._buffer:
+                    self._submit(bytes(self._buffer))
+                parts = [future.result() for future in self._parts]
+                self._client.complete_multipart_upload(
+                    Bucket=self._bucket,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+            self._pool.shutdown(wait=True)
+        return self._size
+
+    def abort(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._buffer = bytearray()
+        if self._upload_id is None:
+            return
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+            )
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Could not abort S3 upload of %s: %s", self._key, exc)
+        self._upload_id = None
+
+
+class S3Backend(StorageBackend):
+    """S3 or any S3-compatible store (MinIO, Ceph, ...) through boto3."""
+
+    def __init__(
+        self,
+        client: Any = None,
+        part_size: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        retries: Optional[int] = None,
+    ) -> None:
+        self._client = client
+        self._part_size = part_size or settings.s3_part_size_mb * 1024 * 1024
+        self._concurrency = concurrency or settings.s3_upload_concurrency
+        self._retries = settings.s3_part_retries if retries is None else retries
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                self._client = _s3_client()
+            return self._client
+
+    def join(self, destination: str, filename: str) -> str:
+        return f"{destination.rstrip('/')}/{filename}"
+
+    def open_writer(self, location: str) -> StorageWriter:
+        bucket, key = parse_s3_location(location)
+        return _S3MultipartWriter(
+            self.client,
+            bucket,
+            key,
+            part_size=self._part_size,
+            concurrency=self._concurrency,
+            retries=self._retries,
+        )
+
+    def exists(self, location: str) -> bool:
+        bucket, key = parse_s3_location(location)
+        try:
+            self.client.head_object(Bucket=bucket, Key=key)
+        except Exception as exc:  # noqa: BLE001
+            status = getattr(exc, "response", {}).get("Error", {}).get("Code")
+            if status in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        return True
+
+    def delete(self, location: str) -> bool:
+        bucket, key = parse_s3_location(location)
+        self.client.delete_object(Bucket=bucket, Key=key)
+        return True
+
+
+_local_backend = LocalBackend()
+_s3_backend: Optional[S3Backend] = None
+_backend_lock = threading.Lock()
+
+
+def is_remote(location: str) -> bool:
+    return location.startswith(S3_SCHEME)
+
+
+def backend_for(location: str) -> StorageBackend:
+    """The backend that stores ``location`` (a destination or an archive)."""
+    global _s3_backend
+    if not is_remote(location):
+        return _local_backend
+    with _backend_lock:
+        if _s3_backend is None:
+            _s3_backend = S3Backend()
+        return _s3_backend
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Small writes (zip headers) are gathered into chunks of this size first.
+TEE_CHUNK_SIZE = 1024 * 1024
+
+
+class _Sink:
+    """One destination of a TeeWriter, drained by its own thread."""
+
+    def __init__(self, index: int, fileobj: Any, buffer_limit: int) -> None:
+        self.index = index
+        self.fileobj = fileobj
+        self.error: Optional[BaseException] = None
+        self.bytes_written = 0
+
+        self._limit = buffer_limit
+        self._chunks: Deque[bytes] = deque()
+        self._buffered = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"autobackup-tee-{index}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def put(self, chunk: bytes) -> None:
+        """Queue a chunk; blocks while this sink is ``buffer_limit`` bytes behind."""
+        with self._cond:
+            while (
+                self.error is None
+                and self._buffered
+                and self._buffered + len(chunk) > self._limit
+            ):
+                self._cond.wait()
+            if self.error is not None:
+                return
+            self._chunks.append(chunk)
+            self._buffered += len(chunk)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._chunks and not self._closed:
+                    self._cond.wait()
+                if not self._chunks:
+                    return
+                chunk = self._chunks[0]
+
+            try:
+                self.fileobj.write(chunk)
+            except BaseException as exc:  # noqa: BLE001
+                with self._cond:
+                    self.error = exc
+                    self._chunks.clear()
+                    self._buffered = 0
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._chunks.popleft()
+                self._buffered -= len(chunk)
+                self.bytes_written += len(chunk)
+                self._cond.notify_all()
+
+
+class TeeWriter:
+    """Write-only stream that copies everything to several writers.
+
+    A writer is anything with ``write(bytes)``: a file or a StorageWriter.
+
+    Each destination is written by its own thread from a queue, so a slow
+    destination does not hold back the others until it is ``buffer_limit``
+    bytes behind; only then does ``write()`` wait for it. A destination that
+    fails is dropped and the others carry on; see ``errors`` after ``close()``.
+
+    The stream is not seekable (``tell()`` only), so zipfile writes entries
+    with data descriptors.
+    """
+
+    def __init__(self, fileobjs: List[Any], buffer_limit: int) -> None:
+        limit = max(buffer_limit, TEE_CHUNK_SIZE)
+        self._sinks = [_Sink(i, f, limit) for i, f in enumerate(fileobjs)]
+        self._pending = bytearray()
+        self._position = 0
+        self._closed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self._position
+
+    def write(self, data: bytes) -> int:
+        if self._closed:
+            raise ValueError("write to closed TeeWriter")
+        self._pending += data
+        self._position += len(data)
+        if len(self._pending) >= TEE_CHUNK_SIZE:
+            self._dispatch()
+        if self._sinks and all(sink.error is not None for sink in self._sinks):
+            raise OSError("All destinations failed") from self._sinks[0].error
+        return len(data)
+
+    def flush(self) -> None:
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if not self._pending:
+            return
+        chunk = bytes(self._pending)
+        self._pending.clear()
+        for sink in self._sinks:
+            sink.put(chunk)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._dispatch()
+        self._closed = True
+        for sink in self._sinks:
+            sink.close()
+
+    @property
+    def errors(self) -> List[Optional[BaseException]]:
+        """Per destination: the write error, or None if it got every byte."""
+        return [sink.error for sink in self._sinks]
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Byte-rate limit shared by several threads (0 = unlimited).
+
+    ``wait(n)`` reserves the next n bytes of the budget and sleeps until they
+    are due, so callers together never exceed ``bytes_per_second``.
+    """
+
+    def __init__(self, bytes_per_second: float) -> None:
+        self._rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    def wait(self, nbytes: int) -> None:
+        if self._rate <= 0 or nbytes <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + nbytes / self._rate
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
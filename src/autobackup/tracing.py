@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from autobackup.config import settings
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "autobackup"
+
+_SESSION_COMMIT_KEY = "autobackup_commit_span"
+_CURSOR_SPAN_KEY = "autobackup_query_span"
+
+
+class _NoopSpan:
+    """Returned whenever nothing is traced; every method does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+class _Trace:
+    """Spans of one sampled trace, written out when its root span ends."""
+
+    __slots__ = ("trace_id", "spans", "lock")
+
+    def __init__(self) -> None:
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    """A timed operation within a sampled trace. Use as a context manager."""
+
+    __slots__ = (
+        "name",
+        "attrs",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "error",
+        "thread",
+        "_trace",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        trace: _Trace,
+        name: str,
+        parent_id: Optional[str],
+        attrs: Dict[str, Any],
+    ) -> None:
+        self._trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self.thread = threading.current_thread().name
+        self._token: Optional[contextvars.Token[Optional[Span]]] = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attrs[key] = value
+
+    def start(self) -> "Span":
+        self.start_ns = time.time_ns()
+        return self
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        trace = self._trace
+        with trace.lock:
+            trace.spans.append(self)
+        if self.parent_id is None and _exporter is not None:
+            _exporter.export(trace)
+
+    def __enter__(self) -> "Span":
+        self.start()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        self.finish(exc)
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "autobackup_span",
+    default=None,
+)
+
+
+class TraceExporter:
+    """Appends finished traces to a file, one JSON line per trace.
+
+    ``fmt`` "jsonl" writes {"trace_id", "spans": [...]} with plain fields;
+    "otlp" writes each trace as an OTLP/JSON ExportTraceServiceRequest, the
+    format read by the OpenTelemetry Collector's file receiver.
+    """
+
+    def __init__(self, path: str, fmt: str = "jsonl") -> None:
+        self._path = path
+        self._fmt = fmt
+        self._lock = threading.Lock()
+
+    def export(self, trace: _Trace) -> None:
+        with trace.lock:
+            spans = sorted(trace.spans, key=lambda span: span.start_ns)
+        if self._fmt == "otlp":
+            record = _otlp_record(trace.trace_id, spans)
+        else:
+            record = _jsonl_record(trace.trace_id, spans)
+        line = json.dumps(record, default=str, separators=(",", ":"))
+        try:
+            with self._lock, open(self._path, "a", encoding="utf-8") as fh:
+                fh.write(line + "\n")
+        except OSError as exc:
+            logger.warning("Could not write trace to %s: %s", self._path, exc)
+
+
+def _jsonl_record(trace_id: str, spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "trace_id": trace_id,
+        "spans": [
+            {
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "start": span.start_ns / 1e9,
+                "duration_ms": round((span.end_ns - span.start_ns) / 1e6, 3),
+                "thread": span.thread,
+                "error": span.error,
+                "attrs": span.attrs,
+            }
+            for span in spans
+        ],
+    }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attrs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attrs.items()]
+
+
+def _otlp_record(trace_id: str, spans: List[Span]) -> Dict[str, Any]:
+    otlp_spans = []
+    for span in spans:
+        item: Dict[str, Any] = {
+            "traceId": trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes({**span.attrs, "thread.name": span.thread}),
+            # STATUS_CODE_OK / STATUS_CODE_ERROR
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            item["parentSpanId"] = span.parent_id
+        otlp_spans.append(item)
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes({"service.name": SERVICE_NAME})
+                },
+                "scopeSpans": [
+                    {"scope": {"name": "autobackup.tracing"}, "spans": otlp_spans}
+                ],
+            }
+        ]
+    }
+
+
+_exporter: Optional[TraceExporter] = None
+_sample_rate = 1.0
+
+
+def start_trace(name: str, **attrs: Any) -> Any:
+    """
+    Start a root span, subject to sampling; use as a context manager.
+
+    Inside an already sampled trace this is just a child span. When tracing
+    is disabled or the trace is not sampled, a shared no-op object is
+    returned, so the cost is one attribute check.
+    """
+    if _exporter is None:
+        return _NOOP
+    parent = _current.get()
+    if parent is not None:
+        return Span(parent._trace, name, parent.span_id, attrs)
+    if _sample_rate < 1.0 and random.random() >= _sample_rate:
+        return _NOOP
+    return Span(_Trace(), name, None, attrs)
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """A child span of the current span; a no-op outside a sampled trace."""
+    parent = _current.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent._trace, name, parent.span_id, attrs)
+
+
+def tracing_enabled() -> bool:
+    return _exporter is not None
+
+
+# ----------------------------------------------------------------------
+# SQLAlchemy instrumentation: one span per statement and per commit
+# ----------------------------------------------------------------------
+def _before_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool
+) -> None:
+    parent = _current.get()
+    if parent is None:
+        return
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement else "SQL"
+    child = Span(parent._trace, f"db.{verb.lower()}", parent.span_id, {})
+    child.set("db.statement", statement[:200])
+    conn.info.setdefault(_CURSOR_SPAN_KEY, []).append(child.start())
+
+
+def _after_cursor_execute(
+    conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, many: bool
+) -> None:
+    stack = conn.info.get(_CURSOR_SPAN_KEY)
+    if stack:
+        stack.pop().finish()
+
+
+def _before_commit(session: Session) -> None:
+    parent = _current.get()
+    if parent is not None:
+        session.info[_SESSION_COMMIT_KEY] = Span(
+            parent._trace, "db.commit", parent.span_id, {}
+        ).start()
+
+
+def _after_commit(session: Session) -> None:
+    pending = session.info.pop(_SESSION_COMMIT_KEY, None)
+    if pending is not None:
+        pending.finish()
+
+
+def _after_rollback(session: Session) -> None:
+    pending = session.info.pop(_SESSION_COMMIT_KEY, None)
+    if pending is not None:
+        pending.finish(RuntimeError("rolled back"))
+
+
+def configure_tracing(
+    path: Optional[str] = None,
+    sample_rate: Optional[float] = None,
+    fmt: Optional[str] = None,
+) -> bool:
+    """
+    Enable tracing if a trace file is configured (TRACE_FILE).
+
+    Also hooks SQLAlchemy so statements and commits inside a sampled trace
+    become spans. Returns whether tracing is enabled.
+    """
+    global _exporter, _sample_rate
+
+    path = settings.trace_file if path is None else path
+    if not path:
+        return False
+
+    _sample_rate = settings.trace_sample_rate if sample_rate is None else sample_rate
+    _exporter = TraceExporter(path, fmt or settings.trace_format)
+
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+
+    logger.info(
+        "Tracing enabled: %s (%s, sample rate %s)",
+        path,
+        fmt or settings.trace_format,
+        _sample_rate,
+    )
+    return True
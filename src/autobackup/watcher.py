@@ -0,0 +1,387 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+_EVENT_HEADER = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+_libc: Optional[ctypes.CDLL] = None
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    global _libc
+    if _libc is not None:
+        return _libc
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6",
+            use_errno=True,
+        )
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    _libc = libc
+    return _libc
+
+
+def inotify_available() -> bool:
+    """Return True when Linux inotify can be used on this platform."""
+    return _load_libc() is not None
+
+
+@dataclass
+class _WatchedSource:
+    job_id: int
+    path: str
+    min_interval: float
+    wds: Set[int] = field(default_factory=set)
+    first_change: Optional[float] = None
+    last_change: Optional[float] = None
+
+
+class ChangeWatcher:
+    """Watch source folders with inotify and report when changes have settled.
+
+    A single background thread blocks in ``poll()`` on the inotify descriptor,
+    so an unchanged source costs no CPU or I/O. Once a change is seen the job
+    becomes "pending" and ``on_settled(job_id)`` is called when:
+
+    - no further change arrived for ``settle_seconds`` (debounce), or
+    - changes kept arriving for ``max_delay_seconds`` since the first one,
+
+    but never earlier than ``min_interval`` seconds after the previous firing
+    for that job.
+    """
+
+    def __init__(
+        self,
+        on_settled: Callable[[int], None],
+        settle_seconds: float,
+        max_delay_seconds: float,
+    ) -> None:
+        self._on_settled = on_settled
+        self._settle = max(0.0, settle_seconds)
+        self._max_delay = max(self._settle, max_delay_seconds)
+
+        self._lock = threading.Lock()
+        self._sources: Dict[int, _WatchedSource] = {}
+        self._wd_jobs: Dict[int, Set[int]] = {}
+        self._wd_dirs: Dict[int, str] = {}
+        # Kept across clear() so a reload does not reset the minimum interval.
+        self._last_fired: Dict[int, float] = {}
+
+        self._fd: Optional[int] = None
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    # ------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------
+    def start(self) -> None:
+        libc = _load_libc()
+        if libc is None:
+            raise RuntimeError("inotify is not available on this platform")
+        if self._thread is not None:
+            return
+
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        self._fd = fd
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="autobackup-watcher",
+            daemon=True,
+        )
+        self._thread.start()
+        logger.info("ChangeWatcher started")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._stopping.set()
+        self._wake()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+        with self._lock:
+            self._sources.clear()
+            self._wd_jobs.clear()
+            self._wd_dirs.clear()
+
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._wake_r = self._wake_w = None
+        logger.info("ChangeWatcher stopped")
+
+    # ------------------------------------------------------------
+    # Watches
+    # ------------------------------------------------------------
+    def watch(self, job_id: int, path: str, min_interval_seconds: float = 0.0) -> None:
+        """Start watching ``path`` (recursively) on behalf of ``job_id``."""
+        with self._lock:
+            self._unwatch_locked(job_id)
+            source = _WatchedSource(
+                job_id=job_id,
+                path=path,
+                min_interval=max(0.0, min_interval_seconds),
+            )
+            self._sources[job_id] = source
+            self._add_tree_locked(source, path)
+
+        if not source.wds:
+            logger.warning("Job %s: could not watch source path %s", job_id, path)
+
+    def unwatch(self, job_id: int) -> None:
+        with self._lock:
+            self._unwatch_locked(job_id)
+
+    def clear(self) -> None:
+        """Remove all watches (pending changes are dropped)."""
+        with self._lock:
+            for job_id in list(self._sources):
+                self._unwatch_locked(job_id)
+
+    def _add_tree_locked(self, source: _WatchedSource, top: str) -> None:
+        for root, _, _ in os.walk(top):
+            self._add_watch_locked(source, root)
+
+    def _add_watch_locked(self, source: _WatchedSource, directory: str) -> None:
+        libc = _load_libc()
+        if libc is None or self._fd is None:
+            return
+
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logger.debug(
+                "inotify_add_watch failed for %s: %s",
+                directory,
+                os.strerror(err),
+            )
+            return
+
+        source.wds.add(wd)
+        self._wd_jobs.setdefault(wd, set()).add(source.job_id)
+        self._wd_dirs[wd] = directory
+
+    def _unwatch_locked(self, job_id: int) -> None:
+        source = self._sources.pop(job_id, None)
+        if source is None:
+            return
+
+        libc = _load_libc()
+        for wd in source.wds:
+            jobs = self._wd_jobs.get(wd)
+            if jobs is None:
+                continue
+            jobs.discard(job_id)
+            if not jobs:
+                del self._wd_jobs[wd]
+                self._wd_dirs.pop(wd, None)
+                if libc is not None and self._fd is not None:
+                    libc.inotify_rm_watch(self._fd, wd)
+
+    # ------------------------------------------------------------
+    # Event loop
+    # ------------------------------------------------------------
+    def _wake(self) -> None:
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"\0")
+            except OSError:
+                pass
+
+    def _run(self) -> None:
+        assert self._fd is not None and self._wake_r is not None
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        poller.register(self._wake_r, select.POLLIN)
+
+        while not self._stopping.is_set():
+            timeout = self._next_timeout()
+            try:
+                ready = poller.poll(None if timeout is None else timeout * 1000.0)
+            except InterruptedError:
+                continue
+
+            for fd, _ in ready:
+                if fd == self._wake_r:
+                    self._drain_wakeups()
+                elif fd == self._fd:
+                    self._read_events()
+
+            self._fire_due()
+
+    def _drain_wakeups(self) -> None:
+        assert self._wake_r is not None
+        try:
+            while os.read(self._wake_r, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _read_events(self) -> None:
+        assert self._fd is not None
+        chunks: List[bytes] = []
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            chunks.append(data)
+
+        now = time.monotonic()
+        with self._lock:
+            for data in chunks:
+                self._handle_buffer_locked(data, now)
+
+    def _handle_buffer_locked(self, data: bytes, now: float) -> None:
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            start = offset + _EVENT_HEADER.size
+            name_bytes = data[start : start + length]
+            offset = start + length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflow; marking all jobs as changed")
+                for source in self._sources.values():
+                    self._mark_changed_locked(source, now)
+                continue
+
+            if mask & IN_IGNORED:
+                for job_id in self._wd_jobs.pop(wd, set()):
+                    source = self._sources.get(job_id)
+                    if source is not None:
+                        source.wds.discard(wd)
+                self._wd_dirs.pop(wd, None)
+                continue
+
+            job_ids = self._wd_jobs.get(wd)
+            if not job_ids:
+                continue
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                parent = self._wd_dirs.get(wd)
+                name = os.fsdecode(name_bytes.rstrip(b"\0"))
+                if parent is not None and name:
+                    new_dir = os.path.join(parent, name)
+                    for job_id in list(job_ids):
+                        source = self._sources.get(job_id)
+                        if source is not None:
+                            self._add_tree_locked(source, new_dir)
+
+            for job_id in list(job_ids):
+                source = self._sources.get(job_id)
+                if source is not None:
+                    self._mark_changed_locked(source, now)
+
+    @staticmethod
+    def _mark_changed_locked(source: _WatchedSource, now: float) -> None:
+        if source.first_change is None:
+            source.first_change = now
+        source.last_change = now
+
+    def _deadline_locked(self, source: _WatchedSource) -> Optional[float]:
+        if source.first_change is None or source.last_change is None:
+            return None
+
+        due = min(
+            source.last_change + self._settle,
+            source.first_change + self._max_delay,
+        )
+        last_fired = self._last_fired.get(source.job_id)
+        if last_fired is not None:
+            due = max(due, last_fired + source.min_interval)
+        return due
+
+    def _next_timeout(self) -> Optional[float]:
+        """Seconds until the next pending job is due, or None when idle."""
+        with self._lock:
+            deadlines = [
+                d
+                for d in (self._deadline_locked(s) for s in self._sources.values())
+                if d is not None
+            ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _fire_due(self) -> None:
+        now = time.monotonic()
+        due_jobs: List[int] = []
+
+        with self._lock:
+            for source in self._sources.values():
+                deadline = self._deadline_locked(source)
+                if deadline is not None and deadline <= now:
+                    source.first_change = None
+                    source.last_change = None
+                    self._last_fired[source.job_id] = now
+                    due_jobs.append(source.job_id)
+
+        for job_id in due_jobs:
+            try:
+                self._on_settled(job_id)
+            except Exception:
+                logger.exception("Error while dispatching changed job %s", job_id)
@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import pytest
+
+# Settings and the engine are created on import: point them at a scratch
+# SQLite file before anything imports autobackup.
+_DB_DIR = tempfile.mkdtemp(prefix="autobackup-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'autobackup.db')}"
+os.environ["CLUSTER_MODE"] = "false"
+os.environ["API_PORT"] = "0"
+# Tests renew cluster leases themselves, at the points they check.
+os.environ["CLUSTER_HEARTBEAT_SECONDS"] = "3600"
+
+import autobackup.models  # noqa: E402,F401  (registers the tables)
+from autobackup.db import Base, engine, upgrade_schema  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_schema():
+    """Every test starts with empty tables."""
+    Base.metadata.drop_all(bind=engine)
+    upgrade_schema(engine)
+    yield
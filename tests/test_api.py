@@ -0,0 +1,73 @@
+import http.client
+import json
+import socket
+
+import pytest
+
+from autobackup.api import ApiServer
+from autobackup.run_queue import RunQueue
+
+
+@pytest.fixture
+def server():
+    server = ApiServer(RunQueue(), host="127.0.0.1", port=0, token="secret")
+    server.start()
+    yield server
+    server.stop()
+
+
+def _connect(server):
+    host, port = server.server_address[:2]
+    return http.client.HTTPConnection(host, port, timeout=5)
+
+
+def _raw_request(server, request):
+    with socket.create_connection(server.server_address[:2], timeout=5) as sock:
+        sock.sendall(request)
+        chunks = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    return b"".join(chunks)
+
+
+AUTH = {"Authorization": "Bearer secret"}
+
+
+def test_refused_requests_leave_the_connection_usable(server):
+    connection = _connect(server)
+    body = json.dumps({"priority": "urgent"})
+
+    # Unauthorized, unknown endpoint, bad priority: bodies are read anyway.
+    connection.request("POST", "/jobs/1/runs", body=body)
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 401
+    connection.request("DELETE", "/nothing/here", body=body, headers=AUTH)
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 404
+    connection.request(
+        "POST", "/jobs/1/runs", body=json.dumps({"priority": "x"}), headers=AUTH
+    )
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 400
+
+    connection.request("GET", "/queue", headers=AUTH)
+    response = connection.getresponse()
+    assert response.status == 200
+    assert json.loads(response.read())["waiting"] == []
+    connection.close()
+
+
+@pytest.mark.parametrize("length", [b"ten", b"-1", b"1_0"])
+def test_malformed_content_length_is_a_bad_request(server, length):
+    response = _raw_request(
+        server,
+        b"POST /jobs/1/runs HTTP/1.1\r\nHost: x\r\nAuthorization: Bearer secret\r\n"
+        b"Content-Length: " + length + b"\r\n\r\n{}",
+    )
+
+    head = response.split(b"\r\n\r\n", 1)[0]
+    assert head.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in head
@@ -0,0 +1,23 @@
+from datetime import date, datetime
+
+from autobackup.clock import format_local, local_midnight, seconds_between
+
+
+def test_duration_across_the_fall_back_hour():
+    # Europe/Luxembourg goes back from 03:00 to 02:00 at 01:00 UTC.
+    start = datetime(2026, 10, 25, 0, 30)
+    end = datetime(2026, 10, 25, 1, 30)
+
+    assert format_local(start) == "2026-10-25 02:30:00"
+    assert format_local(end) == "2026-10-25 02:30:00"
+    assert seconds_between(start, end) == 3600.0
+
+
+def test_local_days_start_at_local_midnight():
+    assert local_midnight(date(2026, 7, 1)) == datetime(2026, 6, 30, 22, 0)
+    assert local_midnight(date(2026, 12, 1)) == datetime(2026, 11, 30, 23, 0)
+    # The DST change day lasts 25 hours.
+    day_length = seconds_between(
+        local_midnight(date(2026, 10, 25)), local_midnight(date(2026, 10, 26))
+    )
+    assert day_length == 25 * 3600
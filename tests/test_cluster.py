@@ -0,0 +1,256 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+from autobackup import scheduler as scheduler_module
+from autobackup.clock import db_now
+from autobackup.cluster import ClusterMembership
+from autobackup.db import SessionLocal
+from autobackup.events import publish_change
+from autobackup.models import BackupJob, SchedulerNode
+from autobackup.scheduler import BackupScheduler
+
+
+def _make_jobs(count):
+    db = SessionLocal()
+    try:
+        jobs = [
+            BackupJob(
+                name=f"job {i}",
+                source_path="/nonexistent/src",
+                destination_path="/nonexistent/dst",
+                schedule_type="interval",
+                interval_minutes=60,
+            )
+            for i in range(count)
+        ]
+        db.add_all(jobs)
+        db.commit()
+        return [job.id for job in jobs]
+    finally:
+        db.close()
+
+
+def _nodes(*node_ids):
+    nodes = [ClusterMembership(node_id=node_id) for node_id in node_ids]
+    # Twice, so every node has seen the leases of all the others.
+    for node in nodes:
+        node.heartbeat()
+    for node in nodes:
+        node.heartbeat()
+    return nodes
+
+
+def _owners(nodes, job_ids):
+    return {
+        job_id: [node.node_id for node in nodes if node.owns(job_id)]
+        for job_id in job_ids
+    }
+
+
+def _scheduled(sched, job_ids):
+    return {
+        job_id for job_id in job_ids if sched._scheduler.get_job(f"job_{job_id}")
+    }
+
+
+@pytest.fixture
+def start_scheduler():
+    started = []
+
+    def start(node_id):
+        sched = BackupScheduler(cluster=ClusterMembership(node_id=node_id))
+        sched.start()
+        started.append(sched)
+        return sched
+
+    yield start
+    for sched in started:
+        sched.stop()
+
+
+def test_jobs_are_split_between_nodes():
+    nodes = _nodes("a", "b", "c")
+    assert all(node.live_nodes == ["a", "b", "c"] for node in nodes)
+
+    owners = _owners(nodes, range(1, 301))
+    assert all(len(owner) == 1 for owner in owners.values())
+    counts = Counter(owner[0] for owner in owners.values())
+    assert set(counts) == {"a", "b", "c"}
+    assert min(counts.values()) > 50
+
+
+def test_only_jobs_of_an_expired_node_move():
+    a, b, c = _nodes("a", "b", "c")
+    owners = _owners([a, b, c], range(1, 301))
+    before = {job_id: owner[0] for job_id, owner in owners.items()}
+
+    # c stops renewing its lease.
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(SchedulerNode)
+            .where(SchedulerNode.node_id == "c")
+            .values(heartbeat_at=db_now() - timedelta(minutes=5))
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    assert a.heartbeat() and b.heartbeat()
+    after = _owners([a, b], before)
+    assert all(len(owner) == 1 for owner in after.values())
+    for job_id, owner in before.items():
+        if owner != "c":
+            assert after[job_id] == [owner]
+    assert {after[job_id][0] for job_id, owner in before.items() if owner == "c"} == {
+        "a",
+        "b",
+    }
+
+
+def test_each_firing_is_claimed_once():
+    nodes = _nodes("a", "b", "c")
+    slots = [datetime(2026, 1, 1, 2, 0) + timedelta(minutes=5 * i) for i in range(5)]
+    barrier = threading.Barrier(len(nodes) * 4)
+    claimed = []
+    lock = threading.Lock()
+
+    def claim(node):
+        barrier.wait()
+        for slot in slots:
+            if node.claim_firing(7, slot):
+                with lock:
+                    claimed.append(slot)
+
+    threads = [
+        threading.Thread(target=claim, args=(node,)) for node in nodes for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == slots
+
+
+def test_schedulers_partition_and_rebalance_jobs(start_scheduler):
+    job_ids = _make_jobs(30)
+    scheds = [start_scheduler(node_id) for node_id in ("a", "b", "c")]
+    # Nodes started earlier learn about the later ones on their heartbeat.
+    for sched in scheds:
+        sched._cluster_heartbeat()
+
+    scheduled = [_scheduled(sched, job_ids) for sched in scheds]
+    assert all(scheduled)
+    assert sum(len(jobs) for jobs in scheduled) == len(job_ids)
+    assert set().union(*scheduled) == set(job_ids)
+
+    # c leaves: a and b take over its jobs and keep their own.
+    scheds[2].stop()
+    for sched in scheds[:2]:
+        sched._cluster_heartbeat()
+    rebalanced = [_scheduled(sched, job_ids) for sched in scheds[:2]]
+    assert rebalanced[0] >= scheduled[0] and rebalanced[1] >= scheduled[1]
+    assert rebalanced[0].isdisjoint(rebalanced[1])
+    assert rebalanced[0] | rebalanced[1] == set(job_ids)
+
+
+def test_job_created_on_one_node_is_scheduled_by_its_owner(start_scheduler):
+    scheds = [start_scheduler(node_id) for node_id in ("a", "b")]
+    for sched in scheds:
+        sched._cluster_heartbeat()
+
+    db = SessionLocal()
+    try:
+        # Several jobs, so that some are owned by the node that did not
+        # create them.
+        job_ids = []
+        for i in range(6):
+            job = BackupJob(
+                name=f"new {i}",
+                source_path="/nonexistent/src",
+                destination_path="/nonexistent/dst",
+                schedule_type="interval",
+                interval_minutes=60,
+            )
+            db.add(job)
+            db.flush()
+            publish_change(db, "job", job.id)
+            db.commit()
+            job_ids.append(job.id)
+    finally:
+        db.close()
+
+    expected = [
+        {job_id for job_id in job_ids if sched._cluster.owns(job_id)}
+        for sched in scheds
+    ]
+    assert all(expected)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        if [_scheduled(sched, job_ids) for sched in scheds] == expected:
+            break
+        time.sleep(0.05)
+    assert [_scheduled(sched, job_ids) for sched in scheds] == expected
+
+
+def test_firing_runs_once_while_ownership_overlaps(start_scheduler, monkeypatch):
+    (job_id,) = _make_jobs(1)
+    runs = []
+
+    def fake_run(db, job, cancel=None):
+        runs.append(job.id)
+        time.sleep(0.2)
+        return SimpleNamespace(status="success", message="")
+
+    monkeypatch.setattr(scheduler_module, "run_backup_for_job", fake_run)
+
+    scheds = [start_scheduler(node_id) for node_id in ("a", "b")]
+    for sched in scheds:
+        # Neither node has noticed the other yet: both own every job.
+        sched._cluster._live_nodes = [sched._cluster.node_id]
+        sched.reload()
+        assert _scheduled(sched, [job_id]) == {job_id}
+
+    # What APScheduler calls when the job fires.
+    firings = [sched._scheduler.get_job(f"job_{job_id}") for sched in scheds]
+    threads = [
+        threading.Thread(target=firing.func, args=firing.args) for firing in firings
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert runs == [job_id]
+
+
+def test_heartbeat_runs_while_backup_threads_are_busy(start_scheduler):
+    sched = start_scheduler("a")
+    release = threading.Event()
+    for i in range(20):
+        # More blocked firings than threads in the default pool.
+        sched._scheduler.add_job(release.wait, id=f"busy_{i}")
+
+    beats = threading.Event()
+    heartbeat = sched._cluster.heartbeat
+
+    def counted_heartbeat():
+        beats.set()
+        return heartbeat()
+
+    sched._cluster.heartbeat = counted_heartbeat
+    try:
+        time.sleep(0.2)
+        sched._scheduler.get_job("maintenance_cluster_heartbeat").modify(
+            next_run_time=datetime.now().astimezone()
+        )
+        assert beats.wait(5)
+    finally:
+        release.set()
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+import pytest
+
+from autobackup.clock import db_now
+from autobackup.compaction import compact_run_history
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob, BackupRun, BackupRunDestination
+
+OLD = timedelta(days=400)
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def job_id(db):
+    job = BackupJob(name="job", source_path="/src", destination_path="/dst")
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def _add_run(db, job_id, status, output_file=None, **fields):
+    run = BackupRun(
+        job_id=job_id,
+        status=status,
+        start_time=db_now() - OLD,
+        output_file=output_file,
+        **fields,
+    )
+    db.add(run)
+    db.commit()
+    return run.id
+
+
+def _remaining(db):
+    db.expire_all()
+    return sorted(run.status for run in db.query(BackupRun))
+
+
+def test_only_finished_runs_without_archive_are_compacted(db, job_id):
+    for status in ("error", "cancelled", "success", "running", "queued"):
+        _add_run(db, job_id, status)
+
+    removed = compact_run_history(db, older_than_days=30)
+
+    assert removed == 3
+    assert _remaining(db) == ["queued", "running"]
+
+
+def test_run_is_kept_while_a_destination_copy_exists(db, job_id, tmp_path):
+    copy = tmp_path / "copy.zip"
+    copy.write_bytes(b"archive")
+    destinations = [
+        BackupRunDestination(
+            position=0,
+            destination="/gone",
+            status="success",
+            message="",
+            output_file="/gone/primary.zip",
+        ),
+        BackupRunDestination(
+            position=1,
+            destination=str(tmp_path),
+            status="success",
+            message="",
+            output_file=str(copy),
+        ),
+    ]
+    _add_run(
+        db,
+        job_id,
+        "success",
+        output_file="/gone/primary.zip",
+        destinations=destinations,
+    )
+
+    assert compact_run_history(db, older_than_days=30) == 0
+    assert _remaining(db) == ["success"]
+
+    copy.unlink()
+
+    assert compact_run_history(db, older_than_days=30) == 1
+    assert _remaining(db) == []
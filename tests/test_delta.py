@@ -0,0 +1,123 @@
+import io
+import random
+from pathlib import Path
+
+import pytest
+
+from autobackup.backup_engine import run_backup_for_job
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.delta import BlockHasher, apply_delta, write_delta
+from autobackup.models import BackupJob, BackupRun
+from autobackup.restore import extract_backup
+from autobackup.retention import RetentionSweeper
+
+BLOCK = 4096
+MIB = 1024 * 1024
+
+
+def _signature(data):
+    hasher = BlockHasher(BLOCK)
+    hasher.update(data)
+    return hasher.finish()
+
+
+def _changed(data):
+    middle = len(data) // 2
+    return data[:middle] + b"changed" + data[middle + 7 :]
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        _changed,
+        lambda data: data + random.Random(2).randbytes(3 * BLOCK + 5),
+        lambda data: data[: len(data) - 2 * BLOCK - 9],
+        lambda data: data,
+    ],
+    ids=["changed", "grown", "shrunk", "identical"],
+)
+def test_delta_round_trip(edit):
+    base = random.Random(1).randbytes(16 * BLOCK + 123)
+    new = edit(base)
+    hasher = BlockHasher(BLOCK)
+    delta = io.BytesIO()
+
+    literal = write_delta(
+        io.BytesIO(new), _signature(base), delta, hasher, max_literal=len(new)
+    )
+
+    # Only the edited bytes (and the blocks around them) are stored.
+    assert literal <= max(len(new) - len(base), 0) + 2 * BLOCK
+    if new == base:
+        # The last, partial block is never matched.
+        assert literal == len(base) % BLOCK
+    assert hasher.finish() == _signature(new)
+    rebuilt = io.BytesIO()
+    delta.seek(0)
+    assert apply_delta(delta, io.BytesIO(base), BLOCK, rebuilt) == len(new)
+    assert rebuilt.getvalue() == new
+
+
+@pytest.fixture
+def delta_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "delta_min_file_mb", 1)
+    monkeypatch.setattr(settings, "delta_block_kb", 64)
+    source = tmp_path / "src"
+    source.mkdir()
+    (source / "small.txt").write_text("not a delta")
+    db = SessionLocal()
+    job = BackupJob(
+        name="delta",
+        source_path=str(source),
+        destination_path=str(tmp_path / "dst"),
+    )
+    db.add(job)
+    db.commit()
+    yield db, job, source / "large.bin"
+    db.close()
+
+
+def _back_up(db, job, large, data):
+    large.write_bytes(data)
+    run = run_backup_for_job(db, job)
+    assert run.status == "success", run.message
+    return run
+
+
+def _chain(db, job, large):
+    data = random.Random(3).randbytes(3 * MIB)
+    versions = [data, _changed(data), _changed(data) + b"appended"]
+    runs = [_back_up(db, job, large, version) for version in versions]
+    return runs, versions
+
+
+def test_depth_two_chain_is_restored(delta_job, tmp_path):
+    db, job, large = delta_job
+    runs, versions = _chain(db, job, large)
+
+    assert [run.delta_depth for run in runs] == [0, 1, 2]
+    assert runs[2].delta_base_run_id == runs[1].id
+    assert runs[1].delta_base_run_id == runs[0].id
+    assert runs[2].delta_bytes_saved > 2 * MIB
+
+    result = extract_backup(Path(runs[2].output_file), tmp_path / "restored")
+
+    assert result.delta_files == 1
+    assert (tmp_path / "restored" / "large.bin").read_bytes() == versions[2]
+    assert (tmp_path / "restored" / "small.txt").read_text() == "not a delta"
+
+
+def test_retention_keeps_the_bases_of_a_chain(delta_job, tmp_path, monkeypatch):
+    db, job, large = delta_job
+    runs, versions = _chain(db, job, large)
+    monkeypatch.setattr(settings, "max_backups_per_job", 1)
+
+    result = RetentionSweeper(bytes_per_second=0).sweep()
+
+    assert result.runs_deleted == 0
+    db.expire_all()
+    assert db.query(BackupRun).count() == 3
+    assert all(Path(run.output_file).exists() for run in runs)
+    extract_backup(Path(runs[2].output_file), tmp_path / "restored")
+    assert (tmp_path / "restored" / "large.bin").read_bytes() == versions[2]
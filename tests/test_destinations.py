@@ -0,0 +1,41 @@
+from autobackup.db import SessionLocal
+from autobackup.destinations import DestinationLister
+from autobackup.models import BackupJob, BackupRun
+
+
+def test_archives_are_matched_to_finished_and_running_runs(tmp_path):
+    finished = tmp_path / "job_1_20260101_000000_1.zip"
+    partial = tmp_path / "job_1_20260102_000000_2.zip"
+    stray = tmp_path / "copied_by_hand.zip"
+    for path in (finished, partial, stray):
+        path.write_bytes(b"archive")
+    db = SessionLocal()
+    try:
+        job = BackupJob(name="job", source_path="/src", destination_path=str(tmp_path))
+        db.add(job)
+        db.flush()
+        db.add_all(
+            [
+                BackupRun(
+                    job_id=job.id,
+                    status="success",
+                    output_file=str(finished),
+                    checkpoint_file=str(finished),
+                ),
+                BackupRun(
+                    job_id=job.id, status="running", checkpoint_file=str(partial)
+                ),
+            ]
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    lister = DestinationLister(str(tmp_path))
+    entries = {entry.name: entry for entry in lister.next_page()}
+
+    assert lister.done
+    assert entries[finished.name].status == "success"
+    assert entries[partial.name].status == "running"
+    assert not entries[finished.name].orphan and not entries[partial.name].orphan
+    assert entries[stray.name].orphan
@@ -0,0 +1,127 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from itertools import pairwise
+
+import pytest
+from sqlalchemy import update
+
+from autobackup.db import SessionLocal, engine
+from autobackup.events import SQLiteChangePoller, publish_change, subscribe
+from autobackup.models import BackupJob, ChangeVersion
+
+
+@pytest.fixture
+def received():
+    changes = []
+    unsubscribe = subscribe(changes.append)
+    yield changes
+    unsubscribe()
+
+
+@pytest.fixture
+def poller():
+    # Polled by hand: its thread only wakes up when stopped.
+    poller = SQLiteChangePoller(engine, interval=3600)
+    poller.start()
+    yield poller
+    poller.stop()
+
+
+def _save_job(name, rollback=False):
+    db = SessionLocal()
+    try:
+        job = BackupJob(name=name, source_path="/src", destination_path="/dst")
+        db.add(job)
+        db.flush()
+        publish_change(db, "job", job.id)
+        if rollback:
+            db.rollback()
+        else:
+            db.commit()
+    finally:
+        db.close()
+
+
+def test_bulk_import_from_another_process_is_delivered(tmp_path, received, poller):
+    jobs_file = tmp_path / "jobs.json"
+    jobs_file.write_text(
+        json.dumps(
+            [
+                {
+                    "name": "imported",
+                    "source_path": "/src",
+                    "destination_path": "/dst",
+                    "schedule_type": "manual",
+                }
+            ]
+        )
+    )
+    src = os.path.join(os.path.dirname(__file__), os.pardir, "src")
+    subprocess.run(
+        [sys.executable, "-m", "autobackup.bulk_jobs", "import", str(jobs_file)],
+        env={**os.environ, "PYTHONPATH": os.path.abspath(src)},
+        check=True,
+        capture_output=True,
+    )
+    assert received == []
+
+    poller.poll()
+
+    assert [(c.kind, c.job_id) for c in received] == [("jobs", 0)]
+
+
+def test_own_changes_are_not_delivered_twice(received, poller):
+    _save_job("local")
+    _save_job("rolled back", rollback=True)
+    assert [c.kind for c in received] == ["job"]
+
+    poller.poll()
+
+    assert [c.kind for c in received] == ["job"]
+
+
+def test_foreign_bump_between_own_changes_is_delivered(received, poller):
+    _save_job("first")
+    poller.poll()
+    db = SessionLocal()
+    try:
+        # What another process's publish_change does.
+        db.execute(update(ChangeVersion).values(version=ChangeVersion.version + 1))
+        db.commit()
+    finally:
+        db.close()
+    _save_job("second")
+    received.clear()
+
+    poller.poll()
+
+    assert [(c.kind, c.job_id) for c in received] == [("jobs", 0)]
+
+
+def test_idle_poller_backs_off_and_speeds_up_after_a_change(monkeypatch):
+    reads = []
+    poller = SQLiteChangePoller(engine, interval=0.05, max_interval=0.4)
+    read_version = poller._read_version
+
+    def timed_read():
+        reads.append(time.monotonic())
+        return read_version()
+
+    monkeypatch.setattr(poller, "_read_version", timed_read)
+    poller.start()
+    try:
+        time.sleep(1.5)
+        _save_job("wakes the poller up")
+        time.sleep(0.5)
+    finally:
+        poller.stop()
+
+    # The first read is the one start() makes.
+    delays = [later - earlier for earlier, later in pairwise(reads[1:])]
+    # 0.05, 0.1, 0.2, 0.4, 0.4... then back to 0.05 after the change.
+    assert max(delays) < 0.6
+    assert len(reads) < 20
+    assert min(delays[-3:]) < 0.15
@@ -0,0 +1,161 @@
+import random
+import time
+import zipfile
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+
+from autobackup import backup_engine, recovery
+from autobackup import checkpoint as checkpoint_module
+from autobackup.backup_engine import resume_backup_run, run_backup_for_job
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.models import BackupDailyStat, BackupJob, BackupRun
+from autobackup.progress import ProgressRecorder
+from autobackup.recovery import INTERRUPTED_MESSAGE, reconcile_interrupted_runs
+from autobackup.restore import extract_backup
+
+GRACE = timedelta(seconds=1.5)
+
+
+@pytest.fixture
+def running_run():
+    """A run started an hour ago that has not reported any progress."""
+    db = SessionLocal()
+    try:
+        job = BackupJob(name="slow", source_path="/src", destination_path="/dst")
+        db.add(job)
+        db.flush()
+        run = BackupRun(
+            job_id=job.id, status="running", start_time=db_now() - timedelta(hours=1)
+        )
+        db.add(run)
+        db.commit()
+        return run.id, job.id
+    finally:
+        db.close()
+
+
+def _reconcile():
+    db = SessionLocal()
+    try:
+        reconcile_interrupted_runs(db, db_now() - GRACE)
+    finally:
+        db.close()
+
+
+def _status(run_id):
+    db = SessionLocal()
+    try:
+        run = db.get(BackupRun, run_id)
+        return run.status, run.message
+    finally:
+        db.close()
+
+
+def test_slow_run_without_progress_is_kept_alive_by_its_heartbeat(running_run):
+    run_id, job_id = running_run
+    # Collecting files, verifying the archive...: no progress events at all.
+    recorder = ProgressRecorder(run_id, job_id, interval=0.5)
+    recorder.start()
+    try:
+        time.sleep(2 * GRACE.total_seconds())
+        _reconcile()
+    finally:
+        recorder.stop()
+
+    assert _status(run_id) == ("running", None)
+
+
+def test_run_without_heartbeat_is_taken_over(running_run):
+    run_id, _job_id = running_run
+
+    _reconcile()
+
+    status, message = _status(run_id)
+    assert status == "error"
+    assert message.startswith(INTERRUPTED_MESSAGE)
+
+
+def test_run_is_taken_over_once(running_run, monkeypatch):
+    run_id, _job_id = running_run
+    cutoff = db_now() - GRACE
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        # Both processes find the run interrupted before either settles it.
+        found = recovery.find_interrupted_runs(second, cutoff)
+        reconcile_interrupted_runs(first, cutoff)
+        monkeypatch.setattr(recovery, "find_interrupted_runs", lambda *_a: found)
+        reconcile_interrupted_runs(second, cutoff)
+    finally:
+        first.close()
+        second.close()
+
+    db = SessionLocal()
+    try:
+        assert db.get(BackupRun, run_id).status == "error"
+        assert db.query(BackupDailyStat.total_runs).scalar() == 1
+    finally:
+        db.close()
+
+
+class Crash(BaseException):
+    """Stops a backup the way a killed process would: nothing cleans up."""
+
+
+def test_run_interrupted_after_a_sealed_segment_is_resumed(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "checkpoint_segment_mb", 1)
+    source = tmp_path / "src"
+    source.mkdir()
+    rng = random.Random(4)
+    for number in range(6):
+        (source / f"part{number}.bin").write_bytes(rng.randbytes(512 * 1024))
+
+    def crash_after_the_first_seal(recorder, event):
+        if event.files_done >= 4:
+            raise Crash()
+
+    db = SessionLocal()
+    try:
+        job = BackupJob(
+            name="resumed",
+            source_path=str(source),
+            destination_path=str(tmp_path / "dst"),
+        )
+        db.add(job)
+        db.commit()
+        with monkeypatch.context() as patch:
+            patch.setattr(ProgressRecorder, "__call__", crash_after_the_first_seal)
+            with pytest.raises(Crash):
+                run_backup_for_job(db, job)
+        run_id = db.query(BackupRun.id).scalar()
+        db.expire_all()
+        run = db.get(BackupRun, run_id)
+        assert run.status == "running"
+        assert (run.checkpoint_segment, run.checkpoint_files_done) == (1, 2)
+
+        restored = []
+
+        def restore_archive(archive, checkpoint):
+            restored.append(checkpoint_module.restore_archive(archive, checkpoint))
+            return restored[-1]
+
+        monkeypatch.setattr(backup_engine, "restore_archive", restore_archive)
+        assert reconcile_interrupted_runs(db, db_now() + GRACE) == [run_id]
+        run = resume_backup_run(db, db.get(BackupRun, run_id))
+        # Continued from the sealed segment, not started over.
+        assert restored == [True]
+        assert run.status == "success", run.message
+        assert run.resume_count == 1
+        archive = Path(run.output_file)
+    finally:
+        db.close()
+
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == sorted(p.name for p in source.iterdir())
+    extract_backup(archive, tmp_path / "restored")
+    for path in source.iterdir():
+        assert (tmp_path / "restored" / path.name).read_bytes() == path.read_bytes()
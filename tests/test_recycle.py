@@ -0,0 +1,82 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from autobackup import backup_engine
+from autobackup.backup_engine import run_backup_for_job
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob
+from autobackup.recycle import raw_write_supported
+from autobackup.restore import extract_backup
+
+
+@pytest.fixture
+def recycle_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "recycle_unchanged", True)
+    source = tmp_path / "src"
+    (source / "sub").mkdir(parents=True)
+    (source / "same.txt").write_text("unchanged " * 1000)
+    (source / "sub" / "same.bin").write_bytes(bytes(range(256)) * 512)
+    (source / "edited.txt").write_text("first version")
+    db = SessionLocal()
+    job = BackupJob(
+        name="recycle",
+        source_path=str(source),
+        destination_path=str(tmp_path / "dst"),
+    )
+    db.add(job)
+    db.commit()
+    yield db, job, source
+    db.close()
+
+
+def _back_up_twice(db, job, source):
+    first = run_backup_for_job(db, job)
+    assert first.status == "success", first.message
+    (source / "edited.txt").write_text("second version, longer")
+    second = run_backup_for_job(db, job)
+    assert second.status == "success", second.message
+    return second
+
+
+def _check_archive(archive, source, target):
+    with zipfile.ZipFile(archive) as zf:
+        assert zf.testzip() is None
+    extract_backup(archive, target)
+    for path in source.rglob("*"):
+        if path.is_file():
+            restored = target / path.relative_to(source)
+            assert restored.read_bytes() == path.read_bytes()
+
+
+def test_unchanged_entries_are_copied_into_the_new_archive(recycle_job, tmp_path):
+    db, job, source = recycle_job
+
+    run = _back_up_twice(db, job, source)
+
+    unchanged = (source / "same.txt").stat().st_size
+    unchanged += (source / "sub" / "same.bin").stat().st_size
+    assert run.recycled_bytes == unchanged
+    _check_archive(Path(run.output_file), source, tmp_path / "restored")
+
+
+def test_files_are_compressed_again_without_raw_writes(
+    recycle_job, tmp_path, monkeypatch
+):
+    db, job, source = recycle_job
+    monkeypatch.setattr(backup_engine, "raw_write_supported", lambda zf: False)
+
+    run = _back_up_twice(db, job, source)
+
+    assert run.recycled_bytes == 0
+    _check_archive(Path(run.output_file), source, tmp_path / "restored")
+
+
+def test_raw_writes_need_the_private_zipfile_members(tmp_path):
+    with zipfile.ZipFile(tmp_path / "a.zip", "w") as zf:
+        assert raw_write_supported(zf)
+        del zf._didModify
+        assert not raw_write_supported(zf)
+        zf._didModify = True
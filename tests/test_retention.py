@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from autobackup.checkpoint import directory_copy_path
+from autobackup.clock import db_now
+from autobackup.config import settings
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob, BackupRun
+from autobackup.retention import RetentionSweeper, plan_expired_runs
+
+
+@pytest.fixture
+def db():
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def job_id(db, tmp_path):
+    job = BackupJob(name="job", source_path="/src", destination_path=str(tmp_path))
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def _sweep():
+    return RetentionSweeper(bytes_per_second=0).sweep()
+
+
+def _run_ids(db):
+    db.expire_all()
+    return sorted(run.id for run in db.query(BackupRun))
+
+
+def test_resumed_run_with_a_recent_heartbeat_is_not_stale(db, job_id, tmp_path):
+    archive = tmp_path / "partial.zip"
+    archive.write_bytes(b"partial")
+    run = BackupRun(
+        job_id=job_id,
+        status="running",
+        start_time=db_now() - timedelta(days=5),
+        progress_updated_at=db_now(),
+        checkpoint_file=str(archive),
+    )
+    db.add(run)
+    db.commit()
+
+    assert _sweep().runs_deleted == 0
+    assert _run_ids(db) == [run.id]
+    assert archive.exists()
+
+
+def test_stuck_run_is_deleted_with_its_partial_archive(db, job_id, tmp_path):
+    archive = tmp_path / "partial.zip"
+    archive.write_bytes(b"partial")
+    copy = directory_copy_path(archive, 2)
+    copy.write_bytes(b"directory")
+    stale = db_now() - timedelta(days=5)
+    db.add(
+        BackupRun(
+            job_id=job_id,
+            status="running",
+            start_time=stale,
+            progress_updated_at=stale,
+            checkpoint_file=str(archive),
+            checkpoint_segment=2,
+        )
+    )
+    db.commit()
+
+    result = _sweep()
+
+    assert (result.runs_deleted, result.files_deleted) == (1, 2)
+    assert _run_ids(db) == []
+    assert not archive.exists() and not copy.exists()
+
+
+def _add_job(db, **keep):
+    job = BackupJob(name="gfs", source_path="/src", destination_path="/dst", **keep)
+    db.add(job)
+    db.flush()
+    return job
+
+
+def _add_successes(db, job, start_times):
+    runs = [
+        BackupRun(job_id=job.id, status="success", start_time=start)
+        for start in start_times
+    ]
+    db.add_all(runs)
+    db.commit()
+    return {run.id: run.start_time for run in runs}
+
+
+def _kept(db, runs):
+    """Start times of ``runs`` that a sweep over all jobs keeps."""
+    job_ids = [job.id for job in db.query(BackupJob)]
+    expired = {row.id for row in plan_expired_runs(db, job_ids)}
+    return sorted(start for run_id, start in runs.items() if run_id not in expired)
+
+
+def test_gfs_keeps_the_newest_run_of_each_recent_day_week_and_month(db):
+    job = _add_job(db, keep_daily=2, keep_weekly=2, keep_monthly=2)
+    # Two runs a day, 6:00 and 18:00, from Thursday 1 January to Tuesday
+    # 31 March 2026.
+    first = datetime(2026, 1, 1, 6, 0)
+    times = [first + timedelta(hours=12 * i) for i in range(180)]
+    runs = _add_successes(db, job, times)
+
+    assert _kept(db, runs) == [
+        # Monthly: February (March is 31 March).
+        datetime(2026, 2, 28, 18, 0),
+        # Weekly: Sunday, the end of the week of Monday 23 March (the week
+        # of Monday 30 March is 31 March).
+        datetime(2026, 3, 29, 18, 0),
+        # Daily: the last two days; 31 March is also the newest run overall.
+        datetime(2026, 3, 30, 18, 0),
+        datetime(2026, 3, 31, 18, 0),
+    ]
+
+
+def test_jobs_without_gfs_policy_keep_max_backups_per_job(db, monkeypatch):
+    monkeypatch.setattr(settings, "max_backups_per_job", 3)
+    plain = _add_job(db)
+    gfs = _add_job(db, keep_daily=1)
+    start = datetime(2026, 3, 1, 12, 0)
+    days = [start + timedelta(days=i) for i in range(5)]
+    plain_runs = _add_successes(db, plain, days)
+    gfs_runs = _add_successes(db, gfs, days)
+
+    assert _kept(db, plain_runs) == days[2:]
+    assert _kept(db, gfs_runs) == days[4:]
@@ -0,0 +1,64 @@
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from autobackup.backup_engine import run_backup_for_job
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob
+from autobackup.restore import extract_backup
+from autobackup.sparse import SPARSE_EXTRA_ID, decode_extra, find_extra_field
+
+MIB = 1024 * 1024
+
+
+def _write_sparse(path):
+    """A 32 MiB file with two 64 KiB data regions; the rest is holes."""
+    with open(path, "wb") as fh:
+        fh.write(b"head" * (16 * 1024))
+        fh.seek(20 * MIB)
+        fh.write(b"tail" * (16 * 1024))
+        fh.truncate(32 * MIB)
+    st = path.stat()
+    if st.st_blocks * 512 >= st.st_size:
+        pytest.skip("the file system does not keep holes")
+    return st
+
+
+def test_holes_are_skipped_and_restored_as_holes(tmp_path):
+    source = tmp_path / "src"
+    source.mkdir()
+    original = source / "disk.img"
+    st = _write_sparse(original)
+    db = SessionLocal()
+    try:
+        job = BackupJob(
+            name="sparse",
+            source_path=str(source),
+            destination_path=str(tmp_path / "dst"),
+        )
+        db.add(job)
+        db.commit()
+        run = run_backup_for_job(db, job)
+        assert run.status == "success", run.message
+        archive = Path(run.output_file)
+        skipped = run.sparse_bytes_skipped
+    finally:
+        db.close()
+
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo("disk.img")
+    assert find_extra_field(info.extra, SPARSE_EXTRA_ID) is not None
+    size, extents = decode_extra(info.extra)
+    assert size == st.st_size
+    assert sum(length for _, length in extents) == info.file_size
+    assert skipped == st.st_size - info.file_size > 30 * MIB
+
+    result = extract_backup(archive, tmp_path / "restored")
+
+    restored = tmp_path / "restored" / "disk.img"
+    assert result.sparse_files == 1
+    assert restored.read_bytes() == original.read_bytes()
+    # Only the data regions are allocated (give or take file system rounding).
+    assert os.stat(restored).st_blocks * 512 <= st.st_blocks * 512 + 2 * MIB
@@ -0,0 +1,199 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from autobackup import storage
+from autobackup.db import SessionLocal
+from autobackup.models import BackupJob, BackupRun
+from autobackup.retention import RetentionSweeper
+from autobackup.storage import S3_MIN_PART_SIZE, S3Backend, backend_for
+
+MIB = 1024 * 1024
+
+
+class FakeS3Client:
+    """The boto3 S3 calls used by storage.py, kept in memory.
+
+    ``fail_parts`` maps a part number to how many of its uploads fail.
+    """
+
+    def __init__(self, fail_parts=None):
+        self.fail_parts = dict(fail_parts or {})
+        self.objects = {}
+        self.uploads = {}
+        self.part_attempts = []
+        self.completed = []
+        self.aborted = []
+        self.deleted = []
+        self._lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def create_multipart_upload(self, Bucket, Key):
+        with self._lock:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self.part_attempts.append(PartNumber)
+            if self.fail_parts.get(PartNumber, 0) > 0:
+                self.fail_parts[PartNumber] -= 1
+                raise ConnectionError(f"part {PartNumber} dropped")
+            self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(parts)
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+        self.completed.append((Key, numbers))
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+        self.aborted.append(Key)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+        self.deleted.append(Key)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(storage.time, "sleep", lambda _seconds: None)
+
+
+def _upload(backend, location, data, chunk=MIB):
+    """Write ``data`` the way the backup engine does, aborting on failure."""
+    writer = backend.open_writer(location)
+    try:
+        for start in range(0, len(data), chunk):
+            writer.write(data[start : start + chunk])
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def _payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+def test_archive_is_split_at_part_size():
+    client = FakeS3Client()
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE, concurrency=2)
+    data = _payload(2 * S3_MIN_PART_SIZE + 123)
+
+    assert _upload(backend, "s3://bucket/job_1.zip", data) == len(data)
+
+    assert client.completed == [("job_1.zip", [1, 2, 3])]
+    assert client.objects[("bucket", "job_1.zip")] == data
+    assert not client.aborted
+
+
+def test_failed_part_is_retried_on_its_own():
+    client = FakeS3Client(fail_parts={2: 1})
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE, retries=2)
+    data = _payload(3 * S3_MIN_PART_SIZE)
+
+    _upload(backend, "s3://bucket/job_1.zip", data)
+
+    assert sorted(client.part_attempts) == [1, 2, 2, 3]
+    assert client.objects[("bucket", "job_1.zip")] == data
+
+
+def test_upload_is_aborted_when_a_part_keeps_failing():
+    client = FakeS3Client(fail_parts={1: 10})
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE, retries=2)
+
+    with pytest.raises(ConnectionError):
+        _upload(backend, "s3://bucket/job_1.zip", _payload(2 * S3_MIN_PART_SIZE))
+
+    assert client.part_attempts.count(1) == 3
+    assert client.aborted == ["job_1.zip"]
+    assert not client.completed
+    assert not client.uploads
+    assert ("bucket", "job_1.zip") not in client.objects
+
+
+def test_small_archive_is_sent_with_one_put():
+    client = FakeS3Client()
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE)
+
+    _upload(backend, "s3://bucket/prefix/job_1.zip", b"small archive")
+
+    assert client.objects == {("bucket", "prefix/job_1.zip"): b"small archive"}
+    assert not client.uploads and not client.completed
+
+
+def test_part_size_grows_with_the_part_count(monkeypatch):
+    monkeypatch.setattr(storage, "S3_PART_GROWTH_EVERY", 2)
+    client = FakeS3Client()
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE)
+    data = _payload(9 * S3_MIN_PART_SIZE)
+
+    _upload(backend, "s3://bucket/job_1.zip", data)
+
+    # 2 parts of 5 MiB, then 10 MiB parts.
+    assert client.completed == [("job_1.zip", [1, 2, 3, 4, 5])]
+    assert client.objects[("bucket", "job_1.zip")] == data
+
+
+def test_upload_past_the_part_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(storage, "S3_MAX_PARTS", 3)
+    client = FakeS3Client()
+    backend = S3Backend(client=client, part_size=S3_MIN_PART_SIZE)
+
+    with pytest.raises(RuntimeError, match="exceeds the 3 parts"):
+        _upload(backend, "s3://bucket/job_1.zip", _payload(4 * S3_MIN_PART_SIZE))
+
+    # Parts still queued when the upload is aborted are never sent.
+    assert max(client.part_attempts) <= 3
+    assert client.aborted == ["job_1.zip"]
+
+
+def test_retention_deletes_expired_objects_through_the_backend(monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr(storage, "_s3_backend", S3Backend(client=client))
+    assert backend_for("s3://bucket/prefix").client is client
+
+    now = datetime(2026, 1, 10, 12, 0)
+    db = SessionLocal()
+    try:
+        job = BackupJob(
+            name="to s3",
+            source_path="/nonexistent/src",
+            destination_path="s3://bucket/prefix",
+            keep_daily=1,
+        )
+        db.add(job)
+        db.flush()
+        for days_ago in range(3):
+            key = f"prefix/job_{job.id}_{days_ago}.zip"
+            client.objects[("bucket", key)] = b"archive"
+            db.add(
+                BackupRun(
+                    job_id=job.id,
+                    status="success",
+                    start_time=now - timedelta(days=days_ago),
+                    output_file=f"s3://bucket/{key}",
+                    size_bytes=7,
+                )
+            )
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+
+    result = RetentionSweeper(bytes_per_second=0).sweep()
+
+    assert (result.runs_deleted, result.files_deleted) == (2, 2)
+    assert sorted(client.deleted) == [
+        f"prefix/job_{job_id}_1.zip",
+        f"prefix/job_{job_id}_2.zip",
+    ]
+    assert list(client.objects) == [("bucket", f"prefix/job_{job_id}_0.zip")]